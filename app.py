@@ -1,53 +1,595 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Depends, status
-from pydantic import BaseModel
-from typing import Optional, List
-import pyodbc
-from datetime import datetime,date
+from fastapi import (
+    FastAPI, HTTPException, Depends, Header, Path, Query, Request, Response, Security, WebSocket,
+    WebSocketDisconnect, status
+)
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm, SecurityScopes
+from pydantic import BaseModel, Field
+from typing import Literal, Optional, List
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta
+import asyncio
 import os
-from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Depends, status
-from pydantic import BaseModel
+import threading
+import time
+import numpy as np
 import pyodbc
-from auth import create_access_token, Token,require_role
-from datetime import timedelta
-from auth import create_access_token, Token, verify_token, TokenData
-from fastapi import Security
-from auth import verify_token, TokenData
-from fastapi.security import OAuth2PasswordRequestForm
+from dotenv import load_dotenv
+from auth import (
+    ACCESS_TOKEN_EXPIRE_DELTA, ROLE_SCOPES, Token, TokenData, create_access_token,
+    oauth2_scheme, require_role, revoke_token, token_cache_stats, verify_token
+)
+from db_pool import ConnectionPool, PoolTimeout
+from db_executor import DatabaseExecutor, ExecutorOverloaded
+from geo_index import DriverIndex
+from location_ingest import LocationIngestor, IngestBufferFull
+from location_archive import LocationMaintenance
+from ride_stats import RideStatsBackfill
+from surge import SurgeEngine
+from fares import estimate_fares, load_pricing
+from cache import ReadThroughCache, RedisCache, TTLCache
+from events import EventHub, RedisBroker
+from dispatch import Dispatcher
+from batch_matcher import BatchMatcher
+from routing import RoadGraph, RoutingEngine, straight_line_eta
+from pooling import PoolPlanner
+from trip_trace import TRACE_FORMAT, TraceRecorder
+from passwords import HasherOverloaded, PasswordHasher
+from documents import DocumentProcessor, DocumentRejected, DocumentStore, DocumentTooLarge, UploadsOverloaded
+from rate_limit import TokenBucketLimiter
+from pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, fetch_page, keyset_query, stream_csv, stream_ndjson
+)
+from bulk import ImportReport, import_format, read_chunks, validate_chunk
+from metrics import Metrics, MetricsMiddleware, configure_tracing
+from rows import ORJSONResponse, RowMapper
+from idempotency import MAX_KEY_LENGTH, IdempotencyKeyReused, IdempotencyStore
+from statements import (
+    BIT, DATE, DATETIME, FLOAT, INT, PreparedConnection, decimal, nvarchar, procedure, query, varchar,
+    registry as statement_registry
+)
 
 
 # Load environment variables
 load_dotenv()
 
+# Request/statement metrics on /metrics; TRACING_EXPORTER=noop|console adds OpenTelemetry spans
+metrics = Metrics(tracer=configure_tracing(os.getenv("TRACING_EXPORTER", "none")))
+
+# Database configuration; hot statements are prepared once per pooled connection
+def _connect():
+    return PreparedConnection(metrics.instrument(pyodbc.connect(
+        f"Driver={{{os.getenv('DB_DRIVER')}}};"
+        f"Server={os.getenv('DB_SERVER')};"
+        f"Database={os.getenv('DB_NAME')};"
+        f"UID={os.getenv('DB_USER')};"
+        f"PWD={os.getenv('DB_PASSWORD')};",
+        autocommit=True
+    )))
+
+pool = ConnectionPool(
+    _connect,
+    min_size=int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+    max_size=int(os.getenv("DB_POOL_MAX_SIZE", 20)),
+    acquire_timeout=float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 5)),
+    max_idle=float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", 1800)),
+    health_check_after=float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", 30)),
+    on_acquire=metrics.observe_acquire,
+)
+
+# Blocking pyodbc calls run here, never on the event loop
+db = DatabaseExecutor(
+    pool,
+    max_workers=int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_MAX_SIZE", 20))),
+    max_pending=int(os.getenv("DB_EXECUTOR_MAX_PENDING", 500)),
+)
+metrics.gauge("db_pool_connections", "Pooled connections by state",
+              lambda: {(k,): v for k, v in pool.stats().items() if k in ("idle", "in_use", "waiting")}, ("state",))
+metrics.gauge("db_executor_pending", "Database calls queued or running", lambda: db.stats()["pending"])
+metrics.gauge("db_prepared_executions", "Prepared statement executions",
+              lambda: statement_registry.stats()["executions"])
+metrics.gauge("db_prepared_prepares", "Prepared statement executions that had to prepare first",
+              lambda: statement_registry.stats()["prepares"])
+
+# Latest position of every driver, used for ride matching
+driver_index = DriverIndex(cell_km=float(os.getenv("GEO_INDEX_CELL_KM", 1)))
+MATCH_RADIUS_KM = float(os.getenv("MATCH_RADIUS_KM", 5))
+MATCH_MAX_DRIVERS = int(os.getenv("MATCH_MAX_DRIVERS", 10))
+QUOTE_MAX_PAIRS = int(os.getenv("QUOTE_MAX_PAIRS", 5000))
+
+# Road-network ETAs from a prebuilt graph (python routing.py build ...); without
+# ROUTING_GRAPH_DIR, distances stay straight-line and drivers are ranked by them
+ROUTING_GRAPH_DIR = os.getenv("ROUTING_GRAPH_DIR")
+ROUTING_MATCH_CANDIDATES = int(os.getenv("ROUTING_MATCH_CANDIDATES", 30))
+routing_engine = RoutingEngine(
+    RoadGraph.load(ROUTING_GRAPH_DIR),
+    snap_radius_km=float(os.getenv("ROUTING_SNAP_RADIUS_KM", 1)),
+    access_speed_kmh=float(os.getenv("ROUTING_ACCESS_SPEED_KMH", 15)),
+    cache_cell_m=float(os.getenv("ROUTING_CACHE_CELL_M", 200)),
+    cache_entries=int(os.getenv("ROUTING_CACHE_ENTRIES", 200000)),
+    cache_ttl=float(os.getenv("ROUTING_CACHE_TTL_SECONDS", 3600)),
+) if ROUTING_GRAPH_DIR else None
+
+# Active-ride demand per zone, maintained by the ride lifecycle endpoints
+surge_engine = SurgeEngine(
+    cell_km=float(os.getenv("SURGE_CELL_KM", 1)),
+    radius_km=float(os.getenv("SURGE_RADIUS_KM", 5)),
+    supply_fn=driver_index.count_available,
+)
+
+# Read-through cache for the polled lookups; writers below invalidate precisely
+def _cache_backend():
+    if os.getenv("CACHE_BACKEND", "memory") == "redis":
+        return RedisCache(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+    return TTLCache(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 10000)))
+
+lookup_cache = ReadThroughCache(
+    _cache_backend(),
+    ttl=float(os.getenv("CACHE_TTL_SECONDS", 30)),
+    ttls={"user": float(os.getenv("CACHE_USER_TTL_SECONDS", 300))},
+    offload=db.submit,
+)
+
+# Responses of retried writes (Idempotency-Key), shared across workers with the redis backend
+def _idempotency_backend():
+    if os.getenv("CACHE_BACKEND", "memory") == "redis":
+        return RedisCache(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+    return TTLCache(max_entries=int(os.getenv("IDEMPOTENCY_MAX_KEYS", 100000)))
+
+idempotency_store = IdempotencyStore(
+    _idempotency_backend(),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400)),
+    offload=db.submit,
+)
+
+# Push channel for ride/driver updates ("ride:{id}", "driver:{id}" topics)
+def _event_broker():
+    if os.getenv("EVENT_BROKER", "memory") == "redis":
+        return RedisBroker(os.getenv("EVENT_REDIS_URL", "redis://localhost:6379/0"))
+    return None
+
+event_hub = EventHub(_event_broker(), max_queue=int(os.getenv("EVENT_QUEUE_SIZE", 100)))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", 15))
+
+# bcrypt runs in worker processes; login attempts are rate limited per IP and per account
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", 0)) or None,
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64)),
+    rounds=int(os.getenv("PASSWORD_BCRYPT_ROUNDS", 12)),
+)
+# Driver document files: streamed into a content-addressed store, validated and
+# thumbnailed in worker processes; uploads beyond the limits get 503
+document_store = DocumentStore(
+    os.getenv("DOCUMENT_STORE_DIR", "document_store"),
+    max_bytes=int(os.getenv("DOCUMENT_MAX_BYTES", 10 * 1024 * 1024)),
+    max_uploads=int(os.getenv("DOCUMENT_MAX_UPLOADS", 64)),
+)
+document_processor = DocumentProcessor(
+    document_store,
+    workers=int(os.getenv("DOCUMENT_WORKERS", 0)) or None,
+    max_pending=int(os.getenv("DOCUMENT_MAX_PENDING", 32)),
+    min_side=int(os.getenv("DOCUMENT_MIN_SIDE_PX", 600)),
+    max_side=int(os.getenv("DOCUMENT_MAX_SIDE_PX", 2048)),
+    thumb_side=int(os.getenv("DOCUMENT_THUMB_SIDE_PX", 320)),
+)
+DOCUMENT_URL_PREFIX = os.getenv("DOCUMENT_URL_PREFIX", "/documents")
+DOCUMENT_FILE_FIELDS = ("front", "back")
+
+login_ip_limiter = TokenBucketLimiter(
+    rate=float(os.getenv("LOGIN_IP_RATE", 1)),
+    burst=int(os.getenv("LOGIN_IP_BURST", 20)),
+)
+login_account_limiter = TokenBucketLimiter(
+    rate=float(os.getenv("LOGIN_ACCOUNT_RATE", 0.1)),
+    burst=int(os.getenv("LOGIN_ACCOUNT_BURST", 5)),
+)
+
+# driver_id -> ride_ids of accepted rides (several on a pool route), so
+# location pings reach every rider; values are replaced, never mutated
+active_rides_by_driver = {}
+_active_rides_lock = threading.Lock()
+
+def _track_ride(driver_id, ride_id):
+    with _active_rides_lock:
+        active_rides_by_driver[driver_id] = active_rides_by_driver.get(driver_id, ()) + (ride_id,)
+
+def _untrack_ride(driver_id, ride_id):
+    with _active_rides_lock:
+        remaining = tuple(r for r in active_rides_by_driver.get(driver_id, ()) if r != ride_id)
+        if remaining:
+            active_rides_by_driver[driver_id] = remaining
+        else:
+            active_rides_by_driver.pop(driver_id, None)
+
+# Driver path for each accepted ride, stored when the ride completes
+trace_recorder = TraceRecorder(max_points=int(os.getenv("TRACE_MAX_POINTS", 20000)))
+
+# Offer rounds and accept arbitration for new rides
+def _on_offer(ride_id, driver_ids, round_number):
+    for driver_id in driver_ids:
+        event_hub.publish_threadsafe(f"driver:{driver_id}", "ride.offer", ride_id=ride_id, round=round_number)
+
+def _on_dispatch_exhausted(ride_id):
+    if BATCH_MATCHING:
+        # The assigned driver let the offer lapse; try again next tick
+        batch_matcher.requeue(ride_id)
+        return
+    event_hub.publish_threadsafe(f"ride:{ride_id}", "ride.dispatch_exhausted", ride_id=ride_id)
+
+dispatcher = Dispatcher(
+    round_size=int(os.getenv("DISPATCH_ROUND_SIZE", 3)),
+    round_seconds=float(os.getenv("DISPATCH_ROUND_SECONDS", 10)),
+    max_rounds=int(os.getenv("DISPATCH_MAX_ROUNDS", 4)),
+    on_offer=_on_offer,
+    on_exhausted=_on_dispatch_exhausted,
+)
+
+# MATCHING_MODE=batch collects new rides and assigns them jointly every tick
+# (minimum total pickup distance) instead of offering each one on arrival
+BATCH_MATCHING = os.getenv("MATCHING_MODE", "greedy") == "batch"
+BATCH_MATCH_TICK_SECONDS = float(os.getenv("BATCH_MATCH_TICK_SECONDS", 2))
+
+def _on_batch_assign(ride_id, driver_id, pickup_km):
+    dispatcher.open(ride_id, [driver_id])
+
+batch_matcher = BatchMatcher(
+    driver_index,
+    on_assign=_on_batch_assign,
+    radius_km=MATCH_RADIUS_KM,
+    candidates=int(os.getenv("BATCH_MATCH_CANDIDATES", 8)),
+    time_budget=float(os.getenv("BATCH_MATCH_TIME_BUDGET", 0.5)),
+    zone_km=float(os.getenv("BATCH_MATCH_ZONE_KM", 2)),
+    max_block_rides=int(os.getenv("BATCH_MATCH_MAX_BLOCK_RIDES", 200)),
+)
+
+# Shared rides: a new pool request is inserted into the route of a nearby
+# pool vehicle when detour, wait and capacity limits allow; otherwise it is
+# dispatched on its own and its driver's route is opened on accept
+POOL_MATCHING = os.getenv("POOL_MATCHING", "on") == "on"
+POOL_STRAIGHT_LINE_SPEED_KMH = float(os.getenv("POOL_STRAIGHT_LINE_SPEED_KMH", 20))
+
+def _pool_travel_seconds(origins, dest):
+    # Road ETAs when the graph is loaded; straight-line for the rest
+    etas = routing_engine.etas_to(
+        dest[0], dest[1], [(i, lat, lng) for i, (lat, lng) in enumerate(origins)]
+    ) if routing_engine is not None else {}
+    return [
+        etas[i] if etas.get(i) is not None
+        else straight_line_eta(lat, lng, dest[0], dest[1], POOL_STRAIGHT_LINE_SPEED_KMH)
+        for i, (lat, lng) in enumerate(origins)
+    ]
+
+pool_planner = PoolPlanner(
+    _pool_travel_seconds,
+    capacity=int(os.getenv("POOL_CAPACITY", 3)),
+    max_riders=int(os.getenv("POOL_MAX_RIDERS", 4)),
+    max_wait_seconds=float(os.getenv("POOL_MAX_WAIT_SECONDS", 600)),
+    max_detour_ratio=float(os.getenv("POOL_MAX_DETOUR_RATIO", 0.5)),
+    min_detour_seconds=float(os.getenv("POOL_MIN_DETOUR_SECONDS", 300)),
+    search_radius_km=float(os.getenv("POOL_SEARCH_RADIUS_KM", 3)),
+    candidates=int(os.getenv("POOL_CANDIDATES", 8)),
+    arrive_m=float(os.getenv("POOL_ARRIVE_METERS", 75)),
+)
+
+# Availability follows the statuses read back by each location flush
+def _on_locations_flushed(batch, statuses):
+    for driver_id, (current_status, is_verified) in statuses.items():
+        driver_index.set_available(driver_id, current_status == 'available' and is_verified)
+        # The flush may have moved the driver from offline to available
+        cached = lookup_cache.peek("driver", driver_id)
+        if cached is not None and cached.get("current_status") != current_status:
+            lookup_cache.invalidate(("driver", driver_id))
+
+location_ingestor = LocationIngestor(
+    pool,
+    batch_size=int(os.getenv("LOCATION_BATCH_SIZE", 500)),
+    flush_interval=float(os.getenv("LOCATION_FLUSH_INTERVAL", 0.5)),
+    max_pending=int(os.getenv("LOCATION_MAX_PENDING", 20000)),
+    durability=os.getenv("LOCATION_DURABILITY", "buffered"),
+    on_flush=_on_locations_flushed,
+)
+
+# Downsampling, retention and archiving for the driver_locations history
+location_maintenance = LocationMaintenance(
+    pool,
+    retention_days=int(os.getenv("LOCATION_RETENTION_DAYS", 30)),
+    compact_after_hours=int(os.getenv("LOCATION_COMPACT_AFTER_HOURS", 24)),
+    bucket_seconds=int(os.getenv("LOCATION_COMPACT_BUCKET_SECONDS", 30)),
+    archive_dir=os.getenv("LOCATION_ARCHIVE_DIR") or None,
+    compression=os.getenv("LOCATION_ARCHIVE_COMPRESSION", "zstd"),
+)
+LOCATION_MAINTENANCE_INTERVAL = float(os.getenv("LOCATION_MAINTENANCE_INTERVAL", 3600))
+
+# Rebuilds driver/rider stats and the hourly/daily rollups from rides (POST /stats/backfill)
+ride_stats_backfill = RideStatsBackfill(pool, batch_size=int(os.getenv("RIDE_STATS_BACKFILL_BATCH", 1000)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool.open()
+    password_hasher.start()
+    document_store.open()
+    document_processor.start()
+    await event_hub.start()
+    try:
+        loaded = await db.run(_load_driver_index)
+        print(f"Driver index warmed with {loaded} drivers")
+    except Exception as e:
+        print(f"Driver index warm-up failed: {str(e)}")
+    try:
+        loaded = await db.run(_load_active_rides)
+        print(f"Surge engine warmed with {loaded} active rides")
+    except Exception as e:
+        print(f"Surge engine warm-up failed: {str(e)}")
+    location_ingestor.start()
+    maintenance_task = (
+        asyncio.create_task(location_maintenance.run(LOCATION_MAINTENANCE_INTERVAL))
+        if LOCATION_MAINTENANCE_INTERVAL > 0 else None
+    )
+    dispatch_task = asyncio.create_task(dispatcher.run())
+    batch_task = asyncio.create_task(batch_matcher.run(BATCH_MATCH_TICK_SECONDS)) if BATCH_MATCHING else None
+    yield
+    if batch_task is not None:
+        batch_task.cancel()
+    dispatch_task.cancel()
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    location_ingestor.stop()
+    await event_hub.stop()
+    db.shutdown()
+    password_hasher.shutdown()
+    document_processor.shutdown()
+    pool.close()
+
 app = FastAPI(
     title="Uber-like API",
     description="API for Uber-like ride hailing service using SQL Server stored procedures",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+app.add_middleware(MetricsMiddleware, metrics=metrics)
 
-# Database configuration
+@app.exception_handler(PoolTimeout)
+@app.exception_handler(ExecutorOverloaded)
+@app.exception_handler(IngestBufferFull)
+@app.exception_handler(HasherOverloaded)
+@app.exception_handler(UploadsOverloaded)
+async def database_busy_handler(request: Request, exc: Exception):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)})
+
+@app.exception_handler(IdempotencyKeyReused)
+async def idempotency_key_reused_handler(request: Request, exc: IdempotencyKeyReused):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+# Sync dependency for handlers that run in Starlette's threadpool
 def get_db_connection():
     try:
-        conn = pyodbc.connect(
-            f"Driver={{{os.getenv('DB_DRIVER')}}};"
-            f"Server={os.getenv('DB_SERVER')};"
-            f"Database={os.getenv('DB_NAME')};"
-            f"UID={os.getenv('DB_USER')};"
-            f"PWD={os.getenv('DB_PASSWORD')};",
-            autocommit=True
+        conn = pool.acquire()
+    except PoolTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
         )
-        return conn
     except Exception as e:
         print(f"Database connection error: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail="Could not connect to database"
         )
+    discard = False
+    try:
+        yield conn
+    except pyodbc.OperationalError:
+        # Broken link: don't hand this connection to the next request
+        discard = True
+        raise
+    finally:
+        pool.release(conn, discard=discard)
 
-# Helper function to convert rows to dictionaries
-def row_to_dict(cursor, row):
-    return {column[0]: getattr(row, column[0]) for column in cursor.description}
+# Seed the driver index with each driver's last known position
+def _load_driver_index(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT d.driver_id, d.current_status, d.is_verified,
+                   dl.latitude AS lat, dl.longitude AS lng
+            FROM drivers d
+            JOIN driver_current_location dl ON d.driver_id = dl.driver_id
+        """)
+        count = 0
+        for row in cursor.fetchall():
+            driver_index.update(
+                row.driver_id, float(row.lat), float(row.lng),
+                available=row.current_status == 'available' and bool(row.is_verified)
+            )
+            count += 1
+        return count
+    finally:
+        cursor.close()
+
+def _load_active_rides(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT ride_id, driver_id, ride_status, ride_type,
+                   pickup_location.Lat AS lat, pickup_location.Long AS lng,
+                   dropoff_location.Lat AS dropoff_lat, dropoff_location.Long AS dropoff_lng
+            FROM rides
+            WHERE ride_status IN ('requested', 'accepted', 'arrived', 'in_progress')
+            ORDER BY accepted_at
+        """)
+        rows = cursor.fetchall()
+        for row in rows:
+            surge_engine.ride_opened(row.ride_id, float(row.lat), float(row.lng))
+            if row.driver_id is not None:
+                _track_ride(row.driver_id, row.ride_id)
+                # Pings before the restart are lost; record from here on
+                trace_recorder.start(row.ride_id)
+                if row.ride_type == 'pool' and POOL_MATCHING:
+                    # Pickups already made aren't known; every rider is re-added still to board
+                    pool_planner.open(row.driver_id, row.ride_id, (float(row.lat), float(row.lng)),
+                                      (float(row.dropoff_lat), float(row.dropoff_lng)),
+                                      driver_index.position(row.driver_id))
+        return len(rows)
+    finally:
+        cursor.close()
+
+# Explicit projections for list endpoints (geography comes back as lat/lng)
+USER_COLUMNS = """
+    user_id, email, phone_number, first_name, last_name, date_of_birth,
+    profile_picture_url, user_type, account_status, created_at, updated_at
+"""
+RIDE_COLUMNS = """
+    ride_id, rider_id, driver_id, vehicle_id,
+    pickup_location.Lat AS pickup_lat, pickup_location.Long AS pickup_lng,
+    dropoff_location.Lat AS dropoff_lat, dropoff_location.Long AS dropoff_lng,
+    pickup_address, dropoff_address, ride_status, ride_type,
+    requested_at, accepted_at, started_at, completed_at,
+    estimated_fare, actual_fare, distance_km, duration_minutes,
+    surge_multiplier, payment_status, cancelled_by, cancel_reason, cancelled_at
+"""
+
+# Procedures go over {CALL} (RPC, no batch text to parse) and hot lookups as
+# prepared statements, both with declared parameter types so plans are reused
+REGISTER_USER = procedure(
+    "sp_register_user", nvarchar(255), nvarchar(20), nvarchar(255), nvarchar(100), nvarchar(100),
+    DATE, nvarchar(255), varchar(20), varchar(10)
+)
+AUTHENTICATE_USER = procedure("sp_authenticate_user", nvarchar(255))
+UPLOAD_DRIVER_DOCUMENTS = procedure(
+    "sp_upload_driver_documents", INT, varchar(20), nvarchar(100), nvarchar(255), nvarchar(255), DATE
+)
+REQUEST_RIDE = procedure(
+    "sp_request_ride", INT, FLOAT, FLOAT, FLOAT, FLOAT, nvarchar(), nvarchar(), varchar(20),
+    BIT, decimal(3, 2), decimal(5, 2), INT
+)
+ADD_POOL_RIDER = procedure("sp_add_pool_rider", INT, INT, INT)
+ACCEPT_RIDE = procedure("sp_accept_ride", INT, INT)
+UPDATE_USER_PROFILE = procedure(
+    "sp_update_user_profile", INT, nvarchar(255), nvarchar(20), nvarchar(100), nvarchar(100), nvarchar(500)
+)
+GET_USER = query("get_user", f"SELECT {USER_COLUMNS} FROM users WHERE user_id = ?", INT)
+GET_DRIVER = query("get_driver", "SELECT * FROM drivers WHERE driver_id = ?", INT)
+GET_RIDE = query("get_ride", f"SELECT {RIDE_COLUMNS} FROM rides WHERE ride_id = ?", INT)
+GET_ACTIVE_RIDES = query("get_active_rides", f"""
+    SELECT {RIDE_COLUMNS} FROM rides
+    WHERE rider_id = ? AND ride_status IN ('requested', 'accepted', 'in_progress')
+""", INT)
+GET_RIDE_TRACE = query("get_ride_trace", """
+    SELECT encoded_trace, point_count, distance_km, duration_seconds
+    FROM ride_traces
+    WHERE ride_id = ?
+""", INT)
+GET_PAYMENT = query("get_payment", "SELECT * FROM payments WHERE ride_id = ?", INT)
+DRIVER_VEHICLE = query("driver_vehicle", """
+    SELECT d.driver_id, v.vehicle_id
+    FROM drivers d
+    LEFT JOIN vehicles v ON d.driver_id = v.driver_id
+    WHERE d.driver_id = ?
+""", INT)
+MATCHED_DRIVERS = query("matched_drivers", f"""
+    SELECT
+        d.driver_id,
+        u.first_name + ' ' + u.last_name AS driver_name,
+        v.vehicle_make + ' ' + v.vehicle_model AS vehicle,
+        v.vehicle_number,
+        d.average_rating
+    FROM drivers d
+    JOIN users u ON d.driver_id = u.user_id
+    JOIN vehicles v ON d.driver_id = v.driver_id
+    WHERE d.driver_id IN ({", ".join("?" for _ in range(MATCH_MAX_DRIVERS))})
+    AND d.current_status = 'available'
+    AND d.is_verified = 1
+""", *([INT] * MATCH_MAX_DRIVERS))
+UPDATE_DRIVER_STATUS = query("update_driver_status", """
+    UPDATE drivers
+    SET current_status = ?
+    OUTPUT inserted.is_verified
+    WHERE driver_id = ?
+""", varchar(20), INT)
+CANCEL_RIDE = query("cancel_ride", """
+    UPDATE rides
+    SET ride_status = 'cancelled',
+        cancelled_by = ?,
+        cancel_reason = ?,
+        cancelled_at = GETDATE()
+    OUTPUT inserted.driver_id, inserted.rider_id
+    WHERE ride_id = ? AND ride_status IN ('requested','accepted')
+""", varchar(10), varchar(255), INT)
+UPDATE_PAYMENT_STATUS = query("update_payment_status", """
+    UPDATE payments
+    SET payment_status = ?, updated_at = GETDATE()
+    WHERE ride_id = ?
+""", varchar(20), INT)
+# Running aggregates (schema_ride_stats.sql); users without a stats row yet read as zeros
+STATS_COLUMNS = """
+    ISNULL(s.completed_trips, 0) AS completed_trips, ISNULL(s.fare_total, 0) AS fare_total,
+    ISNULL(s.distance_km, 0) AS distance_km, ISNULL(s.duration_minutes, 0) AS duration_minutes,
+    ISNULL(s.cancelled_by_rider, 0) AS cancelled_by_rider, ISNULL(s.cancelled_by_driver, 0) AS cancelled_by_driver,
+    ISNULL(s.rating_count, 0) AS rating_count, ISNULL(s.rating_sum, 0) AS rating_sum, s.updated_at
+"""
+ROLLUP_COLUMNS = """
+    granularity, bucket_start, completed_trips, fare_total, distance_km, duration_minutes,
+    cancelled_by_rider, cancelled_by_driver, rating_count, rating_sum
+"""
+GET_DRIVER_STATS = query("get_driver_stats", f"""
+    SELECT d.driver_id, {STATS_COLUMNS}
+    FROM drivers d
+    LEFT JOIN driver_stats s ON s.driver_id = d.driver_id
+    WHERE d.driver_id = ?
+""", INT)
+GET_RIDER_STATS = query("get_rider_stats", f"""
+    SELECT u.user_id AS rider_id, {STATS_COLUMNS}
+    FROM users u
+    LEFT JOIN rider_stats s ON s.rider_id = u.user_id
+    WHERE u.user_id = ?
+""", INT)
+GET_CURRENT_ROLLUPS = query("get_current_rollups", f"""
+    SELECT {ROLLUP_COLUMNS} FROM ride_stats_rollup
+    WHERE (granularity = 'H' AND bucket_start = DATEADD(HOUR, DATEDIFF(HOUR, 0, GETDATE()), 0))
+    OR (granularity = 'D' AND bucket_start = CAST(CAST(GETDATE() AS DATE) AS DATETIME))
+""")
+LIST_ROLLUPS = query("list_rollups", f"""
+    SELECT TOP (?) {ROLLUP_COLUMNS} FROM ride_stats_rollup
+    WHERE granularity = ? AND bucket_start >= ? AND bucket_start < ?
+    ORDER BY bucket_start
+""", INT, varchar(1), DATETIME, DATETIME)
+RECORD_RIDE_STATS = procedure("sp_record_ride_stats", INT)
+RATE_RIDE = procedure("sp_rate_ride", INT, varchar(10), INT)
+VERIFY_DRIVER = query("verify_driver", """
+    UPDATE drivers
+    SET is_verified = 1, current_status = 'available'
+    WHERE driver_id = ?
+""", INT)
+
+# Column metadata and Decimal/geography converters, worked out once per statement
+REGISTERED_USER_ROW = RowMapper()
+PROFILE_ROW = RowMapper()
+USER_ROW = RowMapper()
+DRIVER_ROW = RowMapper()
+RIDE_ROW = RowMapper()
+REQUESTED_RIDE_ROW = RowMapper()
+ACCEPTED_RIDE_ROW = RowMapper()
+MATCHED_DRIVER_ROW = RowMapper()
+DOCUMENT_ROW = RowMapper()
+PAYMENT_ROW = RowMapper()
+STATS_ROW = RowMapper()
+ROLLUP_ROW = RowMapper()
+
+# JSON pages carry the next keyset cursor in X-Next-Cursor; format=ndjson
+# streams every matching row instead.
+async def _list_response(select_sql: str, where_sql: str, params: list, keys, key_types,
+                         descending: bool, cursor: Optional[str], limit: Optional[int], format: str):
+    after = decode_cursor(cursor, key_types) if cursor else None
+    if format == "ndjson":
+        sql, sql_params = keyset_query(select_sql, where_sql, params, keys, descending, after, limit)
+        return StreamingResponse(stream_ndjson(db, sql, sql_params), media_type="application/x-ndjson")
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    sql, sql_params = keyset_query(select_sql, where_sql, params, keys, descending, after, limit + 1)
+    rows, next_cursor = await db.run(fetch_page, sql, sql_params, limit, keys)
+    return ORJSONResponse(rows, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
 
 # Models for request/response validation
 class UserBase(BaseModel):
@@ -63,7 +605,15 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     pass
 
-class UserResponse(UserBase):
+class UserResponse(BaseModel):
+    # UserBase without password_hash: the stored hash never leaves the API
+    email: str
+    phone_number: str
+    first_name: str
+    last_name: str
+    date_of_birth: Optional[date] = None
+    profile_picture_url: Optional[str] = None
+    user_type: str
     user_id: int
     account_status: str
     created_at: datetime
@@ -84,6 +634,14 @@ class RideRequest(BaseModel):
     dropoff_address: str
     ride_type: str = "standard"
 
+class QuotePair(BaseModel):
+    pickup_location: Location
+    dropoff_location: Location
+
+class QuoteRequest(BaseModel):
+    pairs: List[QuotePair]
+    ride_types: Optional[List[str]] = None  # defaults to every priced ride type
+
 class RideAccept(BaseModel):
     driver_id: int
 
@@ -98,6 +656,9 @@ class DocumentUpload(BaseModel):
     document_back_url: Optional[str] = None
     expiry_date: Optional[str] = None
 
+class BulkDocumentUpload(DocumentUpload):
+    driver_id: int
+
 class PaymentRequest(BaseModel):
     payment_method: str
     
@@ -111,32 +672,36 @@ class UserUpdate(BaseModel):
     profile_picture_url: Optional[str] = None
     
 class DriverStatusUpdate(BaseModel):
-    current_status: str
+    current_status: str = Field(max_length=20)
     
 class CancelRideRequest(BaseModel):
-    cancelled_by: str  # "rider" or "driver"
-    reason: Optional[str] = None
+    cancelled_by: str = Field(max_length=10)  # "rider" or "driver"
+    reason: Optional[str] = Field(None, max_length=255)
     
 class PaymentUpdate(BaseModel):
-    payment_status: str  # e.g., "paid", "failed"
+    payment_status: str = Field(max_length=20)  # e.g., "paid", "failed"
+
+class RideRating(BaseModel):
+    rating: int = Field(ge=1, le=5)
+    # Taken from the caller's side of the ride; if sent it has to match it
+    rated_by: Optional[Literal["rider", "driver"]] = None
     
     
 @app.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, conn = Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def register_user(user: UserCreate):
+    # The submitted password_hash is treated as the secret and stored bcrypt-hashed
+    hashed = await password_hasher.hash(user.password_hash)
+    return await db.run(_register_user, user.model_copy(update={"password_hash": hashed}))
+
+def _register_user(conn, user: UserCreate):
+    cursor = conn.prepare(REGISTER_USER)
     try:
-        # Call the stored procedure
-        cursor.execute("""
-            EXEC sp_register_user 
-                @email = ?, @phone_number = ?, @password_hash = ?,
-                @first_name = ?, @last_name = ?, @date_of_birth = ?,
-                @profile_picture_url = ?, @user_type = ?
-        """, user.email, user.phone_number, user.password_hash,
-           user.first_name, user.last_name, user.date_of_birth,
-           user.profile_picture_url, user.user_type)
+        # Call the stored procedure ({CALL} is positional: account_status is passed as its default)
+        cursor.execute(user.email, user.phone_number, user.password_hash,
+                       user.first_name, user.last_name, user.date_of_birth,
+                       user.profile_picture_url, 'active', user.user_type)
         
         # Get the result
-        columns = [column[0] for column in cursor.description]
         user_data = cursor.fetchone()
         
         if not user_data:
@@ -146,7 +711,9 @@ def register_user(user: UserCreate, conn = Depends(get_db_connection)):
             )
         
         conn.commit()
-        return dict(zip(columns, user_data))
+        user_dict = REGISTERED_USER_ROW.one(cursor, user_data)
+        user_dict.pop("password_hash", None)
+        return user_dict
 
     except pyodbc.DatabaseError as e:
         conn.rollback()
@@ -172,76 +739,351 @@ def register_user(user: UserCreate, conn = Depends(get_db_connection)):
         cursor.close()
 
 @app.post("/users/login", response_model=Token)
-def login_user(form_data: OAuth2PasswordRequestForm = Depends(), conn = Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def login_user(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    email = form_data.username.strip().lower()
+    for limiter, key in ((login_ip_limiter, request.client.host if request.client else None),
+                         (login_account_limiter, email)):
+        retry_after = limiter.acquire(key)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts",
+                headers={"Retry-After": str(int(retry_after) + 1)},
+            )
+
+    # Here username = email
+    user_dict = await db.run(_load_login_user, form_data.username)
+    stored_hash = user_dict.pop("password_hash") if user_dict else None
+    matches, new_hash = await password_hasher.verify(form_data.password, stored_hash)
+    if not matches:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    login_account_limiter.reset(email)
+    if new_hash is not None:
+        # Cost parameters changed (or a legacy value): store the upgraded hash
+        await db.run(_rehash_password, user_dict["user_id"], stored_hash, new_hash)
+
+    # 🔑 Map role → scopes
+    access_token = create_access_token(
+        data={
+            "user_id": user_dict["user_id"],
+            "email": user_dict["email"],
+            "role": user_dict["user_type"],    # keep role
+            "scopes": ROLE_SCOPES.get(user_dict["user_type"], [])  # add scopes ✅
+        },
+        expires_delta=ACCESS_TOKEN_EXPIRE_DELTA
+    )
+
+    return {"access_token": access_token, "token_type": "bearer"}
+
+def _load_login_user(conn, email: str):
+    cursor = conn.prepare(AUTHENTICATE_USER)
     try:
-        # Here username = email
-        cursor.execute("""
-            EXEC sp_authenticate_user @email = ?, @password_hash = ?
-        """, form_data.username, form_data.password)
+        cursor.execute(email)
 
         user = cursor.fetchone()
         if not user:
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-
+            return None
         columns = [col[0] for col in cursor.description]
-        user_dict = dict(zip(columns, user))
-
-        # 🔑 Map role → scopes
-        scopes_map = {
-            "rider": ["rider"],
-            "driver": ["driver"],
-            "admin": ["admin"]
-        }
-
-        access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60)))
-        access_token = create_access_token(
-            data={
-                "user_id": user_dict["user_id"],
-                "email": user_dict["email"],
-                "role": user_dict["user_type"],    # keep role
-                "scopes": scopes_map.get(user_dict["user_type"], [])  # add scopes ✅
-            },
-            expires_delta=access_token_expires
-        )
+        return dict(zip(columns, user))
 
-        return {"access_token": access_token, "token_type": "bearer"}
+    finally:
+        cursor.close()
 
+def _rehash_password(conn, user_id: int, old_hash: str, new_hash: str):
+    cursor = conn.cursor()
+    try:
+        # Only replace the hash we verified against; a concurrent password change wins
+        cursor.execute("""
+            UPDATE users
+            SET password_hash = ?, updated_at = GETDATE()
+            WHERE user_id = ? AND password_hash = ?
+        """, new_hash, user_id, old_hash)
+        conn.commit()
+        lookup_cache.invalidate(("user", user_id))
     finally:
         cursor.close()
 
+@app.get("/auth/stats")
+def auth_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return {
+        "hasher": password_hasher.stats(),
+        "login_ip_limiter": login_ip_limiter.stats(),
+        "login_account_limiter": login_account_limiter.stats(),
+    }
+
+
+@app.post("/users/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout_user(token: str = Depends(oauth2_scheme)):
+    if not revoke_token(token):
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
 
 @app.get("/admin/users")
-def list_users(
-    token_data: TokenData = Security(verify_token, scopes=["admin"]),
-    conn = Depends(get_db_connection)
+async def list_users(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    return await _list_response(
+        f"SELECT {USER_COLUMNS} FROM users", "", [],
+        ["user_id"], (int,), False, cursor, limit, format
+    )
+
+# Bulk onboarding: NDJSON or CSV bodies are read as a stream, validated in
+# chunks and inserted set-based, one transaction per chunk
+@app.post("/admin/import/users")
+async def import_users(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    return await _import(request, format, UserCreate, _import_users_chunk, prepare=_hash_imported_passwords)
+
+@app.post("/admin/import/drivers")
+async def import_drivers(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
 ):
+    return await _import(request, format, UserCreate, _import_users_chunk, prepare=_hash_imported_passwords,
+                         overrides={"user_type": "driver"})
+
+@app.post("/admin/import/documents")
+async def import_documents(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    return await _import(request, format, BulkDocumentUpload, _import_documents_chunk)
+
+async def _import(request: Request, format: Optional[str], model, insert_chunk, prepare=None, overrides=None):
+    started = time.perf_counter()
+    report = ImportReport()
+    async for chunk in read_chunks(request, import_format(request, format)):
+        report.received += len(chunk)
+        valid, errors = validate_chunk(model, chunk, overrides)
+        report.add_errors(errors)
+        if not valid:
+            continue
+        try:
+            if prepare is not None:
+                valid = await prepare(valid)
+            inserted, rejected = await db.run(insert_chunk, valid)
+        except pyodbc.Error as e:
+            # The chunk's transaction was rolled back; later chunks still run
+            report.add_errors([(row, f"Database error: {str(e)}") for row, _ in valid])
+            continue
+        except (HasherOverloaded, PoolTimeout, ExecutorOverloaded) as e:
+            # Nothing of this chunk was written and later ones would only fail
+            # the same way: stop, and report what did go in so the client can
+            # resume after the last row received
+            report.add_errors([(row, str(e)) for row, _ in valid])
+            report.stopped = str(e)
+            break
+        report.inserted += inserted
+        report.add_errors(rejected)
+    return report.result(time.perf_counter() - started)
+
+async def _hash_imported_passwords(rows):
+    # Rows may carry a ready bcrypt hash; anything else is hashed here
+    pending = [i for i, (_, user) in enumerate(rows) if not password_hasher.is_hash(user.password_hash)]
+    hashed = await password_hasher.hash_many([rows[i][1].password_hash for i in pending])
+    rows = list(rows)
+    for i, password_hash in zip(pending, hashed):
+        row, user = rows[i]
+        rows[i] = (row, user.model_copy(update={"password_hash": password_hash}))
+    return rows
+
+def _import_users_chunk(conn, rows):
+    conn.autocommit = False
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users")
-    users = cursor.fetchall()
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, u)) for u in users]
-        
+    try:
+        # Staged as text and converted in SQL, so fast_executemany binds one type per column
+        cursor.execute("""
+            CREATE TABLE #user_import (
+                row_no INT PRIMARY KEY, email NVARCHAR(255), phone_number NVARCHAR(20),
+                password_hash NVARCHAR(255), first_name NVARCHAR(100), last_name NVARCHAR(100),
+                date_of_birth NVARCHAR(10), profile_picture_url NVARCHAR(255), user_type NVARCHAR(10),
+                error NVARCHAR(200)
+            )
+        """)
+        cursor.fast_executemany = True
+        cursor.executemany("INSERT INTO #user_import VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)", [
+            (row, user.email, user.phone_number, user.password_hash, user.first_name, user.last_name,
+             user.date_of_birth.isoformat() if user.date_of_birth else None,
+             user.profile_picture_url, user.user_type)
+            for row, user in rows
+        ])
+
+        # sp_register_user's uniqueness checks, applied to the whole chunk
+        cursor.execute("""
+            UPDATE i
+            SET error = CASE
+                WHEN EXISTS (SELECT 1 FROM users u WHERE u.email = i.email)
+                    THEN 'Email address is already registered'
+                WHEN EXISTS (SELECT 1 FROM users u WHERE u.phone_number = i.phone_number)
+                    THEN 'Phone number is already registered'
+                ELSE 'Email or phone number repeats an earlier row'
+            END
+            FROM #user_import i
+            WHERE EXISTS (SELECT 1 FROM users u WHERE u.email = i.email OR u.phone_number = i.phone_number)
+            OR EXISTS (
+                SELECT 1 FROM #user_import j
+                WHERE j.row_no < i.row_no AND (j.email = i.email OR j.phone_number = i.phone_number)
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO users (
+                email, phone_number, password_hash, first_name, last_name,
+                date_of_birth, profile_picture_url, account_status, user_type
+            )
+            SELECT email, phone_number, password_hash, first_name, last_name,
+                   CAST(date_of_birth AS DATE), profile_picture_url, 'active', user_type
+            FROM #user_import
+            WHERE error IS NULL
+        """)
+        inserted = cursor.rowcount
+        cursor.execute("""
+            INSERT INTO riders (rider_id, wallet_balance)
+            SELECT u.user_id, 0.00
+            FROM #user_import i
+            JOIN users u ON u.email = i.email
+            WHERE i.error IS NULL AND i.user_type = 'rider'
+        """)
+        cursor.execute("""
+            INSERT INTO drivers (driver_id, is_verified, average_rating, total_trips, current_status)
+            SELECT u.user_id, 0, 0.00, 0, 'offline'
+            FROM #user_import i
+            JOIN users u ON u.email = i.email
+            WHERE i.error IS NULL AND i.user_type = 'driver'
+        """)
+
+        cursor.execute("SELECT row_no, error FROM #user_import WHERE error IS NOT NULL")
+        rejected = [(r.row_no, r.error) for r in cursor.fetchall()]
+        cursor.execute("DROP TABLE #user_import")
+        conn.commit()
+        return inserted, rejected
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.autocommit = True
+
+def _import_documents_chunk(conn, rows):
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE #document_import (
+                row_no INT PRIMARY KEY, driver_id INT, document_type NVARCHAR(20),
+                document_number NVARCHAR(100), document_front_url NVARCHAR(255),
+                document_back_url NVARCHAR(255), expiry_date NVARCHAR(30), error NVARCHAR(200)
+            )
+        """)
+        cursor.fast_executemany = True
+        cursor.executemany("INSERT INTO #document_import VALUES (?, ?, ?, ?, ?, ?, ?, NULL)", [
+            (row, doc.driver_id, doc.document_type, doc.document_number,
+             doc.document_front_url, doc.document_back_url, doc.expiry_date)
+            for row, doc in rows
+        ])
+
+        # sp_upload_driver_documents' checks, applied to the whole chunk
+        cursor.execute("""
+            UPDATE i
+            SET error = CASE
+                WHEN NOT EXISTS (SELECT 1 FROM drivers d WHERE d.driver_id = i.driver_id)
+                    THEN 'Driver not found'
+                WHEN i.expiry_date IS NOT NULL AND TRY_CONVERT(DATE, i.expiry_date) IS NULL
+                    THEN 'Invalid expiry_date'
+                WHEN EXISTS (
+                    SELECT 1 FROM driver_documents dd
+                    WHERE dd.driver_id = i.driver_id AND dd.document_type = i.document_type
+                ) THEN 'Document type already exists for this driver'
+                WHEN EXISTS (
+                    SELECT 1 FROM #document_import j
+                    WHERE j.row_no < i.row_no AND j.driver_id = i.driver_id AND j.document_type = i.document_type
+                ) THEN 'Document type repeats an earlier row for this driver'
+            END
+            FROM #document_import i
+        """)
+        cursor.execute("""
+            INSERT INTO driver_documents (
+                driver_id, document_type, document_number,
+                document_front_url, document_back_url, expiry_date
+            )
+            SELECT driver_id, document_type, document_number,
+                   document_front_url, document_back_url, TRY_CONVERT(DATE, expiry_date)
+            FROM #document_import
+            WHERE error IS NULL
+        """)
+        inserted = cursor.rowcount
+
+        cursor.execute("SELECT row_no, error FROM #document_import WHERE error IS NOT NULL")
+        rejected = [(r.row_no, r.error) for r in cursor.fetchall()]
+        cursor.execute("DROP TABLE #document_import")
+        conn.commit()
+        return inserted, rejected
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.autocommit = True
+
+EXPORT_QUERIES = {
+    "users": f"SELECT {USER_COLUMNS} FROM users ORDER BY user_id",
+    "drivers": """
+        SELECT d.driver_id, u.email, u.phone_number, u.first_name, u.last_name,
+               u.account_status, d.is_verified, d.current_status, d.average_rating,
+               d.total_trips, u.created_at
+        FROM drivers d
+        JOIN users u ON d.driver_id = u.user_id
+        ORDER BY d.driver_id
+    """,
+    "documents": """
+        SELECT driver_id, document_type, document_number, document_front_url,
+               document_back_url, expiry_date, verification_status
+        FROM driver_documents
+        ORDER BY driver_id, document_type
+    """,
+}
+
+@app.get("/admin/export/{kind}")
+async def export_records(
+    kind: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    sql = EXPORT_QUERIES.get(kind)
+    if sql is None:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    if format == "csv":
+        body, media_type = stream_csv(db, sql, []), "text/csv"
+    else:
+        body, media_type = stream_ndjson(db, sql, []), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'})
+
 @app.post("/drivers/{driver_id}/documents", status_code=status.HTTP_201_CREATED)
-def upload_driver_document(
+async def upload_driver_document(
     driver_id: int, 
-    document: DocumentUpload, 
-    conn = Depends(get_db_connection)
+    document: DocumentUpload
 ):
-    cursor = conn.cursor()
+    return await db.run(_upload_driver_document, driver_id, document)
+
+def _upload_driver_document(conn, driver_id: int, document: DocumentUpload):
+    cursor = conn.prepare(UPLOAD_DRIVER_DOCUMENTS)
     try:
-        cursor.execute("""
-            EXEC sp_upload_driver_documents
-                @driver_id = ?, @document_type = ?, @document_number = ?,
-                @document_front_url = ?, @document_back_url = ?, @expiry_date = ?
-        """, driver_id, document.document_type, document.document_number,
-           document.document_front_url, document.document_back_url, document.expiry_date)
+        cursor.execute(driver_id, document.document_type, document.document_number,
+                       document.document_front_url, document.document_back_url, document.expiry_date)
         
-        columns = [column[0] for column in cursor.description]
-        result = cursor.fetchall()
+        result = DOCUMENT_ROW.all(cursor, cursor.fetchall())
         
         conn.commit()
-        return [dict(zip(columns, row)) for row in result]
+        return result
     except pyodbc.DatabaseError as e:
         conn.rollback()
         error_msg = str(e)
@@ -257,86 +1099,330 @@ def upload_driver_document(
     finally:
         cursor.close()
 
+@app.post("/drivers/{driver_id}/documents/upload", status_code=status.HTTP_201_CREATED)
+async def upload_driver_document_files(driver_id: int, request: Request):
+    # multipart/form-data with document_type, document_number and expiry_date
+    # fields and a front (required) and back file. Files are streamed to the
+    # document store, never held in memory whole.
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > len(DOCUMENT_FILE_FIELDS) * document_store.max_bytes + 65536:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail="Upload is too large")
+    try:
+        fields, files = await document_store.read_form(
+            request.stream(), request.headers.get("content-type"), DOCUMENT_FILE_FIELDS)
+        missing = [name for name in ("document_type", "document_number") if not fields.get(name)]
+        if "front" not in files:
+            missing.append("front")
+        if missing:
+            raise DocumentRejected(f"Missing form fields: {', '.join(missing)}")
+        results = await asyncio.gather(*(document_processor.process(f) for f in files.values()))
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(e))
+    except DocumentRejected as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    urls = {name: f"{DOCUMENT_URL_PREFIX}/{stored.digest}" for name, stored in files.items()}
+    document = DocumentUpload(
+        document_type=fields["document_type"],
+        document_number=fields["document_number"],
+        document_front_url=urls["front"],
+        document_back_url=urls.get("back"),
+        expiry_date=fields.get("expiry_date") or None,
+    )
+    documents = await db.run(_upload_driver_document, driver_id, document)
+    return {
+        "documents": documents,
+        "files": {
+            name: {"url": urls[name], "sha256": stored.digest, "size": stored.size,
+                   "filename": stored.filename, "duplicate": stored.duplicate, **result}
+            for (name, stored), result in zip(files.items(), results)
+        },
+    }
+
+@app.get("/documents/stats")
+def document_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return {"store": document_store.stats(), "processor": document_processor.stats()}
+
+@app.get("/documents/{digest}")
+async def get_document_file(
+    digest: str = Path(pattern="^[0-9a-f]{64}$"),
+    variant: str = Query("original", pattern="^(original|display|thumb)$"),
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    result = await asyncio.to_thread(document_store.result, digest)
+    if result is None or "error" in result:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if variant == "original" or (variant == "display" and not result.get("display_size")):
+        return FileResponse(document_store.object_path(digest), media_type=result["content_type"])
+    if result["content_type"] == "application/pdf":
+        raise HTTPException(status_code=404, detail="No preview for PDF documents")
+    return FileResponse(document_store.derived_path(digest, f"{variant}.jpg"), media_type="image/jpeg")
+
 @app.post("/drivers/{driver_id}/location")
-def update_driver_location(
+async def update_driver_location(
     driver_id: int,
-    location: DriverLocationUpdate,
-    conn = Depends(get_db_connection)
+    location: DriverLocationUpdate
 ):
-    cursor = conn.cursor()
+    # Matching sees the new position immediately; SQL gets it on the next flush
+    driver_index.update(driver_id, location.latitude, location.longitude)
+    _publish_location(driver_id, location)
+    for ride_id in active_rides_by_driver.get(driver_id, ()):
+        trace_recorder.record(ride_id, location.latitude, location.longitude)
+    for ride_id, kind, _, _ in pool_planner.update_position(driver_id, location.latitude, location.longitude):
+        event_hub.publish(f"ride:{ride_id}", "ride.pool_stop_reached", ride_id=ride_id, driver_id=driver_id, stop=kind)
+    future, known_status = location_ingestor.submit(driver_id, location.latitude, location.longitude)
+    if known_status is not None and location_ingestor.durability == "buffered":
+        return {"status": known_status}
+
     try:
-        cursor.execute("""
-            EXEC sp_update_driver_location
-                @driver_id = ?, @latitude = ?, @longitude = ?
-        """, driver_id, location.latitude, location.longitude)
-        
-        # Get the updated driver status
-        cursor.execute("SELECT current_status FROM drivers WHERE driver_id = ?", driver_id)
-        status_result = cursor.fetchone()
-        
-        conn.commit()
-        return {"status": status_result.current_status}
+        current_status = await asyncio.wrap_future(future)
     except pyodbc.DatabaseError as e:
-        conn.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Database error: {str(e)}"
         )
-    finally:
-        cursor.close()
+    if current_status is None:
+        driver_index.remove(driver_id)
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return {"status": current_status}
+
+def _publish_location(driver_id: int, location: DriverLocationUpdate):
+    event_hub.publish(f"driver:{driver_id}", "driver.location", driver_id=driver_id,
+                      latitude=location.latitude, longitude=location.longitude)
+    for ride_id in active_rides_by_driver.get(driver_id, ()):
+        event_hub.publish(f"ride:{ride_id}", "driver.location", ride_id=ride_id, driver_id=driver_id,
+                          latitude=location.latitude, longitude=location.longitude)
+
+@app.get("/locations/ingest")
+def location_ingest_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return location_ingestor.stats()
+
+@app.get("/locations/maintenance")
+def location_maintenance_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return location_maintenance.stats()
+
+@app.post("/locations/maintenance")
+async def run_location_maintenance(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    # Long-running; kept off the request executor's workers
+    try:
+        return await asyncio.to_thread(location_maintenance.run_once)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
         
+# Clients retry with the same Idempotency-Key; repeats replay the first ride
+# instead of creating another one
 @app.post("/rides/", status_code=201)
-def request_ride(
+async def request_ride(
     ride: RideRequest,
-    token_data: TokenData = Security(verify_token, scopes=["rider"]),
-    conn = Depends(get_db_connection)
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=MAX_KEY_LENGTH),
+    token_data: TokenData = Security(verify_token, scopes=["rider"])
 ):
     if ride.rider_id != token_data.user_id:
         raise HTTPException(status_code=403, detail="Cannot request ride for another user")
-    
-    cursor = conn.cursor()
+
+    async def execute():
+        return ORJSONResponse(await db.run(_request_ride, ride), status_code=201)
+
+    if idempotency_key is None:
+        return await execute()
+    return await idempotency_store.run(
+        f"rides:{token_data.user_id}", idempotency_key,
+        IdempotencyStore.fingerprint(ride.model_dump_json()), execute
+    )
+
+def _request_ride(conn, ride: RideRequest):
+    pickup = ride.pickup_location
+    surge_multiplier = surge_engine.multiplier(pickup.latitude, pickup.longitude, pending=1)
+    # Road distance and planned duration; the procedure falls back to straight-line
+    route = routing_engine.route(
+        pickup.latitude, pickup.longitude, ride.dropoff_location.latitude, ride.dropoff_location.longitude
+    ) if routing_engine is not None else None
+    cursor = conn.prepare(REQUEST_RIDE)
     try:
-        cursor.execute("""
-            EXEC sp_request_ride
-                @rider_id = ?, @pickup_lat = ?, @pickup_lng = ?,
-                @dropoff_lat = ?, @dropoff_lng = ?,
-                @pickup_address = ?, @dropoff_address = ?,
-                @ride_type = ?
-        """, ride.rider_id, ride.pickup_location.latitude, ride.pickup_location.longitude,
-           ride.dropoff_location.latitude, ride.dropoff_location.longitude,
-           ride.pickup_address, ride.dropoff_address, ride.ride_type)
+        # match_drivers = 0: drivers come from the in-memory index below
+        cursor.execute(ride.rider_id, ride.pickup_location.latitude, ride.pickup_location.longitude,
+                       ride.dropoff_location.latitude, ride.dropoff_location.longitude,
+                       ride.pickup_address, ride.dropoff_address, ride.ride_type,
+                       False, surge_multiplier,
+                       round(route[1], 2) if route else None, max(1, round(route[0] / 60)) if route else None)
         
-        ride_columns = [column[0] for column in cursor.description]
-        ride_data = cursor.fetchone()
-        if not ride_data:
+        ride_details = REQUESTED_RIDE_ROW.one(cursor, cursor.fetchone())
+        if not ride_details:
             raise HTTPException(500, "Failed to create ride")
         
-        ride_details = dict(zip(ride_columns, ride_data))
-        matched_drivers = []
-        if cursor.nextset():
-            driver_columns = [column[0] for column in cursor.description]
-            matched_drivers = [dict(zip(driver_columns, row)) for row in cursor.fetchall()]
+        pooled = _join_pool(conn, ride_details, ride) if ride.ride_type == 'pool' and POOL_MATCHING else None
+        if pooled is None:
+            matched_drivers = _match_drivers(conn, ride_details, ride.pickup_location)
         
         conn.commit()
+        surge_engine.ride_opened(ride_details["ride_id"], pickup.latitude, pickup.longitude)
+        if pooled is not None:
+            return pooled
+        if BATCH_MATCHING:
+            batch_matcher.enqueue(ride_details["ride_id"], pickup.latitude, pickup.longitude)
+        else:
+            dispatcher.open(ride_details["ride_id"], [d["driver_id"] for d in matched_drivers])
         return {"ride": ride_details, "matched_drivers": matched_drivers}
     finally:
         cursor.close()
 
-        
+# The planner reserves the insertion first; if sp_add_pool_rider rejects it
+# (the route changed in SQL meanwhile) the ride falls back to normal dispatch
+_POOL_ERRORS = ("Driver is not on a pool route", "Pool vehicle is full", "Ride is not a requested pool ride")
+
+def _join_pool(conn, ride_details: dict, ride: RideRequest):
+    ride_id = ride_details["ride_id"]
+    insertion = pool_planner.insert(
+        ride_id,
+        (ride.pickup_location.latitude, ride.pickup_location.longitude),
+        (ride.dropoff_location.latitude, ride.dropoff_location.longitude),
+    )
+    if insertion is None:
+        return None
+    driver_id = insertion["driver_id"]
+    cursor = conn.prepare(ADD_POOL_RIDER)
+    try:
+        cursor.execute(ride_id, driver_id, pool_planner.max_riders)
+        accepted = ACCEPTED_RIDE_ROW.one(cursor, cursor.fetchone())
+    except pyodbc.DatabaseError as e:
+        pool_planner.remove(ride_id)
+        if not any(message in str(e) for message in _POOL_ERRORS):
+            raise
+        return None
+    finally:
+        cursor.close()
+
+    lookup_cache.invalidate(("ride", ride_id), ("driver", driver_id))
+    _track_ride(driver_id, ride_id)
+    trace_recorder.start(ride_id)
+    pickup_eta = round(insertion["pickup_eta_seconds"])
+    stops = pool_planner.route_of(driver_id)
+    event_hub.publish_threadsafe(f"ride:{ride_id}", "ride.accepted", ride_id=ride_id, driver_id=driver_id,
+                                 pool=True, pickup_eta_seconds=pickup_eta)
+    event_hub.publish_threadsafe(f"driver:{driver_id}", "driver.pool_route", driver_id=driver_id,
+                                 added_ride_id=ride_id, stops=stops)
+    return {
+        "ride": accepted,
+        "matched_drivers": [],
+        "pool": {
+            "driver_id": driver_id,
+            "pickup_eta_seconds": pickup_eta,
+            "dropoff_eta_seconds": round(insertion["dropoff_eta_seconds"]),
+            "added_seconds": round(insertion["added_seconds"]),
+            "stops": stops,
+        },
+    }
+
+# Nearest available drivers come from the in-memory index; SQL only fetches
+# their display details by primary key and re-checks availability.
+def _match_drivers(conn, ride_details: dict, pickup: Location):
+    if routing_engine is not None:
+        nearby, etas = _rank_by_pickup_eta(pickup)
+    else:
+        nearby, etas = driver_index.nearest(
+            pickup.latitude, pickup.longitude, k=MATCH_MAX_DRIVERS, radius_km=MATCH_RADIUS_KM
+        ), {}
+    if not nearby:
+        return []
+
+    # The id list is padded with NULLs so every call shares one prepared statement
+    driver_ids = [driver_id for driver_id, _ in nearby]
+    cursor = conn.prepare(MATCHED_DRIVERS)
+    try:
+        cursor.execute(*driver_ids, *([None] * (MATCH_MAX_DRIVERS - len(driver_ids))))
+        details = {d["driver_id"]: d for d in MATCHED_DRIVER_ROW.all(cursor, cursor.fetchall())}
+    finally:
+        cursor.close()
+
+    matched = []
+    for driver_id, distance_km in nearby:
+        driver = details.get(driver_id)
+        if driver is None:
+            # Index was stale; SQL is the source of truth
+            driver_index.set_available(driver_id, False)
+            continue
+        driver["distance_km"] = round(distance_km, 3)
+        if routing_engine is not None:
+            eta = etas.get(driver_id)
+            driver["pickup_eta_seconds"] = round(eta) if eta is not None else None
+        driver["estimated_fare"] = ride_details.get("estimated_fare")
+        driver["ride_id"] = ride_details.get("ride_id")
+        matched.append(driver)
+    return matched
+
+def _rank_by_pickup_eta(pickup: Location):
+    # Widen the straight-line shortlist, then order it by road ETA to the
+    # pickup; drivers the graph can't route go last, in straight-line order
+    candidates = driver_index.nearest(
+        pickup.latitude, pickup.longitude, k=ROUTING_MATCH_CANDIDATES, radius_km=MATCH_RADIUS_KM
+    )
+    origins = []
+    for driver_id, _ in candidates:
+        position = driver_index.position(driver_id)
+        if position is not None:
+            origins.append((driver_id, position[0], position[1]))
+    etas = routing_engine.etas_to(pickup.latitude, pickup.longitude, origins)
+    ranked = sorted(
+        candidates,
+        key=lambda c: (etas.get(c[0]) is None, etas.get(c[0]) or 0.0, c[1])
+    )
+    return ranked[:MATCH_MAX_DRIVERS], etas
+
+
+# Fare quotes without touching the database
+@app.post("/rides/quotes")
+def quote_rides(request: QuoteRequest):
+    if len(request.pairs) > QUOTE_MAX_PAIRS:
+        raise HTTPException(status_code=400, detail=f"At most {QUOTE_MAX_PAIRS} pairs per request")
+    ride_types = request.ride_types or list(load_pricing())
+    if not request.pairs:
+        return {"quotes": []}
+
+    coords = np.array([
+        (p.pickup_location.latitude, p.pickup_location.longitude,
+         p.dropoff_location.latitude, p.dropoff_location.longitude)
+        for p in request.pairs
+    ], dtype=np.float64)
+
+    # One surge lookup per pickup cell, not per pair
+    surge_by_cell = {}
+    surge = np.empty(len(coords))
+    for i, (lat, lng) in enumerate(coords[:, :2]):
+        cell = surge_engine.cell_of(lat, lng)
+        if cell not in surge_by_cell:
+            surge_by_cell[cell] = surge_engine.multiplier(lat, lng)
+        surge[i] = surge_by_cell[cell]
+
+    try:
+        estimate = estimate_fares(coords[:, :2], coords[:, 2:], ride_types, surge)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    distances = estimate["distance_km"].tolist()
+    surges = surge.tolist()
+    fares = {ride_type: values.tolist() for ride_type, values in estimate["fares"].items()}
+    return {
+        "quotes": [
+            {
+                "distance_km": distances[i],
+                "surge_multiplier": surges[i],
+                "fares": {ride_type: fares[ride_type][i] for ride_type in ride_types},
+            }
+            for i in range(len(distances))
+        ]
+    }
+
 @app.post("/drivers/{driver_id}/verify")
-def verify_driver(
+async def verify_driver(
     driver_id: int,
-    token_data: TokenData = Security(verify_token, scopes=["admin"]),
-    conn = Depends(get_db_connection)
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
 ):
-    cursor = conn.cursor()
+    return await db.run(_verify_driver, driver_id)
+
+def _verify_driver(conn, driver_id: int):
+    cursor = conn.prepare(DRIVER_VEHICLE)
     try:
-        cursor.execute("""
-            SELECT d.driver_id, v.vehicle_id
-            FROM drivers d
-            LEFT JOIN vehicles v ON d.driver_id = v.driver_id
-            WHERE d.driver_id = ?
-        """, driver_id)
+        cursor.execute(driver_id)
 
         result = cursor.fetchone()
         if not result:
@@ -346,62 +1432,83 @@ def verify_driver(
         if not vehicle_id:
             raise HTTPException(400, "Driver must register a vehicle before verification")
 
-        cursor.execute("""
-            UPDATE drivers
-            SET is_verified = 1, current_status = 'available'
-            WHERE driver_id = ?
-        """, driver_id)
+        conn.prepare(VERIFY_DRIVER).execute(driver_id).close()
 
         conn.commit()
+        lookup_cache.invalidate(("driver", driver_id))
+        driver_index.set_available(driver_id, True)
+        location_ingestor.set_status(driver_id, 'available')
         return {"message": "Driver verified successfully", "new_status": "available"}
     finally:
         cursor.close()
 
 
 @app.post("/rides/{ride_id}/accept")
-def accept_ride(
+async def accept_ride(
     ride_id: int,
     driver: RideAccept,
-    token_data: TokenData = Security(verify_token, scopes=["driver"]),
-    conn = Depends(get_db_connection)
+    token_data: TokenData = Security(verify_token, scopes=["driver"])
 ):
     if driver.driver_id != token_data.user_id:
         raise HTTPException(403, "Cannot accept rides for another driver")
 
-    cursor = conn.cursor()
+    started = time.perf_counter()
+    if dispatcher.offered_to(ride_id, driver.driver_id) is False:
+        raise HTTPException(409, "Ride was not offered to this driver")
+    # Losers of a simultaneous accept are turned away here, before SQL Server
+    if not dispatcher.claim(ride_id, driver.driver_id):
+        raise HTTPException(409, "Ride has already been accepted")
     try:
-        cursor.execute("""
-            SELECT d.is_verified, d.current_status, v.vehicle_id
-            FROM drivers d
-            LEFT JOIN vehicles v ON d.driver_id = v.driver_id
-            WHERE d.driver_id = ?
-        """, driver.driver_id)
-
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(400, "Driver not found")
+        ride_details = await db.run(_accept_ride, ride_id, driver)
+    except HTTPException as e:
+        dispatcher.release(ride_id, driver.driver_id, conflict=e.status_code == 409)
+        raise
+    except Exception:
+        dispatcher.release(ride_id, driver.driver_id)
+        raise
+    dispatcher.confirm(ride_id, time.perf_counter() - started)
+    batch_matcher.remove(ride_id)
+    return ORJSONResponse(ride_details)
 
-        is_verified, current_status, vehicle_id = result
-        if not is_verified:
-            raise HTTPException(400, "Driver must be verified before accepting rides")
-        if current_status != 'available':
-            raise HTTPException(400, f"Driver is currently {current_status}")
-        if not vehicle_id:
-            raise HTTPException(400, "Driver has no registered vehicle")
-
-        cursor.execute("""
-            EXEC sp_accept_ride @ride_id = ?, @driver_id = ?
-        """, ride_id, driver.driver_id)
+# sp_accept_ride claims ride and driver with conditional UPDATEs; map its errors
+_ACCEPT_ERRORS = (
+    ("Ride not found", 404),
+    ("Ride is not in requested state", 409),
+    ("Driver not available or not verified", 400),
+    ("Driver has no registered vehicle", 400),
+)
 
-        columns = [column[0] for column in cursor.description]
-        ride_details = dict(zip(columns, cursor.fetchone()))
+def _accept_ride(conn, ride_id: int, driver: RideAccept):
+    cursor = conn.prepare(ACCEPT_RIDE)
+    try:
+        try:
+            cursor.execute(ride_id, driver.driver_id)
+        except pyodbc.DatabaseError as e:
+            conn.rollback()
+            error_msg = str(e)
+            for message, status_code in _ACCEPT_ERRORS:
+                if message in error_msg:
+                    raise HTTPException(status_code, message)
+            raise HTTPException(500, f"Database error: {error_msg}")
 
-        # convert coords
-        for loc in ['pickup', 'dropoff']:
-            ride_details[f"{loc}_lat"] = float(ride_details[f"{loc}_lat"])
-            ride_details[f"{loc}_lng"] = float(ride_details[f"{loc}_lng"])
+        # Coordinates come back as DECIMAL; the mapper converts them to float
+        ride_details = ACCEPTED_RIDE_ROW.one(cursor, cursor.fetchone())
 
         conn.commit()
+        lookup_cache.invalidate(("ride", ride_id), ("driver", driver.driver_id))
+        driver_index.set_available(driver.driver_id, False)
+        location_ingestor.set_status(driver.driver_id, 'on_ride')
+        _track_ride(driver.driver_id, ride_id)
+        trace_recorder.start(ride_id)
+        if ride_details.get("ride_type") == 'pool' and POOL_MATCHING:
+            # Later pool requests nearby can join this driver's route
+            pool_planner.open(driver.driver_id, ride_id,
+                              (ride_details["pickup_lat"], ride_details["pickup_lng"]),
+                              (ride_details["dropoff_lat"], ride_details["dropoff_lng"]),
+                              driver_index.position(driver.driver_id))
+        event_hub.publish_threadsafe(f"ride:{ride_id}", "ride.accepted", ride_id=ride_id, driver_id=driver.driver_id)
+        event_hub.publish_threadsafe(f"driver:{driver.driver_id}", "driver.status",
+                                     driver_id=driver.driver_id, current_status="on_ride", ride_id=ride_id)
         return ride_details
     finally:
         cursor.close()
@@ -410,46 +1517,90 @@ def accept_ride(
 
 
 @app.post("/rides/{ride_id}/complete")
-def complete_ride(
+async def complete_ride(
     ride_id: int, 
-    request: CompleteRideRequest, 
-    conn = Depends(get_db_connection)
+    request: CompleteRideRequest
 ):
+    return await db.run(_complete_ride, ride_id, request)
+
+def _complete_ride(conn, ride_id: int, request: CompleteRideRequest):
+    # One transaction, so the ride's stats are applied exactly when it completes
+    conn.autocommit = False
     cursor = conn.cursor()
     try:
-        # Verify ride exists and is in progress
+        # Distance and duration come from the recorded trace when it has a
+        # path; otherwise duration falls back to the accept time
+        trace = trace_recorder.snapshot(ride_id)
+        distance_km = duration_minutes = None
+        if trace is not None and trace[1] >= 2:
+            encoded, points, distance_km, duration_seconds = trace
+            distance_km = round(distance_km, 2)
+            duration_minutes = round(duration_seconds / 60)
+
+        # Only an accepted ride completes, and only once
         cursor.execute("""
-            SELECT driver_id 
-            FROM rides 
+            UPDATE rides
+            SET ride_status = 'completed',
+                completed_at = GETDATE(),
+                actual_fare = ?,
+                distance_km = COALESCE(?, distance_km),
+                duration_minutes = COALESCE(?, DATEDIFF(MINUTE, accepted_at, GETDATE()))
+            OUTPUT inserted.driver_id, inserted.rider_id
             WHERE ride_id = ? AND ride_status = 'accepted'
-        """, ride_id)
-        
-        if not cursor.fetchone():
+        """, (request.actual_fare, distance_km, duration_minutes, ride_id))
+
+        ride_row = cursor.fetchone()
+        if not ride_row:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Ride not found or not in completable state"
             )
+
+        if distance_km is not None:
+            cursor.execute("""
+                INSERT INTO ride_traces (ride_id, trace_format, encoded_trace, point_count, distance_km, duration_seconds)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, ride_id, TRACE_FORMAT, encoded, points, distance_km, duration_seconds)
         
-        # Update ride
-        cursor.execute("""
-            UPDATE rides
-            SET ride_status = 'completed',
-                completed_at = GETDATE(),
-                actual_fare = ?
-            WHERE ride_id = ?
-        """, (request.actual_fare, ride_id))
-        
-        # Update driver status
+        # Free the driver unless other riders of a pool route are still aboard
         cursor.execute("""
             UPDATE drivers
             SET current_status = 'available'
-            WHERE driver_id IN (
-                SELECT driver_id FROM rides WHERE ride_id = ?
+            WHERE driver_id = ?
+            AND NOT EXISTS (
+                SELECT 1 FROM rides
+                WHERE driver_id = ? AND ride_status IN ('accepted', 'arrived', 'in_progress')
             )
-        """, ride_id)
+        """, ride_row.driver_id, ride_row.driver_id)
+        freed = cursor.rowcount > 0
+
+        conn.prepare(RECORD_RIDE_STATS).execute(ride_id).close()
         
         conn.commit()
-        return {"message": "Ride completed successfully"}
+        lookup_cache.invalidate(("ride", ride_id), ("driver", ride_row.driver_id),
+                                ("driver_stats", ride_row.driver_id), ("rider_stats", ride_row.rider_id))
+        surge_engine.ride_closed(ride_id)
+        _untrack_ride(ride_row.driver_id, ride_id)
+        pool_planner.remove(ride_id)
+        trace_recorder.discard(ride_id)
+        dispatcher.close(ride_id)
+        event_hub.publish_threadsafe(f"ride:{ride_id}", "ride.completed", ride_id=ride_id,
+                                     driver_id=ride_row.driver_id, actual_fare=request.actual_fare,
+                                     distance_km=distance_km, duration_minutes=duration_minutes)
+        if freed:
+            driver_index.set_available(ride_row.driver_id, True)
+            location_ingestor.set_status(ride_row.driver_id, 'available')
+            event_hub.publish_threadsafe(f"driver:{ride_row.driver_id}", "driver.status",
+                                         driver_id=ride_row.driver_id, current_status="available")
+        else:
+            event_hub.publish_threadsafe(f"driver:{ride_row.driver_id}", "driver.pool_route",
+                                         driver_id=ride_row.driver_id,
+                                         stops=pool_planner.route_of(ride_row.driver_id) or [])
+        return {
+            "message": "Ride completed successfully",
+            "distance_km": distance_km,
+            "duration_minutes": duration_minutes
+        }
         
     except pyodbc.Error as e:
         conn.rollback()
@@ -459,46 +1610,50 @@ def complete_ride(
         )
     finally:
         cursor.close()
+        conn.autocommit = True
         
         
         
 @app.patch("/users/{user_id}", status_code=status.HTTP_200_OK)
-def update_user_profile(user_id: int, user: UserUpdate, conn = Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def update_user_profile(user_id: int, user: UserUpdate):
+    return await db.run(_update_user_profile, user_id, user)
+
+def _update_user_profile(conn, user_id: int, user: UserUpdate):
+    cursor = conn.prepare(UPDATE_USER_PROFILE)
     try:
-        cursor.execute("""
-            EXEC sp_update_user_profile
-                @user_id = ?, @email = ?, @phone_number = ?,
-                @first_name = ?, @last_name = ?, @profile_picture_url = ?
-        """, user_id, user.email, user.phone_number,
-           user.first_name, user.last_name, user.profile_picture_url)
+        cursor.execute(user_id, user.email, user.phone_number,
+                       user.first_name, user.last_name, user.profile_picture_url)
 
         result = cursor.fetchone()
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
 
         conn.commit()
-        columns = [col[0] for col in cursor.description]
-        return dict(zip(columns, result))
+        lookup_cache.invalidate(("user", user_id))
+        return PROFILE_ROW.one(cursor, result)
     except pyodbc.Error as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
         cursor.close()
 @app.put("/drivers/{driver_id}/status")
-def update_driver_status(driver_id: int, status_update: DriverStatusUpdate, conn = Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def update_driver_status(driver_id: int, status_update: DriverStatusUpdate):
+    return await db.run(_update_driver_status, driver_id, status_update)
+
+def _update_driver_status(conn, driver_id: int, status_update: DriverStatusUpdate):
+    cursor = conn.prepare(UPDATE_DRIVER_STATUS)
     try:
-        cursor.execute("""
-            UPDATE drivers 
-            SET current_status = ?
-            WHERE driver_id = ?
-        """, status_update.current_status, driver_id)
+        cursor.execute(status_update.current_status, driver_id)
 
-        if cursor.rowcount == 0:
+        updated = cursor.fetchone()
+        if not updated:
             raise HTTPException(status_code=404, detail="Driver not found")
 
         conn.commit()
+        lookup_cache.invalidate(("driver", driver_id))
+        # Unverified drivers never match, so they don't count as supply either
+        driver_index.set_available(driver_id, status_update.current_status == 'available' and updated.is_verified)
+        location_ingestor.set_status(driver_id, status_update.current_status)
         return {"driver_id": driver_id, "new_status": status_update.current_status}
     except pyodbc.Error as e:
         conn.rollback()
@@ -506,43 +1661,67 @@ def update_driver_status(driver_id: int, status_update: DriverStatusUpdate, conn
     finally:
         cursor.close()
 @app.patch("/rides/{ride_id}/cancel")
-def cancel_ride(ride_id: int, cancel_request: CancelRideRequest, conn = Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def cancel_ride(ride_id: int, cancel_request: CancelRideRequest):
+    return await db.run(_cancel_ride, ride_id, cancel_request)
+
+def _cancel_ride(conn, ride_id: int, cancel_request: CancelRideRequest):
+    conn.autocommit = False
+    cursor = conn.prepare(CANCEL_RIDE)
     try:
-        cursor.execute("""
-            UPDATE rides
-            SET ride_status = 'cancelled',
-                cancelled_by = ?,
-                cancel_reason = ?,
-                cancelled_at = GETDATE()
-            WHERE ride_id = ? AND ride_status IN ('requested','accepted')
-        """, cancel_request.cancelled_by, cancel_request.reason, ride_id)
+        cursor.execute(cancel_request.cancelled_by, cancel_request.reason, ride_id)
 
-        if cursor.rowcount == 0:
+        cancelled = cursor.fetchone()
+        if not cancelled:
             raise HTTPException(status_code=400, detail="Ride not found or cannot be cancelled")
 
+        conn.prepare(RECORD_RIDE_STATS).execute(ride_id).close()
+
         conn.commit()
+        lookup_cache.invalidate(("ride", ride_id), ("rider_stats", cancelled.rider_id))
+        if cancelled.driver_id is not None:
+            lookup_cache.invalidate(("driver_stats", cancelled.driver_id))
+        surge_engine.ride_closed(ride_id)
+        dispatcher.close(ride_id)
+        batch_matcher.remove(ride_id)
+        trace_recorder.discard(ride_id)
+        pool_planner.remove(ride_id)
+        if cancelled.driver_id is not None:
+            _untrack_ride(cancelled.driver_id, ride_id)
+        event_hub.publish_threadsafe(f"ride:{ride_id}", "ride.cancelled", ride_id=ride_id,
+                                     driver_id=cancelled.driver_id, cancelled_by=cancel_request.cancelled_by,
+                                     reason=cancel_request.reason)
         return {"message": f"Ride {ride_id} cancelled successfully"}
     except pyodbc.Error as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
         cursor.close()
+        conn.autocommit = True
         
 @app.put("/payments/{ride_id}")
-def update_payment_status(ride_id: int, payment: PaymentUpdate, conn = Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def update_payment_status(
+    ride_id: int,
+    payment: PaymentUpdate,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=MAX_KEY_LENGTH)
+):
+    if idempotency_key is None:
+        return await db.run(_update_payment_status, ride_id, payment)
+    return await idempotency_store.run(
+        f"payments:{ride_id}", idempotency_key,
+        IdempotencyStore.fingerprint(payment.model_dump_json()),
+        lambda: db.run(_update_payment_status, ride_id, payment)
+    )
+
+def _update_payment_status(conn, ride_id: int, payment: PaymentUpdate):
+    cursor = conn.prepare(UPDATE_PAYMENT_STATUS)
     try:
-        cursor.execute("""
-            UPDATE payments
-            SET payment_status = ?, updated_at = GETDATE()
-            WHERE ride_id = ?
-        """, payment.payment_status, ride_id)
+        cursor.execute(payment.payment_status, ride_id)
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Payment record not found")
 
         conn.commit()
+        lookup_cache.invalidate(("payment", ride_id))
         return {"ride_id": ride_id, "payment_status": payment.payment_status}
     except pyodbc.Error as e:
         conn.rollback()
@@ -551,95 +1730,129 @@ def update_payment_status(ride_id: int, payment: PaymentUpdate, conn = Depends(g
         cursor.close()
         
 @app.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, conn=Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def get_user(user_id: int):
+    # Cached rows are already JSON-ready; no response_model re-validation
+    return ORJSONResponse(await lookup_cache.get_or_load("user", user_id, lambda: db.run(_get_user, user_id)))
+
+def _get_user(conn, user_id: int):
+    cursor = conn.prepare(GET_USER)
     try:
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", user_id)
+        cursor.execute(user_id)
         user = cursor.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        columns = [col[0] for col in cursor.description]
-        return dict(zip(columns, user))
+        return USER_ROW.one(cursor, user)
     finally:
         cursor.close()
 @app.get("/drivers/{driver_id}")
-def get_driver(driver_id: int, conn=Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def get_driver(driver_id: int):
+    return ORJSONResponse(await lookup_cache.get_or_load("driver", driver_id, lambda: db.run(_get_driver, driver_id)))
+
+def _get_driver(conn, driver_id: int):
+    cursor = conn.prepare(GET_DRIVER)
     try:
-        cursor.execute("SELECT * FROM drivers WHERE driver_id = ?", driver_id)
+        cursor.execute(driver_id)
         driver = cursor.fetchone()
         if not driver:
             raise HTTPException(status_code=404, detail="Driver not found")
-        columns = [col[0] for col in cursor.description]
-        return dict(zip(columns, driver))
+        return DRIVER_ROW.one(cursor, driver)
     finally:
         cursor.close()
 @app.get("/rides/{ride_id}")
-def get_ride(ride_id: int, conn=Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def get_ride(ride_id: int):
+    return ORJSONResponse(await lookup_cache.get_or_load("ride", ride_id, lambda: db.run(_get_ride, ride_id)))
+
+def _get_ride(conn, ride_id: int):
+    cursor = conn.prepare(GET_RIDE)
     try:
-        cursor.execute("SELECT * FROM rides WHERE ride_id = ?", ride_id)
+        cursor.execute(ride_id)
         ride = cursor.fetchone()
         if not ride:
             raise HTTPException(status_code=404, detail="Ride not found")
-        columns = [col[0] for col in cursor.description]
-        return dict(zip(columns, ride))
+        return RIDE_ROW.one(cursor, ride)
     finally:
         cursor.close()
 
-@app.get("/users/{user_id}/rides/active")
-def get_active_rides(user_id: int, conn=Depends(get_db_connection)):
-    cursor = conn.cursor()
+# Encoded driver path; in-progress rides are served from the live recording
+@app.get("/rides/{ride_id}/trace")
+async def get_ride_trace(ride_id: int, token_data: TokenData = Security(verify_token)):
+    if not await _can_subscribe(token_data, "ride", ride_id):
+        raise HTTPException(status_code=403, detail="Cannot read another user's ride trace")
+    trace = trace_recorder.snapshot(ride_id)
+    if trace is None:
+        trace = await db.run(_get_ride_trace, ride_id)
+    encoded, points, distance_km, duration_seconds = trace
+    return Response(
+        content=encoded,
+        media_type="application/octet-stream",
+        headers={
+            "X-Trace-Format": TRACE_FORMAT,
+            "X-Trace-Points": str(points),
+            "X-Trace-Distance-Km": f"{distance_km:.3f}",
+            "X-Trace-Duration-Seconds": str(duration_seconds),
+        },
+    )
+
+def _get_ride_trace(conn, ride_id: int):
+    cursor = conn.prepare(GET_RIDE_TRACE)
     try:
-        cursor.execute("""
-            SELECT * FROM rides
-            WHERE rider_id = ? AND ride_status IN ('requested', 'accepted', 'in_progress')
-        """, user_id)
-        rides = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, r)) for r in rides]
+        cursor.execute(ride_id)
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return bytes(row.encoded_trace), row.point_count, float(row.distance_km), row.duration_seconds
     finally:
         cursor.close()
 
-@app.get("/users/{user_id}/rides/completed")
-def get_completed_rides(user_id: int, conn=Depends(get_db_connection)):
-    cursor = conn.cursor()
+@app.get("/users/{user_id}/rides/active")
+async def get_active_rides(user_id: int):
+    return ORJSONResponse(await db.run(_get_active_rides, user_id))
+
+def _get_active_rides(conn, user_id: int):
+    cursor = conn.prepare(GET_ACTIVE_RIDES)
     try:
-        cursor.execute("""
-            SELECT * FROM rides
-            WHERE rider_id = ? AND ride_status = 'completed'
-            ORDER BY completed_at DESC
-        """, user_id)
-        rides = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, r)) for r in rides]
+        cursor.execute(user_id)
+        return RIDE_ROW.all(cursor, cursor.fetchall())
     finally:
         cursor.close()
 
+@app.get("/users/{user_id}/rides/completed")
+async def get_completed_rides(
+    user_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    return await _list_response(
+        f"SELECT {RIDE_COLUMNS} FROM rides",
+        "rider_id = ? AND ride_status = 'completed'", [user_id],
+        ["completed_at", "ride_id"], (datetime, int), True, cursor, limit, format
+    )
+
 @app.get("/drivers/{driver_id}/rides")
-def get_driver_rides(driver_id: int, conn=Depends(get_db_connection)):
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            SELECT * FROM rides
-            WHERE driver_id = ?
-            ORDER BY requested_at DESC
-        """, driver_id)
-        rides = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, r)) for r in rides]
-    finally:
-        cursor.close()
+async def get_driver_rides(
+    driver_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    return await _list_response(
+        f"SELECT {RIDE_COLUMNS} FROM rides", "driver_id = ?", [driver_id],
+        ["requested_at", "ride_id"], (datetime, int), True, cursor, limit, format
+    )
+
 @app.get("/payments/{ride_id}")
-def get_payment_status(ride_id: int, conn=Depends(get_db_connection)):
-    cursor = conn.cursor()
+async def get_payment_status(ride_id: int):
+    return ORJSONResponse(await lookup_cache.get_or_load("payment", ride_id, lambda: db.run(_get_payment_status, ride_id)))
+
+def _get_payment_status(conn, ride_id: int):
+    cursor = conn.prepare(GET_PAYMENT)
     try:
-        cursor.execute("SELECT * FROM payments WHERE ride_id = ?", ride_id)
+        cursor.execute(ride_id)
         payment = cursor.fetchone()
         if not payment:
             raise HTTPException(status_code=404, detail="Payment record not found")
-        columns = [col[0] for col in cursor.description]
-        return dict(zip(columns, payment))
+        return PAYMENT_ROW.one(cursor, payment)
     finally:
         cursor.close()
 
@@ -656,4 +1869,319 @@ def test_db(conn = Depends(get_db_connection)):
     cursor = conn.cursor()
     cursor.execute("SELECT 1 AS test")
     result = cursor.fetchone()
-    return {"database_connection": "successful" if result else "failed"}
\ No newline at end of file
+    return {"database_connection": "successful" if result else "failed"}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/db/pool")
+def db_pool_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return {**pool.stats(), "executor": db.stats()}
+
+@app.get("/db/statements")
+async def db_statement_stats(
+    server: bool = False,
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    stats = statement_registry.stats()
+    if server:
+        stats["plan_cache"] = await db.run(_plan_cache_stats)
+    return stats
+
+def _plan_cache_stats(conn):
+    # Needs VIEW SERVER STATE; reported as an error rather than failing the call
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT OBJECT_NAME(ps.object_id, ps.database_id), ps.execution_count, cp.usecounts,
+                   ps.cached_time, ps.total_elapsed_time / NULLIF(ps.execution_count, 0)
+            FROM sys.dm_exec_procedure_stats ps
+            JOIN sys.dm_exec_cached_plans cp ON cp.plan_handle = ps.plan_handle
+            WHERE ps.database_id = DB_ID()
+        """)
+        procedures = {
+            name: {"executions": executions, "plan_uses": uses, "cached_at": cached_at,
+                   "avg_elapsed_us": avg_elapsed}
+            for name, executions, uses, cached_at, avg_elapsed in cursor.fetchall()
+        }
+        cursor.execute("""
+            SELECT cp.objtype, COUNT(*), SUM(CAST(cp.size_in_bytes AS BIGINT)),
+                   SUM(CASE WHEN cp.usecounts = 1 THEN 1 ELSE 0 END), SUM(CAST(cp.usecounts AS BIGINT))
+            FROM sys.dm_exec_cached_plans cp
+            CROSS APPLY sys.dm_exec_sql_text(cp.plan_handle) st
+            WHERE st.dbid = DB_ID()
+            GROUP BY cp.objtype
+        """)
+        plans = {
+            objtype: {"plans": count, "bytes": size, "single_use": single_use, "uses": uses}
+            for objtype, count, size, single_use, uses in cursor.fetchall()
+        }
+        return {"procedures": procedures, "plans": plans}
+    except pyodbc.Error as e:
+        return {"error": str(e)}
+    finally:
+        cursor.close()
+
+@app.get("/surge")
+def get_surge(latitude: float, longitude: float):
+    return surge_engine.zone(latitude, longitude)
+
+@app.get("/surge/zones")
+def list_surge_zones(
+    limit: int = 50,
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    return {**surge_engine.stats(), "zones": surge_engine.hot_zones(limit)}
+
+# Real-time updates: WebSocket, with Server-Sent Events as the fallback
+def _authenticate_stream(token: str):
+    try:
+        return verify_token(SecurityScopes(), token)
+    except HTTPException:
+        return None
+
+async def _can_subscribe(token_data: TokenData, kind: str, key: int) -> bool:
+    # ride:{id} is for the ride's rider and assigned driver, driver:{id} for
+    # that driver; admins may follow either
+    if token_data.role == "admin":
+        return True
+    if kind == "driver":
+        return token_data.user_id == key
+    try:
+        ride = await lookup_cache.get_or_load("ride", key, lambda: db.run(_get_ride, key))
+    except HTTPException:
+        return False
+    return token_data.user_id in (ride["rider_id"], ride["driver_id"])
+
+async def _stream_websocket(websocket: WebSocket, kind: str, key: int, token: str):
+    # Browsers can't set headers on a WebSocket handshake, so the token rides in the query string
+    token_data = _authenticate_stream(token)
+    if token_data is None or not await _can_subscribe(token_data, kind, key):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    subscription = event_hub.subscribe(f"{kind}:{key}")
+    try:
+        while True:
+            try:
+                payload = await subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                payload = '{"type": "heartbeat"}'
+            await websocket.send_text(payload)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        subscription.close()
+
+async def _stream_sse(request: Request, topic: str):
+    subscription = event_hub.subscribe(topic)
+    try:
+        yield b"retry: 3000\n\n"
+        while not await request.is_disconnected():
+            try:
+                payload = await subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            yield f"data: {payload}\n\n".encode()
+    finally:
+        subscription.close()
+
+@app.websocket("/ws/rides/{ride_id}")
+async def ride_updates_ws(websocket: WebSocket, ride_id: int, token: str = ""):
+    await _stream_websocket(websocket, "ride", ride_id, token)
+
+@app.websocket("/ws/drivers/{driver_id}")
+async def driver_updates_ws(websocket: WebSocket, driver_id: int, token: str = ""):
+    await _stream_websocket(websocket, "driver", driver_id, token)
+
+@app.get("/rides/{ride_id}/events")
+async def ride_updates_sse(
+    ride_id: int,
+    request: Request,
+    token_data: TokenData = Security(verify_token)
+):
+    if not await _can_subscribe(token_data, "ride", ride_id):
+        raise HTTPException(status_code=403, detail="Cannot follow another user's ride")
+    return StreamingResponse(_stream_sse(request, f"ride:{ride_id}"), media_type="text/event-stream")
+
+@app.get("/drivers/{driver_id}/events")
+async def driver_updates_sse(
+    driver_id: int,
+    request: Request,
+    token_data: TokenData = Security(verify_token)
+):
+    if not await _can_subscribe(token_data, "driver", driver_id):
+        raise HTTPException(status_code=403, detail="Cannot follow another driver")
+    return StreamingResponse(_stream_sse(request, f"driver:{driver_id}"), media_type="text/event-stream")
+
+@app.get("/drivers/{driver_id}/offers")
+def get_driver_offers(
+    driver_id: int,
+    token_data: TokenData = Security(verify_token, scopes=["driver"])
+):
+    if driver_id != token_data.user_id:
+        raise HTTPException(403, "Cannot view offers for another driver")
+    return {"driver_id": driver_id, "ride_ids": dispatcher.offers_for(driver_id)}
+
+@app.get("/drivers/{driver_id}/pool-route")
+def get_driver_pool_route(
+    driver_id: int,
+    token_data: TokenData = Security(verify_token, scopes=["driver"])
+):
+    if driver_id != token_data.user_id:
+        raise HTTPException(403, "Cannot view the route of another driver")
+    return {"driver_id": driver_id, "stops": pool_planner.route_of(driver_id) or []}
+
+@app.get("/dispatch/stats")
+def dispatch_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return {**dispatcher.stats(), "batch": batch_matcher.stats() if BATCH_MATCHING else None}
+
+@app.get("/events/stats")
+def event_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return event_hub.stats()
+
+@app.get("/idempotency/stats")
+def idempotency_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return idempotency_store.stats()
+
+@app.get("/cache/stats")
+def cache_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return {**lookup_cache.stats(), "auth": token_cache_stats()}
+
+@app.get("/routing/stats")
+def routing_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    if routing_engine is None:
+        raise HTTPException(status_code=404, detail="Routing is not enabled (set ROUTING_GRAPH_DIR)")
+    return routing_engine.stats()
+
+@app.get("/pool/stats")
+def pool_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return pool_planner.stats()
+
+_RATING_ERRORS = (
+    ("Ride is not completed", 400),
+    ("Ride already rated", 409),
+)
+
+@app.post("/rides/{ride_id}/rating", status_code=status.HTTP_201_CREATED)
+async def rate_ride(
+    ride_id: int,
+    rating: RideRating,
+    token_data: TokenData = Security(verify_token)
+):
+    # The ride's rider rates its driver and the driver rates the rider
+    ride = await lookup_cache.get_or_load("ride", ride_id, lambda: db.run(_get_ride, ride_id))
+    if token_data.user_id == ride["rider_id"]:
+        rated_by = "rider"
+    elif token_data.user_id == ride["driver_id"]:
+        rated_by = "driver"
+    else:
+        raise HTTPException(status_code=403, detail="Only the ride's rider or driver can rate it")
+    if rating.rated_by not in (None, rated_by):
+        raise HTTPException(status_code=403, detail=f"Caller can only rate as the {rated_by}")
+    rating.rated_by = rated_by
+    return await db.run(_rate_ride, ride_id, rating)
+
+def _rate_ride(conn, ride_id: int, rating: RideRating):
+    cursor = conn.prepare(RATE_RIDE)
+    try:
+        try:
+            cursor.execute(ride_id, rating.rated_by, rating.rating)
+        except pyodbc.DatabaseError as e:
+            conn.rollback()
+            error_msg = str(e)
+            for message, status_code in _RATING_ERRORS:
+                if message in error_msg:
+                    raise HTTPException(status_code, message)
+            raise HTTPException(500, f"Database error: {error_msg}")
+        row = cursor.fetchone()
+        conn.commit()
+        if rating.rated_by == "rider":
+            lookup_cache.invalidate(("driver_stats", row.driver_id), ("driver", row.driver_id))
+        else:
+            lookup_cache.invalidate(("rider_stats", row.rider_id))
+        return {"ride_id": ride_id, "rated_by": rating.rated_by, "rating": rating.rating}
+    finally:
+        cursor.close()
+
+# Running totals per driver / rider: one primary-key read, cached like the lookups
+@app.get("/drivers/{driver_id}/stats")
+async def get_driver_stats(driver_id: int):
+    return ORJSONResponse(await lookup_cache.get_or_load(
+        "driver_stats", driver_id, lambda: db.run(_get_user_stats, GET_DRIVER_STATS, driver_id, "Driver")))
+
+@app.get("/riders/{rider_id}/stats")
+async def get_rider_stats(rider_id: int):
+    return ORJSONResponse(await lookup_cache.get_or_load(
+        "rider_stats", rider_id, lambda: db.run(_get_user_stats, GET_RIDER_STATS, rider_id, "Rider")))
+
+def _get_user_stats(conn, statement, user_id: int, kind: str):
+    cursor = conn.prepare(statement)
+    try:
+        cursor.execute(user_id)
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail=f"{kind} not found")
+        return _with_average(STATS_ROW.one(cursor, row))
+    finally:
+        cursor.close()
+
+def _with_average(stats: dict) -> dict:
+    stats["average_rating"] = round(stats["rating_sum"] / stats["rating_count"], 2) if stats["rating_count"] else None
+    return stats
+
+# Platform totals for the current hour and day, read from the rollups
+@app.get("/stats/summary")
+async def get_stats_summary(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return ORJSONResponse(await db.run(_get_stats_summary))
+
+def _get_stats_summary(conn):
+    cursor = conn.prepare(GET_CURRENT_ROLLUPS)
+    try:
+        cursor.execute()
+        rows = {r["granularity"]: _with_average(r) for r in ROLLUP_ROW.all(cursor, cursor.fetchall())}
+        return {"hour": rows.get("H"), "day": rows.get("D")}
+    finally:
+        cursor.close()
+
+@app.get("/stats/rollups")
+async def list_stats_rollups(
+    granularity: str = Query("hour", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(168, ge=1, le=1000),
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    # [start, end) buckets, oldest first; start defaults to `limit` buckets before end
+    end = end or datetime.now()
+    start = start or end - (timedelta(hours=limit) if granularity == "hour" else timedelta(days=limit))
+    return ORJSONResponse(await db.run(_list_stats_rollups, granularity[0].upper(), start, end, limit))
+
+def _list_stats_rollups(conn, granularity: str, start: datetime, end: datetime, limit: int):
+    cursor = conn.prepare(LIST_ROLLUPS)
+    try:
+        cursor.execute(limit, granularity, start, end)
+        return [_with_average(r) for r in ROLLUP_ROW.all(cursor, cursor.fetchall())]
+    finally:
+        cursor.close()
+
+@app.get("/stats/backfill")
+def ride_stats_backfill_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return ride_stats_backfill.stats()
+
+@app.post("/stats/backfill")
+async def run_ride_stats_backfill(
+    since: Optional[date] = None,
+    token_data: TokenData = Security(verify_token, scopes=["admin"])
+):
+    # Long-running; kept off the request executor's workers
+    try:
+        return await asyncio.to_thread(ride_stats_backfill.run_once, since)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/matching/stats")
+def matching_stats(token_data: TokenData = Security(verify_token, scopes=["admin"])):
+    return driver_index.stats()
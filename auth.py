@@ -1,14 +1,31 @@
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
 from pydantic import BaseModel
 from fastapi import Depends, HTTPException, status, Security
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
+from collections import OrderedDict
+from dotenv import load_dotenv
+import hashlib
 import os
+import threading
+import time
+import uuid
+
+load_dotenv()
 
 # Config
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+ACCESS_TOKEN_EXPIRE_DELTA = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+
+# Role -> scopes granted at login
+ROLE_SCOPES = {
+    "rider": ["rider"],
+    "driver": ["driver"],
+    "admin": ["admin"]
+}
 
 # Define scopes
 oauth2_scheme = OAuth2PasswordBearer(
@@ -32,42 +49,119 @@ class TokenData(BaseModel):
     role: str
     scopes: list[str] = []
 
+# Keys are parsed once at startup. HS* uses SECRET_KEY; RS*/PS*/ES* read PEM
+# files from JWT_PRIVATE_KEY_FILE (signing) and JWT_PUBLIC_KEY_FILE (verifying).
+def _load_keys():
+    if ALGORITHM.startswith("HS"):
+        key = jwk.construct(SECRET_KEY, ALGORITHM)
+        return key, key
+    signing_key = None
+    private_path = os.getenv("JWT_PRIVATE_KEY_FILE")
+    if private_path:
+        with open(private_path) as f:
+            signing_key = jwk.construct(f.read(), ALGORITHM)
+    public_path = os.getenv("JWT_PUBLIC_KEY_FILE")
+    if not public_path:
+        raise RuntimeError(f"JWT_PUBLIC_KEY_FILE is required for {ALGORITHM}")
+    with open(public_path) as f:
+        verify_key = jwk.construct(f.read(), ALGORITHM)
+    return signing_key, verify_key
+
+SIGNING_KEY, VERIFY_KEY = _load_keys()
+
+# Verified tokens keyed by SHA-256 of the raw token: (TokenData, scope set, exp, jti)
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+# Revoked token ids -> their exp, so the set can be pruned
+_revoked = {}
+
 # Create JWT token
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    if SIGNING_KEY is None:
+        raise RuntimeError("JWT_PRIVATE_KEY_FILE is required to issue tokens")
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    expire = datetime.utcnow() + (expires_delta or ACCESS_TOKEN_EXPIRE_DELTA)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    return jwt.encode(to_encode, SIGNING_KEY, algorithm=ALGORITHM)
+
+def _decode(token: str):
+    digest = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        entry = _token_cache.get(digest)
+        if entry is not None:
+            _token_cache.move_to_end(digest)
+    if entry is not None:
+        if entry[2] > time.time():
+            return entry
+        with _token_cache_lock:
+            _token_cache.pop(digest, None)
+        raise JWTError("Signature has expired.")
+
+    payload = jwt.decode(token, VERIFY_KEY, algorithms=[ALGORITHM])
+    user_id = payload.get("user_id")
+    email = payload.get("email")
+    role = payload.get("role")
+    if user_id is None or email is None or role is None:
+        return None
+
+    scopes = payload.get("scopes", [])
+    token_data = TokenData(user_id=user_id, email=email, role=role, scopes=scopes)
+    entry = (token_data, frozenset(scopes), payload.get("exp", float("inf")), payload.get("jti"))
+    with _token_cache_lock:
+        _token_cache[digest] = entry
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return entry
 
 # Verify JWT token and enforce scopes
 def verify_token(security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)) -> TokenData:
-    auth_error = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": f'Bearer scope="{security_scopes.scope_str}"'},
-    )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("user_id")
-        email: str = payload.get("email")
-        role: str = payload.get("role")
-        scopes: list[str] = payload.get("scopes", [])
-
-        if user_id is None or email is None or role is None:
-            raise auth_error
-
-        token_data = TokenData(user_id=user_id, email=email, role=role, scopes=scopes)
-
-        # ✅ Check required scopes
-        for scope in security_scopes.scopes:
-            if scope not in token_data.scopes:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Missing required scope: {scope}"
-                )
-        return token_data
+        entry = _decode(token)
+    except JWTError:
+        entry = None
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": f'Bearer scope="{security_scopes.scope_str}"'},
+        )
+
+    token_data, token_scopes, _, jti = entry
+    if jti is not None and jti in _revoked:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # ✅ Check required scopes
+    if not token_scopes.issuperset(security_scopes.scopes):
+        missing = next(scope for scope in security_scopes.scopes if scope not in token_scopes)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Missing required scope: {missing}"
+        )
+    return token_data
+
+# Revoke a token until it would have expired anyway
+def revoke_token(token: str):
+    try:
+        _, _, exp, jti = _decode(token) or (None, None, None, None)
     except JWTError:
-        raise auth_error
+        return False
+    if jti is None:
+        return False
+    now = time.time()
+    with _token_cache_lock:
+        for revoked_jti, revoked_exp in list(_revoked.items()):
+            if revoked_exp <= now:
+                del _revoked[revoked_jti]
+        _revoked[jti] = exp
+    return True
+
+def token_cache_stats() -> dict:
+    return {"cached_tokens": len(_token_cache), "revoked_tokens": len(_revoked)}
+
 # Role-based authorization (helper)
 def require_role(required_role: str):
     def role_checker(token_data: TokenData = Security(verify_token, scopes=[required_role])):
@@ -0,0 +1,45 @@
+# Per-request cost of token verification: cold decode vs cached fast path.
+#   python benchmarks/bench_auth.py [iterations]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.security import SecurityScopes
+
+import auth
+
+
+def bench(label, fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed / iterations * 1e6:9.2f} us/op  {iterations / elapsed:12,.0f} ops/s")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    scopes = SecurityScopes(scopes=["rider"])
+    tokens = [
+        auth.create_access_token({"user_id": i, "email": f"user{i}@example.com", "role": "rider", "scopes": ["rider"]})
+        for i in range(iterations)
+    ]
+    hot = tokens[0]
+
+    print(f"algorithm={auth.ALGORITHM} iterations={iterations}")
+    bench("create_access_token", lambda: auth.create_access_token(
+        {"user_id": 1, "email": "user1@example.com", "role": "rider", "scopes": ["rider"]}), iterations // 10)
+
+    remaining = iter(tokens[1:])
+    bench("verify_token (cold, jwt.decode)", lambda: auth.verify_token(scopes, next(remaining)), iterations - 2)
+    bench("verify_token (cached)", lambda: auth.verify_token(scopes, hot), iterations)
+
+    auth._token_cache.clear()
+    bench("jwt.decode only", lambda: auth.jwt.decode(hot, auth.VERIFY_KEY, algorithms=[auth.ALGORITHM]), iterations)
+
+
+if __name__ == "__main__":
+    main()
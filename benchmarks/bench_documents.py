@@ -0,0 +1,125 @@
+# Document uploads: streams multipart bodies carrying phone-camera sized
+# JPEG scans through DocumentStore.read_form and DocumentProcessor, against a
+# baseline that buffers each body and decodes/thumbnails it on the event loop.
+# Reports uploads/s, peak Python memory in the API process, the longest
+# event-loop stall while uploads run, and re-upload (dedup) cost.
+#   python benchmarks/bench_documents.py [uploads] [concurrency] [workers]
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from documents import DocumentProcessor, DocumentStore, process_document
+
+BOUNDARY = "----bench-boundary"
+CHUNK = 64 * 1024
+
+
+def scan(seed):
+    rng = random.Random(seed)
+    image = Image.effect_noise((3264, 2448), 40).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(3000), rng.randrange(2200)
+        draw.rectangle((x, y, x + rng.randrange(50, 400), y + rng.randrange(20, 120)),
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def body(front):
+    parts = []
+    for name, value in (("document_type", "license"), ("document_number", "KA0120240001234")):
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="front"; filename="front.jpg"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode() + front + b"\r\n")
+    parts.append(f"--{BOUNDARY}--\r\n".encode())
+    return b"".join(parts)
+
+
+async def stream(data):
+    for i in range(0, len(data), CHUNK):
+        yield data[i:i + CHUNK]
+        await asyncio.sleep(0)
+
+
+async def watch_loop(stalls, stop):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.005)
+        now = time.perf_counter()
+        stalls.append(now - last - 0.005)
+        last = now
+
+
+async def run(bodies, concurrency, handle):
+    stalls, stop = [], asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stalls, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(data):
+        async with semaphore:
+            await handle(data)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(b) for b in bodies))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    await watcher
+    return (f"{len(bodies) / elapsed:7.1f} uploads/s  peak {peak / 2**20:7.1f} MiB  "
+            f"max loop stall {max(stalls, default=0) * 1000:7.1f} ms")
+
+
+async def main():
+    uploads = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+    bodies = [body(scan(i)) for i in range(uploads)]
+    print(f"{uploads} uploads of {sum(map(len, bodies)) / len(bodies) / 2**20:.2f} MiB, concurrency {concurrency}")
+
+    with tempfile.TemporaryDirectory() as root:
+        derived = os.path.join(root, "inline")
+        os.makedirs(derived)
+
+        async def buffered_inline(data):
+            received = b"".join([chunk async for chunk in stream(data)])
+            start = received.index(b"\r\n\r\n", received.index(b'name="front"')) + 4
+            path = os.path.join(derived, f"{id(received)}.jpg")
+            with open(path, "wb") as f:
+                f.write(received[start:received.rindex(b"\r\n--")])
+            process_document(path, derived, str(id(received)), 600, 2048, 320, 40_000_000)
+
+        print(f"buffered, inline     {await run(bodies, concurrency, buffered_inline)}")
+
+        store = DocumentStore(os.path.join(root, "store"), max_uploads=concurrency)
+        store.open()
+        processor = DocumentProcessor(store, workers=workers, max_pending=concurrency)
+        processor.start()
+        try:
+            async def streamed(data):
+                _, files = await store.read_form(stream(data), f"multipart/form-data; boundary={BOUNDARY}",
+                                                 ("front",))
+                await processor.process(files["front"])
+
+            print(f"streamed, {workers} workers {await run(bodies, concurrency, streamed)}")
+            print(f"re-upload (dedup)    {await run(bodies, concurrency, streamed)}")
+            print(store.stats())
+            print(processor.stats())
+        finally:
+            processor.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
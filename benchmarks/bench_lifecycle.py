@@ -0,0 +1,299 @@
+# Ride lifecycle load test: register -> login -> location pings -> request ride
+# -> accept -> pings -> complete (or cancel) -> payment update, across a
+# population of riders and drivers, reporting throughput and p50/p95/p99
+# latency per endpoint.
+#
+#   python benchmarks/bench_lifecycle.py                      # in-process ASGI, fake data layer
+#   python benchmarks/bench_lifecycle.py --mode http          # same, through uvicorn on localhost
+#   python benchmarks/bench_lifecycle.py --url http://host:8000 --admin-token ...   # a real deployment
+#
+# With the fake data layer (benchmarks/fake_db.py) the numbers are the API's
+# own overhead: pool, executor, matching, write-behind and serialization.
+# --db-latency-ms adds a per-statement delay to approximate a database hop.
+# Needs httpx (and uvicorn for --mode http) on top of the app requirements.
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+CITY_CENTER = (12.9716, 77.5946)
+CITY_SPREAD = 0.05      # degrees around the centre
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}       # label -> [latency seconds]
+        self.errors = {}        # label -> {status: count}
+
+    async def call(self, client, method, label, url, expect=(200, 201, 204), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.samples.setdefault(label, []).append(time.perf_counter() - started)
+        if status not in expect:
+            counts = self.errors.setdefault(label, {})
+            counts[status] = counts.get(status, 0) + 1
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for label, samples in sorted(self.samples.items()):
+            samples.sort()
+            pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 3)
+            endpoints[label] = {
+                "count": len(samples),
+                "errors": self.errors.get(label, {}),
+                "throughput_rps": round(len(samples) / elapsed, 1),
+                "p50_ms": pick(0.50),
+                "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99),
+                "max_ms": round(samples[-1] * 1000, 3),
+            }
+        total = sum(e["count"] for e in endpoints.values())
+        return {"elapsed_s": round(elapsed, 3), "requests": total,
+                "throughput_rps": round(total / elapsed, 1), "endpoints": endpoints}
+
+
+def print_report(title, report):
+    print(f"\n{title}: {report['requests']} requests in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s)")
+    print(f"{'endpoint':<34}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for label, e in report["endpoints"].items():
+        errors = sum(e["errors"].values())
+        print(f"{label:<34}{e['count']:>7}{errors:>8}{e['throughput_rps']:>9}"
+              f"{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}{e['max_ms']:>9}")
+        if errors:
+            print(f"{'':<34}  {e['errors']}")
+
+
+def _near(lat, lng, spread):
+    return lat + random.uniform(-spread, spread), lng + random.uniform(-spread, spread)
+
+
+async def _gather_limited(concurrency, coroutines):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(c) for c in coroutines))
+
+
+async def setup_population(client, rec, args, admin_headers):
+    run_id = uuid.uuid4().hex[:8]
+
+    def user(kind, i):
+        return {
+            "email": f"{kind}{i}-{run_id}@bench.local", "phone_number": f"{run_id}{kind[0]}{i:06d}",
+            "password_hash": f"secret-{kind}-{i}", "first_name": kind.title(), "last_name": str(i),
+            "user_type": kind,
+        }
+
+    people = [user("rider", i) for i in range(args.riders)] + [user("driver", i) for i in range(args.drivers)]
+    created = await _gather_limited(args.concurrency, [
+        rec.call(client, "POST", "POST /users", "/users", json=p) for p in people
+    ])
+    tokens = await _gather_limited(args.concurrency, [
+        rec.call(client, "POST", "POST /users/login", "/users/login",
+                 data={"username": p["email"], "password": p["password_hash"]})
+        for p in people
+    ])
+
+    riders, drivers = [], []
+    for p, created_response, token_response in zip(people, created, tokens):
+        if created_response is None or token_response is None or token_response.status_code != 200:
+            continue
+        entry = {
+            "id": created_response.json()["user_id"],
+            "headers": {"Authorization": f"Bearer {token_response.json()['access_token']}"},
+        }
+        (riders if p["user_type"] == "rider" else drivers).append(entry)
+
+    # Drivers come online near the centre, then get verified
+    for driver in drivers:
+        driver["position"] = _near(*CITY_CENTER, CITY_SPREAD)
+    await _gather_limited(args.concurrency, [
+        rec.call(client, "POST", "POST /drivers/{id}/location", f"/drivers/{d['id']}/location",
+                 json={"latitude": d["position"][0], "longitude": d["position"][1]})
+        for d in drivers
+    ])
+    await _gather_limited(args.concurrency, [
+        rec.call(client, "POST", "POST /drivers/{id}/verify", f"/drivers/{d['id']}/verify", headers=admin_headers)
+        for d in drivers
+    ])
+    return riders, {d["id"]: d for d in drivers}
+
+
+async def ride_lifecycle(client, rec, args, rider, drivers):
+    pickup = _near(*CITY_CENTER, CITY_SPREAD)
+    dropoff = _near(*pickup, 0.03)
+    response = await rec.call(client, "POST", "POST /rides/", "/rides/", headers=rider["headers"], json={
+        "rider_id": rider["id"],
+        "pickup_location": {"latitude": pickup[0], "longitude": pickup[1]},
+        "dropoff_location": {"latitude": dropoff[0], "longitude": dropoff[1]},
+        "pickup_address": "Bench pickup", "dropoff_address": "Bench dropoff",
+        "ride_type": "pool" if random.random() < args.pool_rate else "standard",
+    })
+    if response is None or response.status_code != 201:
+        return
+    body = response.json()
+    ride_id = body["ride"]["ride_id"]
+
+    if random.random() < args.cancel_rate:
+        await rec.call(client, "PATCH", "PATCH /rides/{id}/cancel", f"/rides/{ride_id}/cancel",
+                       json={"cancelled_by": "rider", "reason": "bench"})
+        return
+
+    if body.get("pool") is not None:
+        # Inserted into a pool vehicle's route; no offer round
+        winner = body["pool"]["driver_id"]
+    else:
+        # Offered drivers race for the ride, as they would from their apps
+        candidates = [d["driver_id"] for d in body["matched_drivers"][:args.offer_fanout] if d["driver_id"] in drivers]
+        accepts = await asyncio.gather(*(
+            rec.call(client, "POST", "POST /rides/{id}/accept", f"/rides/{ride_id}/accept",
+                     expect=(200, 400, 409), headers=drivers[d]["headers"], json={"driver_id": d})
+            for d in candidates
+        ))
+        winner = next((d for d, r in zip(candidates, accepts) if r is not None and r.status_code == 200), None)
+    if winner is None:
+        await rec.call(client, "PATCH", "PATCH /rides/{id}/cancel", f"/rides/{ride_id}/cancel",
+                       json={"cancelled_by": "rider", "reason": "no driver"})
+        return
+
+    driver = drivers[winner]
+    for step in range(1, args.pings + 1):
+        lat = pickup[0] + (dropoff[0] - pickup[0]) * step / args.pings
+        lng = pickup[1] + (dropoff[1] - pickup[1]) * step / args.pings
+        driver["position"] = (lat, lng)
+        await rec.call(client, "POST", "POST /drivers/{id}/location", f"/drivers/{winner}/location",
+                       json={"latitude": lat, "longitude": lng})
+        if args.ping_interval:
+            await asyncio.sleep(args.ping_interval)
+
+    await rec.call(client, "POST", "POST /rides/{id}/complete", f"/rides/{ride_id}/complete",
+                   json={"actual_fare": body["ride"].get("estimated_fare") or 100.0})
+    await rec.call(client, "PUT", "PUT /payments/{id}", f"/payments/{ride_id}", json={"payment_status": "paid"})
+
+
+async def run_rides(client, rec, args, riders, drivers):
+    queue = asyncio.Queue()
+    for i in range(args.rides):
+        queue.put_nowait(riders[i % len(riders)])
+
+    async def worker():
+        while True:
+            try:
+                rider = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await ride_lifecycle(client, rec, args, rider, drivers)
+
+    await asyncio.gather(*(worker() for _ in range(min(args.concurrency, args.rides))))
+
+
+async def bench(args, base_url, transport, admin_headers):
+    setup_rec, rides_rec = Recorder(), Recorder()
+    timeout = httpx.Timeout(60.0)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        riders, drivers = await setup_population(client, setup_rec, args, admin_headers)
+        setup = setup_rec.report(time.perf_counter() - started)
+        if not riders or not drivers:
+            print_report("setup", setup)
+            raise SystemExit("Setup failed: no riders or drivers could log in")
+
+        started = time.perf_counter()
+        await run_rides(client, rides_rec, args, riders, drivers)
+        lifecycle = rides_rec.report(time.perf_counter() - started)
+    return setup, lifecycle
+
+
+async def main_async(args):
+    if args.url:
+        headers = {"Authorization": f"Bearer {args.admin_token}"} if args.admin_token else {}
+        return await bench(args, args.url, None, headers)
+
+    # Fake data layer: swap the pool's connection factory before the app starts
+    os.environ.setdefault("PASSWORD_BCRYPT_ROUNDS", str(args.bcrypt_rounds))
+    os.environ.setdefault("LOGIN_IP_BURST", "1000000")
+    os.environ.setdefault("LOGIN_IP_RATE", "1000000")
+    os.environ.setdefault("LOCATION_MAINTENANCE_INTERVAL", "0")
+    from fake_db import FakeDatabase
+    import app as service
+    from statements import PreparedConnection
+    from auth import create_access_token
+
+    fake = FakeDatabase(latency=args.db_latency_ms / 1000)
+    service.pool._factory = lambda: PreparedConnection(service.metrics.instrument(fake.connect()))
+    admin_headers = {"Authorization": "Bearer " + create_access_token(
+        {"user_id": 0, "email": "bench-admin@bench.local", "role": "admin", "scopes": ["admin"]})}
+
+    if args.mode == "asgi":
+        async with service.app.router.lifespan_context(service.app):
+            result = await bench(args, "http://bench", httpx.ASGITransport(app=service.app), admin_headers)
+    else:
+        import uvicorn
+
+        server = uvicorn.Server(uvicorn.Config(service.app, host="127.0.0.1", port=args.port, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            if serving.done():
+                serving.result()
+            await asyncio.sleep(0.05)
+        try:
+            result = await bench(args, f"http://127.0.0.1:{args.port}", None, admin_headers)
+        finally:
+            server.should_exit = True
+            await serving
+    print(f"\nfake db: {fake.statements} statements, {len(fake.rides)} rides, "
+          f"{fake.history_rows} location rows written")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ride lifecycle load test")
+    parser.add_argument("--mode", choices=("asgi", "http"), default="asgi")
+    parser.add_argument("--url", help="benchmark a running deployment instead of the in-process app")
+    parser.add_argument("--admin-token", help="admin bearer token for --url (driver verification)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--riders", type=int, default=200)
+    parser.add_argument("--drivers", type=int, default=100)
+    parser.add_argument("--rides", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pings", type=int, default=3, help="driver location pings per ride")
+    parser.add_argument("--ping-interval", type=float, default=0.0)
+    parser.add_argument("--offer-fanout", type=int, default=2, help="offered drivers that try to accept")
+    parser.add_argument("--cancel-rate", type=float, default=0.1)
+    parser.add_argument("--pool-rate", type=float, default=0.0, help="share of rides requested as pool")
+    parser.add_argument("--db-latency-ms", type=float, default=0.5)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    setup, lifecycle = asyncio.run(main_async(args))
+    print_report("setup (register, login, go online, verify)", setup)
+    print_report("ride lifecycle", lifecycle)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "setup": setup, "lifecycle": lifecycle}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
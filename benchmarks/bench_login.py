@@ -0,0 +1,49 @@
+# Login throughput: bcrypt verifications per second for one core, then through
+# the PasswordHasher process pool at the configured worker count.
+#   python benchmarks/bench_login.py [logins] [workers] [rounds]
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, hash_password, verify_password
+
+
+def single_core(rounds, logins):
+    stored = hash_password("correct horse", rounds)
+    verify_password("correct horse", stored, rounds)
+    start = time.perf_counter()
+    for _ in range(logins):
+        verify_password("correct horse", stored, rounds)
+    elapsed = time.perf_counter() - start
+    print(f"rounds={rounds:<3} 1 core     {elapsed / logins * 1000:8.2f} ms/login  {logins / elapsed:8.1f} logins/s")
+
+
+async def pooled(rounds, logins, workers):
+    hasher = PasswordHasher(workers=workers, max_pending=logins, rounds=rounds)
+    hasher.start()
+    try:
+        stored = hash_password("correct horse", rounds)
+        await asyncio.gather(*(hasher.verify("correct horse", stored) for _ in range(workers)))
+        start = time.perf_counter()
+        await asyncio.gather(*(hasher.verify("correct horse", stored) for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+    finally:
+        hasher.shutdown()
+    rate = logins / elapsed
+    print(f"rounds={rounds:<3} {workers} workers  {rate:8.1f} logins/s  {rate / workers:8.1f} logins/s per core")
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    rounds = [int(sys.argv[3])] if len(sys.argv) > 3 else [10, 11, 12]
+    for r in rounds:
+        single_core(r, max(1, logins // workers))
+        asyncio.run(pooled(r, logins, workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Pool insertion: simulates a fleet serving pool requests in a 10 x 10 km
+# area (straight-line travel at a fixed speed), once with every request
+# dispatched to its own idle vehicle and once with PoolPlanner inserting
+# requests into the routes of nearby pool vehicles first. Reports riders
+# served per vehicle-hour, rejected requests, detours and planning latency.
+#   python benchmarks/bench_pooling.py [vehicles] [requests_per_minute] [minutes]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_index import KM_PER_DEGREE, haversine_km
+from pooling import DROPOFF, PICKUP, PoolPlanner
+from routing import straight_line_eta
+
+ORIGIN = (12.90, 77.55)
+SPAN_DEG = 10 / KM_PER_DEGREE
+SPEED_KMH = 20.0
+STEP_SECONDS = 5.0
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def travel_seconds(origins, dest):
+    return [straight_line_eta(lat, lng, dest[0], dest[1], SPEED_KMH) for lat, lng in origins]
+
+
+def requests(rate_per_minute, minutes, seed=3):
+    rng = random.Random(seed)
+    t, out = 0.0, []
+    while True:
+        t += rng.expovariate(rate_per_minute / 60)
+        if t > minutes * 60:
+            return out
+        while True:
+            pickup = (ORIGIN[0] + rng.random() * SPAN_DEG, ORIGIN[1] + rng.random() * SPAN_DEG)
+            dropoff = (ORIGIN[0] + rng.random() * SPAN_DEG, ORIGIN[1] + rng.random() * SPAN_DEG)
+            if 2.0 <= haversine_km(*pickup, *dropoff) <= 8.0:
+                break
+        out.append((t, pickup, dropoff))
+
+
+def simulate(n_vehicles, demand, pooling):
+    clock = Clock()
+    planner = PoolPlanner(travel_seconds, clock=clock)
+    rng = random.Random(5)
+    position = {v: (ORIGIN[0] + rng.random() * SPAN_DEG, ORIGIN[1] + rng.random() * SPAN_DEG)
+                for v in range(n_vehicles)}
+    busy = set()
+    busy_seconds = 0.0
+    boarded, requested_at, direct = {}, {}, {}
+    served = rejected = pooled = 0
+    detours, waits, plan_ms = [], [], []
+    step_km = SPEED_KMH * STEP_SECONDS / 3600
+    pending = list(demand)
+
+    while pending or busy:
+        clock.now += STEP_SECONDS
+        while pending and pending[0][0] <= clock.now:
+            _, pickup, dropoff = pending.pop(0)
+            ride_id = len(requested_at)
+            requested_at[ride_id] = clock.now
+            direct[ride_id] = travel_seconds([pickup], dropoff)[0]
+            if pooling:
+                started = time.perf_counter()
+                insertion = planner.insert(ride_id, pickup, dropoff)
+                plan_ms.append((time.perf_counter() - started) * 1000)
+                if insertion is not None:
+                    pooled += 1
+                    continue
+            idle = [(haversine_km(*position[v], *pickup), v) for v in position if v not in busy]
+            idle = [c for c in idle if c[0] / SPEED_KMH * 3600 <= planner.max_wait_seconds]
+            if not idle:
+                rejected += 1
+                continue
+            _, vehicle = min(idle)
+            busy.add(vehicle)
+            planner.open(vehicle, ride_id, pickup, dropoff, position[vehicle])
+
+        for vehicle in list(busy):
+            busy_seconds += STEP_SECONDS
+            stops = planner.route_of(vehicle)
+            if not stops:
+                busy.discard(vehicle)
+                continue
+            target = (stops[0]["latitude"], stops[0]["longitude"])
+            lat, lng = position[vehicle]
+            remaining = haversine_km(lat, lng, *target)
+            if remaining <= step_km:
+                lat, lng = target
+            else:
+                f = step_km / remaining
+                lat, lng = lat + (target[0] - lat) * f, lng + (target[1] - lng) * f
+            position[vehicle] = (lat, lng)
+            for ride_id, kind, _, _ in planner.update_position(vehicle, lat, lng):
+                if kind == PICKUP:
+                    boarded[ride_id] = clock.now
+                    waits.append(clock.now - requested_at[ride_id])
+                elif kind == DROPOFF:
+                    detours.append((clock.now - boarded[ride_id]) / max(direct[ride_id], 1.0))
+                    planner.remove(ride_id)
+                    served += 1
+            if planner.route_of(vehicle) is None:
+                busy.discard(vehicle)
+
+    detours.sort()
+    return {
+        "served": served,
+        "rejected": rejected,
+        "pooled": pooled,
+        "riders_per_vehicle_hour": round(served / (busy_seconds / 3600), 2) if busy_seconds else 0.0,
+        "avg_wait_s": round(sum(waits) / len(waits)) if waits else 0,
+        "p95_ride_over_direct": round(detours[int(len(detours) * 0.95)], 2) if detours else 0.0,
+        "avg_plan_ms": round(sum(plan_ms) / len(plan_ms), 3) if plan_ms else 0.0,
+        "max_plan_ms": round(max(plan_ms), 3) if plan_ms else 0.0,
+    }
+
+
+def main():
+    n_vehicles = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 12
+    minutes = float(sys.argv[3]) if len(sys.argv) > 3 else 60
+    demand = requests(rate, minutes)
+    print(f"{len(demand)} pool requests over {minutes:g} min, {n_vehicles} vehicles, {SPEED_KMH:g} km/h")
+    for name, pooling in (("one ride per vehicle", False), ("pool insertion", True)):
+        print(f"{name:<22} {simulate(n_vehicles, demand, pooling)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Routing engine: builds a synthetic city grid (arterials every 5th street,
+# some one-way streets), contracts it, checks answers against plain Dijkstra
+# on the original graph, then times point-to-point routes and pickup ETAs for
+# a set of nearby drivers, cold and through the cell cache.
+#   python benchmarks/bench_routing.py [grid_size] [drivers]
+import heapq
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routing import RoadGraph, RoutingEngine, build_graph
+
+ORIGIN = (12.90, 77.55)
+SPACING_DEG = 0.0015    # ~165 m blocks
+
+
+def synthetic_city(size, seed=1):
+    rng = random.Random(seed)
+    nodes = [(f"{r}:{c}", ORIGIN[0] + r * SPACING_DEG, ORIGIN[1] + c * SPACING_DEG)
+             for r in range(size) for c in range(size)]
+    edges = []
+    for r in range(size):
+        for c in range(size):
+            for dr, dc in ((0, 1), (1, 0)):
+                r2, c2 = r + dr, c + dc
+                if r2 >= size or c2 >= size:
+                    continue
+                arterial = (r % 5 == 0) if dr == 0 else (c % 5 == 0)
+                speed = 45.0 if arterial else rng.uniform(15.0, 25.0)
+                oneway = not arterial and rng.random() < 0.15
+                a, b = f"{r}:{c}", f"{r2}:{c2}"
+                if oneway and rng.random() < 0.5:
+                    a, b = b, a
+                edges.append((a, b, 165.0 * rng.uniform(0.95, 1.1), speed, oneway))
+    return nodes, edges
+
+
+def dijkstra(adj, source, target):
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, x = heapq.heappop(heap)
+        if x == target:
+            return d
+        if d > dist[x]:
+            continue
+        for y, s in adj[x]:
+            if d + s < dist.get(y, float("inf")):
+                dist[y] = d + s
+                heapq.heappush(heap, (d + s, y))
+    return None
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    drivers = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    nodes, edges = synthetic_city(size)
+    with tempfile.TemporaryDirectory() as out_dir:
+        meta = build_graph(nodes, edges, out_dir, log=None)
+        print(f"graph: {meta['nodes']} nodes, {meta['edges']} edges, {meta['shortcuts']} shortcuts, "
+              f"built in {meta['build_seconds']}s")
+        engine = RoutingEngine(RoadGraph.load(out_dir), access_speed_kmh=1e9, cache_ttl=0.0)
+
+        # Correctness against Dijkstra on the uncontracted graph (node to node)
+        index = {node_id: i for i, (node_id, _, _) in enumerate(nodes)}
+        adj = [[] for _ in nodes]
+        for a, b, length, speed, oneway in edges:
+            seconds = length / (speed / 3.6)
+            adj[index[a]].append((index[b], seconds))
+            if not oneway:
+                adj[index[b]].append((index[a], seconds))
+        rng = random.Random(7)
+        worst = 0.0
+        for _ in range(100):
+            s, t = rng.randrange(len(nodes)), rng.randrange(len(nodes))
+            expected = dijkstra(adj, s, t)
+            got = engine._meet(s, engine._upward(t), 0.0, 0.0)
+            if (expected is None) != (got is None):
+                raise SystemExit(f"mismatch {s}->{t}: dijkstra={expected} ch={got}")
+            if expected is not None:
+                worst = max(worst, abs(got[0] - expected) / max(expected, 1e-9))
+        print(f"100 random routes match Dijkstra (max relative error {worst:.2e})")
+
+        engine = RoutingEngine(RoadGraph.load(out_dir))
+        span = (size - 1) * SPACING_DEG
+        points = [(ORIGIN[0] + rng.random() * span, ORIGIN[1] + rng.random() * span) for _ in range(400)]
+        start = time.perf_counter()
+        for i in range(0, len(points), 2):
+            engine.route(*points[i], *points[i + 1])
+        per_route = (time.perf_counter() - start) / (len(points) // 2)
+        print(f"point-to-point   {per_route * 1000:7.2f} ms/route (cold cache)")
+
+        pickups = points[:50]
+        rounds = []
+        for p_lat, p_lng in pickups:
+            fleet = [(d, p_lat + rng.uniform(-0.02, 0.02), p_lng + rng.uniform(-0.02, 0.02)) for d in range(drivers)]
+            start = time.perf_counter()
+            engine.etas_to(p_lat, p_lng, fleet)
+            rounds.append(time.perf_counter() - start)
+        print(f"{drivers} drivers -> pickup {sum(rounds) / len(rounds) * 1000:7.2f} ms (cold cache)")
+
+        start = time.perf_counter()
+        for p_lat, p_lng in pickups:
+            fleet = [(d, p_lat + 0.001 * (d % 5), p_lng + 0.001 * (d // 5)) for d in range(drivers)]
+            engine.etas_to(p_lat, p_lng, fleet)
+            engine.etas_to(p_lat, p_lng, fleet)
+        print(f"{drivers} drivers -> pickup {(time.perf_counter() - start) / (2 * len(pickups)) * 1000:7.2f} ms "
+              f"(half repeated, cell cache)")
+        print(engine.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Page serialization cost: a page of ride rows as pyodbc returns them (Decimal
+# fares and coordinates, datetimes), through FastAPI's default path
+# (dict(zip()), jsonable_encoder, json) and through RowMapper + orjson.
+#   python benchmarks/bench_serialization.py [rows] [iterations]
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from rows import ORJSONResponse, RowMapper
+
+COLUMNS = [
+    ("ride_id", int), ("rider_id", int), ("driver_id", int), ("vehicle_id", int),
+    ("pickup_lat", Decimal), ("pickup_lng", Decimal), ("dropoff_lat", Decimal), ("dropoff_lng", Decimal),
+    ("pickup_address", str), ("dropoff_address", str), ("ride_status", str), ("ride_type", str),
+    ("requested_at", datetime), ("accepted_at", datetime), ("started_at", datetime), ("completed_at", datetime),
+    ("estimated_fare", Decimal), ("actual_fare", Decimal), ("distance_km", Decimal), ("duration_minutes", int),
+    ("surge_multiplier", Decimal), ("payment_status", str), ("cancelled_by", str), ("cancel_reason", str),
+    ("cancelled_at", datetime),
+]
+
+
+class Cursor:
+    description = tuple((name, type_code, None, None, None, None, True) for name, type_code in COLUMNS)
+
+
+def make_rows(n):
+    now = datetime(2026, 1, 1, 8, 0, 0)
+    rows = []
+    for i in range(n):
+        t = now + timedelta(minutes=i)
+        rows.append((
+            i, 1000 + i, 2000 + i, 3000 + i,
+            Decimal("12.971600"), Decimal("77.594600"), Decimal("12.935200"), Decimal("77.624500"),
+            "MG Road", "Koramangala", "completed", "standard",
+            t, t + timedelta(minutes=2), t + timedelta(minutes=6), t + timedelta(minutes=31),
+            Decimal("245.50"), Decimal("251.75"), Decimal("7.42"), 25,
+            Decimal("1.20"), "paid", None, None, None,
+        ))
+    return rows
+
+
+def default_path(cursor, rows):
+    columns = [column[0] for column in cursor.description]
+    return JSONResponse(jsonable_encoder([dict(zip(columns, row)) for row in rows])).body
+
+
+def mapped_path(cursor, rows, mapper=RowMapper()):
+    return ORJSONResponse(mapper.all(cursor, rows)).body
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rows = make_rows(n)
+    for name, fn in (("dict + jsonable_encoder + json", default_path), ("RowMapper + orjson", mapped_path)):
+        size = len(fn(Cursor, rows))
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(Cursor, rows)
+        elapsed = (time.perf_counter() - start) / iterations
+        print(f"{name:<32} {n} rows  {elapsed * 1000:8.2f} ms/page  {elapsed / n * 1e6:6.2f} us/row  {size} bytes")
+
+
+if __name__ == "__main__":
+    main()
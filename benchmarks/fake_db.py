@@ -0,0 +1,446 @@
+# In-memory stand-in for the SQL Server schema, plugged in through the
+# connection pool factory. It answers exactly the statements the ride
+# lifecycle issues (matched on their SQL text) with the same result shapes,
+# so the API, pool, executor and write-behind paths run unmodified.
+# Anything else raises ProgrammingError and shows up as an error in the report.
+import itertools
+import re
+import threading
+import time
+from datetime import datetime
+
+import pyodbc
+
+
+class Row(tuple):
+    # Tuple with attribute access, like pyodbc.Row
+    def __new__(cls, columns, values):
+        row = super().__new__(cls, values)
+        row._index = {name: i for i, name in enumerate(columns)}
+        return row
+
+    def __getattr__(self, name):
+        try:
+            return self[self._index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _sql_error(message):
+    return pyodbc.ProgrammingError("42000", f"[42000] [FakeDB]{message} (50000)")
+
+
+class FakeDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency          # per statement, to mimic a network round trip
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.users = {}                 # user_id -> dict
+        self.emails = {}
+        self.phones = set()
+        self.drivers = {}               # driver_id -> {"current_status", "is_verified", "vehicle_id"}
+        self.locations = {}             # driver_id -> (lat, lng, recorded_at)
+        self.history_rows = 0
+        self.rides = {}                 # ride_id -> dict
+        self.payments = {}              # ride_id -> payment_status
+        self.traces = {}
+        self.documents = {}             # driver_id -> {document_type: row}
+        self.ratings = {}               # (ride_id, rated_by) -> rating
+        self.stats = {}                 # ("driver" | "rider", user_id) -> [trips, fares, cancelled, ratings, rating_sum]
+        self.statements = 0
+
+    def connect(self):
+        return FakeConnection(self)
+
+    # --- statement handlers: (cursor, params) -> None ---
+
+    def select_one(self, cur, params):
+        cur.result(["x"], [(1,)])
+
+    def register_user(self, cur, params):
+        email, phone, password_hash, first, last, dob, picture, account_status, user_type = params
+        with self.lock:
+            if email in self.emails or phone in self.phones:
+                raise _sql_error("Email or phone number already registered")
+            user_id = next(self.ids)
+            now = datetime.now()
+            user = {
+                "user_id": user_id, "email": email, "phone_number": phone, "password_hash": password_hash,
+                "first_name": first, "last_name": last, "date_of_birth": dob,
+                "profile_picture_url": picture, "user_type": user_type, "account_status": account_status,
+                "created_at": now, "updated_at": now,
+            }
+            self.users[user_id] = user
+            self.emails[email] = user_id
+            self.phones.add(phone)
+            if user_type == "driver":
+                # Every benchmark driver comes with a vehicle
+                self.drivers[user_id] = {"current_status": "offline", "is_verified": False, "vehicle_id": user_id}
+        cur.result(list(user), [tuple(user.values())])
+
+    def authenticate(self, cur, params):
+        columns = ["user_id", "email", "first_name", "last_name", "account_status", "user_type",
+                   "password_hash", "wallet_balance", "is_verified", "driver_status", "vehicle_id"]
+        user = self.users.get(self.emails.get(params[0]))
+        if user is None:
+            cur.result(columns, [])
+            return
+        driver = self.drivers.get(user["user_id"], {})
+        cur.result(columns, [(
+            user["user_id"], user["email"], user["first_name"], user["last_name"], user["account_status"],
+            user["user_type"], user["password_hash"], 0.0 if user["user_type"] == "rider" else None,
+            driver.get("is_verified"), driver.get("current_status"), driver.get("vehicle_id"),
+        )])
+
+    def rehash_password(self, cur, params):
+        new_hash, user_id, old_hash = params
+        with self.lock:
+            user = self.users.get(user_id)
+            if user and user["password_hash"] == old_hash:
+                user["password_hash"] = new_hash
+                cur.rowcount = 1
+
+    def create_temp(self, cur, params):
+        cur.conn.temp = []
+
+    def fill_temp(self, cur, rows):
+        cur.conn.temp.extend(rows)
+
+    def drop_temp(self, cur, params):
+        cur.conn.temp = None
+
+    def write_locations(self, cur, params):
+        with self.lock:
+            for driver_id, lat, lng, recorded_at in cur.conn.temp:
+                if driver_id in self.drivers:
+                    self.history_rows += 1
+                    self.locations[driver_id] = (lat, lng, recorded_at)
+
+    def noop(self, cur, params):
+        pass
+
+    def wake_drivers(self, cur, params):
+        with self.lock:
+            for row in cur.conn.temp:
+                driver = self.drivers.get(row[0])
+                if driver and driver["current_status"] == "offline":
+                    driver["current_status"] = "available"
+
+    def batch_statuses(self, cur, params):
+        rows = []
+        for row in cur.conn.temp:
+            driver = self.drivers.get(row[0])
+            if driver:
+                rows.append((row[0], driver["current_status"], driver["is_verified"]))
+        cur.result(["driver_id", "current_status", "is_verified"], rows)
+
+    def empty(self, cur, params):
+        cur.result(["x"], [])
+
+    def request_ride(self, cur, params):
+        rider_id, plat, plng, dlat, dlng, paddr, daddr, ride_type, _, surge, route_km, route_minutes = params
+        if self.users.get(rider_id, {}).get("user_type") != "rider":
+            raise _sql_error("Invalid or inactive rider")
+        with self.lock:
+            ride_id = next(self.ids)
+            ride = {
+                "ride_id": ride_id, "rider_id": rider_id, "driver_id": None, "vehicle_id": None,
+                "pickup_lat": plat, "pickup_lng": plng, "dropoff_lat": dlat, "dropoff_lng": dlng,
+                "pickup_address": paddr, "dropoff_address": daddr, "ride_status": "requested",
+                "ride_type": ride_type, "requested_at": datetime.now(), "accepted_at": None,
+                "started_at": None, "completed_at": None, "estimated_fare": round(30 + 12 * 5 * float(surge or 1), 2),
+                "actual_fare": None, "distance_km": route_km or 5.0, "duration_minutes": route_minutes,
+                "surge_multiplier": surge, "payment_status": "pending",
+            }
+            self.rides[ride_id] = ride
+        cur.result(list(ride), [tuple(ride.values())])
+
+    def upload_documents(self, cur, params):
+        driver_id, document_type, number, front_url, back_url, expiry_date = params
+        with self.lock:
+            if driver_id not in self.drivers:
+                raise _sql_error("Driver not found")
+            documents = self.documents.setdefault(driver_id, {})
+            if document_type in documents:
+                raise _sql_error("Document type already exists for this driver")
+            documents[document_type] = (next(self.ids), driver_id, document_type, number, front_url, back_url,
+                                        expiry_date, "pending")
+            rows = list(documents.values())
+        cur.result(["document_id", "driver_id", "document_type", "document_number", "document_front_url",
+                    "document_back_url", "expiry_date", "verification_status"], rows)
+
+    def match_details(self, cur, params):
+        rows = []
+        for driver_id in params:
+            driver = self.drivers.get(driver_id)
+            if driver and driver["current_status"] == "available" and driver["is_verified"]:
+                user = self.users[driver_id]
+                rows.append((driver_id, f"{user['first_name']} {user['last_name']}", "Fake Sedan",
+                             f"KA-{driver_id:06d}", 4.8))
+        cur.result(["driver_id", "driver_name", "vehicle", "vehicle_number", "average_rating"], rows)
+
+    def accept_ride(self, cur, params):
+        ride_id, driver_id = params
+        with self.lock:
+            driver = self.drivers.get(driver_id)
+            if driver is None:
+                raise _sql_error("Driver has no registered vehicle")
+            ride = self.rides.get(ride_id)
+            if ride is None:
+                raise _sql_error("Ride not found")
+            if ride["ride_status"] != "requested":
+                raise _sql_error("Ride is not in requested state")
+            if driver["current_status"] != "available" or not driver["is_verified"]:
+                raise _sql_error("Driver not available or not verified")
+            ride.update(driver_id=driver_id, vehicle_id=driver["vehicle_id"], ride_status="accepted",
+                        accepted_at=datetime.now())
+            driver["current_status"] = "on_ride"
+            rider = self.users[ride["rider_id"]]
+            row = dict(ride, rider_name=f"{rider['first_name']} {rider['last_name']}",
+                       rider_phone=rider["phone_number"])
+        cur.result(list(row), [tuple(row.values())])
+
+    def store_trace(self, cur, params):
+        self.traces[params[0]] = params[2]
+
+    def complete_ride(self, cur, params):
+        actual_fare, distance_km, duration_minutes, ride_id = params
+        with self.lock:
+            ride = self.rides.get(ride_id)
+            if ride is None or ride["ride_status"] != "accepted":
+                cur.result(["driver_id", "rider_id"], [])
+                return
+            ride.update(ride_status="completed", completed_at=datetime.now(), actual_fare=actual_fare)
+            if distance_km is not None:
+                ride["distance_km"] = distance_km
+            self.payments[ride_id] = "pending"
+            cur.result(["driver_id", "rider_id"], [(ride["driver_id"], ride["rider_id"])])
+
+    def record_ride_stats(self, cur, params):
+        with self.lock:
+            ride = self.rides[params[0]]
+            completed = ride["ride_status"] == "completed"
+            for kind, user_id in (("driver", ride["driver_id"]), ("rider", ride["rider_id"])):
+                if user_id is None:
+                    continue
+                stats = self.stats.setdefault((kind, user_id), [0, 0.0, 0, 0, 0])
+                if completed:
+                    stats[0] += 1
+                    stats[1] += float(ride["actual_fare"] or 0)
+                else:
+                    stats[2] += 1
+
+    def rate_ride(self, cur, params):
+        ride_id, rated_by, rating = params
+        with self.lock:
+            ride = self.rides.get(ride_id)
+            if ride is None or ride["ride_status"] != "completed":
+                raise _sql_error("Ride is not completed")
+            if (ride_id, rated_by) in self.ratings:
+                raise _sql_error("Ride already rated")
+            self.ratings[ride_id, rated_by] = rating
+            kind, user_id = ("driver", ride["driver_id"]) if rated_by == "rider" else ("rider", ride["rider_id"])
+            stats = self.stats.setdefault((kind, user_id), [0, 0.0, 0, 0, 0])
+            stats[3] += 1
+            stats[4] += rating
+        cur.result(["ride_id", "driver_id", "rider_id"], [(ride_id, ride["driver_id"], ride["rider_id"])])
+
+    def user_stats(self, kind, cur, params):
+        user_id = params[0]
+        if user_id not in (self.drivers if kind == "driver" else self.users):
+            cur.result([f"{kind}_id"], [])
+            return
+        trips, fares, cancelled, ratings, rating_sum = self.stats.get((kind, user_id), [0, 0.0, 0, 0, 0])
+        cur.result([f"{kind}_id", "completed_trips", "fare_total", "distance_km", "duration_minutes",
+                    "cancelled_by_rider", "cancelled_by_driver", "rating_count", "rating_sum", "updated_at"],
+                   [(user_id, trips, round(fares, 2), 0.0, 0, cancelled, 0, ratings, rating_sum, None)])
+
+    def driver_stats(self, cur, params):
+        self.user_stats("driver", cur, params)
+
+    def rider_stats(self, cur, params):
+        self.user_stats("rider", cur, params)
+
+    def free_ride_driver(self, cur, params):
+        driver_id = params[0]
+        with self.lock:
+            driver = self.drivers.get(driver_id)
+            busy = any(r["driver_id"] == driver_id and r["ride_status"] == "accepted" for r in self.rides.values())
+            if driver and not busy:
+                driver["current_status"] = "available"
+                cur.rowcount = 1
+
+    def add_pool_rider(self, cur, params):
+        ride_id, driver_id, max_riders = params
+        with self.lock:
+            driver = self.drivers.get(driver_id)
+            active = [r for r in self.rides.values() if r["driver_id"] == driver_id and r["ride_status"] == "accepted"]
+            if driver is None or driver["current_status"] != "on_ride" or not active \
+                    or any(r["ride_type"] != "pool" for r in active):
+                raise _sql_error("Driver is not on a pool route")
+            if len(active) >= max_riders:
+                raise _sql_error("Pool vehicle is full")
+            ride = self.rides.get(ride_id)
+            if ride is None or ride["ride_status"] != "requested" or ride["ride_type"] != "pool":
+                raise _sql_error("Ride is not a requested pool ride")
+            ride.update(driver_id=driver_id, vehicle_id=driver["vehicle_id"], ride_status="accepted",
+                        accepted_at=datetime.now())
+            rider = self.users[ride["rider_id"]]
+            row = dict(ride, rider_name=f"{rider['first_name']} {rider['last_name']}",
+                       rider_phone=rider["phone_number"])
+        cur.result(list(row), [tuple(row.values())])
+
+    def cancel_ride(self, cur, params):
+        cancelled_by, reason, ride_id = params
+        with self.lock:
+            ride = self.rides.get(ride_id)
+            if ride is None or ride["ride_status"] not in ("requested", "accepted"):
+                cur.result(["driver_id", "rider_id"], [])
+                return
+            ride.update(ride_status="cancelled", cancelled_by=cancelled_by)
+            cur.result(["driver_id", "rider_id"], [(ride["driver_id"], ride["rider_id"])])
+
+    def update_payment(self, cur, params):
+        payment_status, ride_id = params
+        with self.lock:
+            if ride_id in self.payments:
+                self.payments[ride_id] = payment_status
+                cur.rowcount = 1
+
+    def update_driver_status(self, cur, params):
+        current_status, driver_id = params
+        with self.lock:
+            driver = self.drivers.get(driver_id)
+            if driver is not None:
+                driver["current_status"] = current_status
+        cur.result(["is_verified"], [(driver["is_verified"],)] if driver else [])
+
+    def verify_lookup(self, cur, params):
+        driver = self.drivers.get(params[0])
+        cur.result(["driver_id", "vehicle_id"], [(params[0], driver["vehicle_id"])] if driver else [])
+
+    def verify_driver(self, cur, params):
+        with self.lock:
+            driver = self.drivers[params[0]]
+            driver.update(is_verified=True, current_status="available")
+
+
+# First match wins; patterns are searched in whitespace-collapsed SQL
+_STATEMENTS = [
+    (r"^SELECT 1$", "select_one"),
+    (r"EXEC sp_register_user", "register_user"),
+    (r"EXEC sp_authenticate_user", "authenticate"),
+    (r"UPDATE users SET password_hash", "rehash_password"),
+    (r"EXEC sp_upload_driver_documents", "upload_documents"),
+    (r"CREATE TABLE #location_batch", "create_temp"),
+    (r"INSERT INTO #location_batch", "fill_temp"),
+    (r"INSERT INTO driver_locations", "write_locations"),
+    (r"FROM driver_current_location c JOIN #location_batch", "noop"),
+    (r"INSERT INTO driver_current_location", "noop"),
+    (r"UPDATE d SET current_status = 'available' FROM drivers d JOIN #location_batch", "wake_drivers"),
+    (r"FROM drivers d JOIN #location_batch", "batch_statuses"),
+    (r"DROP TABLE #location_batch", "drop_temp"),
+    (r"JOIN driver_current_location dl", "empty"),
+    (r"FROM rides WHERE ride_status IN \('requested', 'accepted', 'arrived', 'in_progress'\)", "empty"),
+    (r"EXEC sp_request_ride", "request_ride"),
+    (r"WHERE d\.driver_id IN \(", "match_details"),
+    (r"EXEC sp_accept_ride", "accept_ride"),
+    (r"INSERT INTO ride_traces", "store_trace"),
+    (r"SET ride_status = 'completed'", "complete_ride"),
+    (r"UPDATE drivers SET current_status = 'available' WHERE driver_id = \? AND NOT EXISTS", "free_ride_driver"),
+    (r"EXEC sp_add_pool_rider", "add_pool_rider"),
+    (r"SET ride_status = 'cancelled'", "cancel_ride"),
+    (r"EXEC sp_record_ride_stats", "record_ride_stats"),
+    (r"EXEC sp_rate_ride", "rate_ride"),
+    (r"LEFT JOIN driver_stats s", "driver_stats"),
+    (r"LEFT JOIN rider_stats s", "rider_stats"),
+    (r"FROM ride_stats_rollup", "empty"),
+    (r"UPDATE payments SET payment_status", "update_payment"),
+    (r"UPDATE drivers SET current_status = \? OUTPUT inserted\.is_verified", "update_driver_status"),
+    (r"SELECT d\.driver_id, v\.vehicle_id FROM drivers d LEFT JOIN vehicles", "verify_lookup"),
+    (r"UPDATE drivers SET is_verified = 1", "verify_driver"),
+]
+_COMPILED = [(re.compile(pattern), handler) for pattern, handler in _STATEMENTS]
+_WHITESPACE = re.compile(r"\s+")
+_CALL = re.compile(r"^\{CALL (\w+) \(.*\)\}$")
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = -1
+        self.fast_executemany = False
+        self._rows = []
+
+    def result(self, columns, rows):
+        # pyodbc-style 7-tuples; type_code is taken from the first row
+        first = rows[0] if rows else ()
+        self.description = tuple(
+            (name, type(first[i]) if i < len(first) and first[i] is not None else str, None, None, None, None, True)
+            for i, name in enumerate(columns)
+        )
+        self._rows = [Row(columns, values) for values in rows]
+        self.rowcount = len(rows)
+
+    def _handler(self, sql):
+        db = self.conn.db
+        db.statements += 1
+        if db.latency:
+            time.sleep(db.latency)
+        text = _CALL.sub(r"EXEC \1", _WHITESPACE.sub(" ", sql).strip())
+        for pattern, handler in _COMPILED:
+            if pattern.search(text):
+                return getattr(db, handler)
+        raise pyodbc.ProgrammingError("42000", f"[FakeDB] unsupported statement: {text[:120]}")
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            params = tuple(params[0])
+        handler = self._handler(sql)
+        self.description, self._rows, self.rowcount = None, [], -1
+        handler(self, params)
+        return self
+
+    def executemany(self, sql, rows):
+        self._handler(sql)(self, [tuple(row) for row in rows])
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def nextset(self):
+        self._rows = []
+        return False
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.autocommit = True
+        self.temp = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,114 @@
+import codecs
+import csv
+import json
+
+from pydantic import ValidationError
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FORMATS = ("ndjson", "csv")
+
+
+def import_format(request, requested: str = None) -> str:
+    if requested:
+        return requested
+    content_type = request.headers.get("content-type", "")
+    return "csv" if "csv" in content_type else "ndjson"
+
+
+async def _lines(request):
+    # Decode the body incrementally; a line never has to fit in one network chunk
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in request.stream():
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def read_chunks(request, format: str, chunk_size: int = IMPORT_CHUNK_SIZE):
+    # Yields lists of (row_number, record dict, or None plus an error message).
+    # Row numbers are 1-based data rows (a CSV header is not counted); CSV
+    # fields may be quoted but cannot contain newlines.
+    chunk = []
+    header = None
+    row_number = 0
+    async for line in _lines(request):
+        line = line.rstrip("\r")
+        if not line.strip():
+            continue
+        if format == "csv" and header is None:
+            header = next(csv.reader([line]))
+            continue
+
+        row_number += 1
+        try:
+            if format == "csv":
+                values = next(csv.reader([line]))
+                if len(values) != len(header):
+                    raise ValueError(f"expected {len(header)} columns, got {len(values)}")
+                record = {k: (v if v != "" else None) for k, v in zip(header, values)}
+            else:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+            chunk.append((row_number, record, None))
+        except ValueError as e:
+            chunk.append((row_number, None, f"Unparseable row: {str(e)}"))
+
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_chunk(model, chunk, overrides: dict = None):
+    # -> ([(row_number, model instance)], [(row_number, error)])
+    valid, errors = [], []
+    for row_number, record, parse_error in chunk:
+        if parse_error is not None:
+            errors.append((row_number, parse_error))
+            continue
+        if overrides:
+            record = {**record, **overrides}
+        try:
+            valid.append((row_number, model.model_validate(record)))
+        except ValidationError as e:
+            errors.append((row_number, "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            )))
+    return valid, errors
+
+
+class ImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.stopped = None
+
+    def add_errors(self, errors):
+        self.failed += len(errors)
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend({"row": row, "error": message} for row, message in errors[:room])
+
+    def result(self, elapsed: float) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            # Set when the server ran out of capacity: rows after `received` were not read
+            "stopped": self.stopped,
+            "errors_truncated": self.failed > len(self.errors),
+            "errors": sorted(self.errors, key=lambda e: e["row"]),
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "rows_per_second": round(self.received / elapsed, 1) if elapsed else None,
+        }
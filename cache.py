@@ -0,0 +1,179 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # In-process LRU with per-entry expiry
+    is_local = True
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()      # key -> (expires_at, value)
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=_MISSING):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] <= now:
+                del self._data[key]
+                self.expirations += 1
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class RedisCache:
+    # Shared backend for multi-worker deployments; eviction is Redis' own
+    # (configure maxmemory-policy allkeys-lru on the server).
+    is_local = False
+
+    def __init__(self, url: str, prefix: str = "uber:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key, default=_MISSING):
+        raw = self._client.get(self.prefix + key)
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl: float):
+        self._client.set(self.prefix + key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+    def stats(self) -> dict:
+        info = self._client.info("stats")
+        return {"backend": "redis", "evictions": info.get("evicted_keys"), "expirations": info.get("expired_keys")}
+
+
+class ReadThroughCache:
+    # Async read-through front for a TTLCache / RedisCache backend. Blocking
+    # backends are called through `offload` (e.g. the database executor).
+    def __init__(self, backend, ttl: float = 30.0, ttls: dict = None, offload=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.ttls = ttls or {}       # namespace -> ttl
+        self.offload = offload
+        self._lock = threading.Lock()
+        self._loading = {}           # key -> loads in flight
+        self._stale = set()          # keys invalidated while a load was in flight
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(namespace: str, ident) -> str:
+        return f"{namespace}:{ident}"
+
+    async def get_or_load(self, namespace: str, ident, loader):
+        key = self.key(namespace, ident)
+        try:
+            value = await self._call(self.backend.get, key, _MISSING)
+        except Exception:
+            self.errors += 1
+            value = _MISSING
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        with self._lock:
+            self._loading[key] = self._loading.get(key, 0) + 1
+        try:
+            value = await loader()
+        finally:
+            with self._lock:
+                # Skip the fill if a writer invalidated this key while we were loading
+                stale = key in self._stale
+                remaining = self._loading[key] - 1
+                if remaining:
+                    self._loading[key] = remaining
+                else:
+                    del self._loading[key]
+                    self._stale.discard(key)
+        if not stale:
+            try:
+                await self._call(self.backend.set, key, value, self.ttls.get(namespace, self.ttl))
+            except Exception:
+                self.errors += 1
+        return value
+
+    def invalidate(self, *pairs):
+        # pairs: (namespace, ident); safe to call from worker threads
+        keys = [self.key(namespace, ident) for namespace, ident in pairs]
+        with self._lock:
+            for key in keys:
+                if key in self._loading:
+                    self._stale.add(key)
+            self.invalidations += len(keys)
+        try:
+            self.backend.delete(*keys)
+        except Exception:
+            self.errors += 1
+
+    def peek(self, namespace: str, ident):
+        try:
+            value = self.backend.get(self.key(namespace, ident), _MISSING)
+        except Exception:
+            return None
+        return None if value is _MISSING else value
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            **self.backend.stats(),
+        }
+
+    async def _call(self, fn, *args):
+        if self.backend.is_local or self.offload is None:
+            return fn(*args)
+        return await self.offload(fn, *args)
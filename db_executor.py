@@ -0,0 +1,65 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorOverloaded(Exception):
+    pass
+
+
+class DatabaseExecutor:
+    # Runs blocking pyodbc work on a dedicated, sized thread pool so the event
+    # loop never blocks and DB concurrency is tuned apart from HTTP concurrency.
+    def __init__(self, pool, max_workers: int = 20, max_pending: int = 500):
+        self.pool = pool
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._pending = 0   # only touched from the event loop thread
+        self._completed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        # fn(conn, *args, **kwargs) runs in a worker thread with a pooled connection
+        return await self.submit(self._with_connection, fn, *args, **kwargs)
+
+    async def submit(self, fn, *args, **kwargs):
+        # Backpressure: shed load instead of queueing without bound
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise ExecutorOverloaded("Too many in-flight database requests")
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context (request metrics, trace span) into the worker
+        context = contextvars.copy_context()
+        try:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(context.run, fn, *args, **kwargs)
+            )
+        finally:
+            self._pending -= 1
+            self._completed += 1
+
+    def _with_connection(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with self.pool.connection() as conn:
+                return fn(conn, *args, **kwargs)
+        finally:
+            self._busy_seconds += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "busy_seconds": round(self._busy_seconds, 3),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
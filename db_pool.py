@@ -0,0 +1,276 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Entry:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        factory,
+        min_size: int = 2,
+        max_size: int = 10,
+        acquire_timeout: float = 5.0,
+        max_idle: float = 300.0,
+        max_lifetime: float = 1800.0,
+        health_check_after: float = 30.0,
+        health_check_query: str = "SELECT 1",
+        reap_interval: float = 30.0,
+        on_acquire=None,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size bounds")
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.health_check_query = health_check_query
+        self.reap_interval = reap_interval
+        self.on_acquire = on_acquire     # on_acquire(wait_seconds) after each checkout
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()        # most recently released on the right
+        self._in_use = {}           # id(conn) -> _Entry
+        self._size = 0              # open connections + connections being opened
+        self._waiting = 0
+        self._closed = True
+        self._reaper = None
+
+        # Counters
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._failed_health_checks = 0
+        self._latencies = deque(maxlen=1024)
+
+    # Lifecycle
+    def open(self):
+        with self._lock:
+            if not self._closed:
+                return
+            self._closed = False
+        self._fill_to_min()
+        self._reaper = threading.Thread(target=self._reap_loop, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._available.notify_all()
+        for entry in idle:
+            self._close_conn(entry.conn)
+
+    # Checkout / return
+    def acquire(self, timeout: float = None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            entry = None
+            create = False
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"Timed out after {timeout:.1f}s waiting for a database connection")
+                    self._waiting += 1
+                    try:
+                        self._available.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if create:
+                entry = self._new_entry()
+            elif not self._is_usable(entry):
+                self._discard(entry)
+                continue
+
+            now = time.monotonic()
+            entry.last_used = now
+            with self._lock:
+                self._in_use[id(entry.conn)] = entry
+                self._checkouts += 1
+                self._latencies.append(now - start)
+            if self.on_acquire is not None:
+                self.on_acquire(now - start)
+            return entry.conn
+
+    def release(self, conn, discard: bool = False):
+        with self._lock:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            return
+        expired = time.monotonic() - entry.created_at > self.max_lifetime
+        if discard or expired or self._closed:
+            self._discard(entry)
+            if not self._closed:
+                self._fill_to_min()
+            return
+        entry.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(entry)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except Exception as e:
+            discard = _is_connection_error(e)
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "failed_health_checks": self._failed_health_checks,
+                "checkout_latency_ms": {
+                    "avg": _ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+                    "p95": _ms(latencies[int(len(latencies) * 0.95)]) if latencies else 0.0,
+                    "max": _ms(latencies[-1]) if latencies else 0.0,
+                },
+            }
+
+    # Internals
+    def _new_entry(self):
+        try:
+            conn = self._factory()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._available.notify()
+            raise
+        with self._lock:
+            self._created += 1
+        return _Entry(conn)
+
+    def _is_usable(self, entry) -> bool:
+        now = time.monotonic()
+        if now - entry.created_at > self.max_lifetime:
+            return False
+        if now - entry.last_used < self.health_check_after:
+            return True
+        try:
+            cursor = entry.conn.cursor()
+            try:
+                cursor.execute(self.health_check_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            with self._lock:
+                self._failed_health_checks += 1
+            return False
+
+    def _discard(self, entry):
+        with self._lock:
+            self._size -= 1
+            self._discarded += 1
+            self._available.notify()
+        self._close_conn(entry.conn)
+
+    def _close_conn(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _fill_to_min(self):
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._new_entry()
+            except Exception as e:
+                print(f"Database pool fill error: {str(e)}")
+                return
+            with self._lock:
+                self._idle.appendleft(entry)
+                self._available.notify()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            if self._closed:
+                return
+            self.evict()
+
+    def evict(self):
+        # Drop idle connections past max_idle (above min_size) or past max_lifetime
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            keep = deque()
+            for entry in self._idle:
+                expired = now - entry.created_at > self.max_lifetime
+                stale = now - entry.last_used > self.max_idle
+                if expired or (stale and self._size - len(victims) > self.min_size):
+                    victims.append(entry)
+                else:
+                    keep.append(entry)
+            self._idle = keep
+        for entry in victims:
+            self._discard(entry)
+        self._fill_to_min()
+        return len(victims)
+
+
+def _is_connection_error(exc) -> bool:
+    # pyodbc reports broken links as OperationalError / SQLSTATE 08xxx
+    if type(exc).__name__ == "OperationalError":
+        return True
+    args = getattr(exc, "args", ())
+    return bool(args) and isinstance(args[0], str) and args[0].startswith("08")
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class _Dispatch:
+    __slots__ = ("candidates", "offered", "round", "deadline")
+
+    def __init__(self, candidates):
+        self.candidates = list(candidates)
+        self.offered = set()
+        self.round = 0
+        self.deadline = 0.0
+
+
+class Dispatcher:
+    # Offers each new ride to its candidate drivers in rounds and settles
+    # concurrent accepts with an in-memory compare-and-set before anything
+    # reaches SQL Server (where sp_accept_ride's conditional UPDATE is the
+    # durable, cross-worker arbiter).
+    def __init__(self, round_size: int = 3, round_seconds: float = 10.0, max_rounds: int = 4,
+                 on_offer=None, on_exhausted=None):
+        self.round_size = round_size
+        self.round_seconds = round_seconds
+        self.max_rounds = max_rounds
+        self.on_offer = on_offer            # (ride_id, driver_ids, round)
+        self.on_exhausted = on_exhausted    # (ride_id)
+        self._lock = threading.Lock()
+        self._open = {}                     # ride_id -> _Dispatch
+        self._claims = {}                   # ride_id -> driver_id (claimed or being written)
+        self._offers = {}                   # driver_id -> set(ride_id)
+
+        # Metrics
+        self._claims_attempted = 0
+        self._claims_won = 0
+        self._conflicts = 0                 # lost the in-memory CAS
+        self._db_conflicts = 0              # won in memory, lost in SQL (another worker)
+        self._not_offered = 0
+        self._rounds = 0
+        self._exhausted = 0
+        self._claim_latencies = deque(maxlen=1024)
+
+    def open(self, ride_id: int, candidates):
+        if not candidates:
+            return
+        with self._lock:
+            if ride_id in self._open or ride_id in self._claims:
+                return
+            self._open[ride_id] = _Dispatch(candidates)
+        self._advance(ride_id)
+
+    def offered_to(self, ride_id: int, driver_id: int):
+        # None when this worker isn't dispatching the ride (e.g. after a restart)
+        with self._lock:
+            dispatch = self._open.get(ride_id)
+            if dispatch is None:
+                return None
+            if driver_id in dispatch.offered:
+                return True
+            self._not_offered += 1
+            return False
+
+    def claim(self, ride_id: int, driver_id: int) -> bool:
+        with self._lock:
+            self._claims_attempted += 1
+            holder = self._claims.get(ride_id)
+            if holder is not None and holder != driver_id:
+                self._conflicts += 1
+                return False
+            self._claims[ride_id] = driver_id
+            return True
+
+    def release(self, ride_id: int, driver_id: int, conflict: bool = False):
+        # The durable write failed; let other drivers try again
+        with self._lock:
+            if self._claims.get(ride_id) == driver_id:
+                del self._claims[ride_id]
+            if conflict:
+                self._db_conflicts += 1
+
+    def confirm(self, ride_id: int, latency: float):
+        with self._lock:
+            self._claims_won += 1
+            self._claim_latencies.append(latency)
+            dispatch = self._open.pop(ride_id, None)
+            if dispatch is not None:
+                self._drop_offers(ride_id, dispatch)
+
+    def close(self, ride_id: int):
+        with self._lock:
+            self._claims.pop(ride_id, None)
+            dispatch = self._open.pop(ride_id, None)
+            if dispatch is not None:
+                self._drop_offers(ride_id, dispatch)
+
+    def offers_for(self, driver_id: int) -> list:
+        with self._lock:
+            return sorted(self._offers.get(driver_id, ()))
+
+    async def run(self, tick: float = 0.5):
+        while True:
+            await asyncio.sleep(tick)
+            now = time.monotonic()
+            with self._lock:
+                due = [ride_id for ride_id, d in self._open.items()
+                       if d.deadline <= now and ride_id not in self._claims]
+            for ride_id in due:
+                self._advance(ride_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._claim_latencies)
+            attempted = self._claims_attempted
+            return {
+                "open_dispatches": len(self._open),
+                "active_claims": len(self._claims),
+                "rounds": self._rounds,
+                "exhausted": self._exhausted,
+                "claims_attempted": attempted,
+                "claims_won": self._claims_won,
+                "conflicts": self._conflicts,
+                "db_conflicts": self._db_conflicts,
+                "not_offered": self._not_offered,
+                "conflict_rate": round((self._conflicts + self._db_conflicts) / attempted, 4) if attempted else 0.0,
+                "claim_latency_ms": {
+                    "avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                    "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 3) if latencies else 0.0,
+                },
+            }
+
+    def _advance(self, ride_id: int):
+        with self._lock:
+            dispatch = self._open.get(ride_id)
+            if dispatch is None:
+                return
+            start = dispatch.round * self.round_size
+            batch = dispatch.candidates[start:start + self.round_size]
+            if not batch or dispatch.round >= self.max_rounds:
+                # Out of candidates: stop dispatching and let any driver accept
+                del self._open[ride_id]
+                self._drop_offers(ride_id, dispatch)
+                self._exhausted += 1
+                exhausted = True
+            else:
+                exhausted = False
+                dispatch.round += 1
+                dispatch.deadline = time.monotonic() + self.round_seconds
+                dispatch.offered.update(batch)
+                for driver_id in batch:
+                    self._offers.setdefault(driver_id, set()).add(ride_id)
+                self._rounds += 1
+                round_number = dispatch.round
+        if exhausted:
+            if self.on_exhausted is not None:
+                self.on_exhausted(ride_id)
+        elif self.on_offer is not None:
+            self.on_offer(ride_id, batch, round_number)
+
+    def _drop_offers(self, ride_id: int, dispatch: _Dispatch):
+        for driver_id in dispatch.offered:
+            rides = self._offers.get(driver_id)
+            if rides is not None:
+                rides.discard(ride_id)
+                if not rides:
+                    del self._offers[driver_id]
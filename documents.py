@@ -0,0 +1,393 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+
+class DocumentRejected(Exception):
+    pass
+
+
+class DocumentTooLarge(DocumentRejected):
+    pass
+
+
+class UploadsOverloaded(Exception):
+    pass
+
+
+# Leading bytes of the formats a document scan may arrive in
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"%PDF-", "application/pdf"),
+)
+
+
+def sniff(head: bytes):
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def process_document(path: str, derived_dir: str, digest: str, min_side: int, max_side: int,
+                     thumb_side: int, max_pixels: int) -> dict:
+    # Runs in a worker process: validates the upload and writes a JPEG
+    # thumbnail plus, for oversized scans, a downscaled display copy.
+    # Raises ValueError with a client-facing reason when the file is unusable.
+    with open(path, "rb") as f:
+        head = f.read(16)
+        content_type = sniff(head)
+        if content_type is None:
+            raise ValueError("Unsupported file type; expected JPEG, PNG, WebP or PDF")
+        if content_type == "application/pdf":
+            f.seek(max(0, os.path.getsize(path) - 1024))
+            if b"%%EOF" not in f.read():
+                raise ValueError("PDF is truncated")
+            return {"content_type": content_type}
+
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with Image.open(path) as image:
+            image = ImageOps.exif_transpose(image)
+            width, height = image.size
+            if min(width, height) < min_side:
+                raise ValueError(f"Image is {width}x{height}; the shorter side must be at least {min_side}px")
+            image = image.convert("RGB")
+            display = None
+            if max(width, height) > max_side:
+                display = image.copy()
+                display.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+                display.save(os.path.join(derived_dir, f"{digest}.display.jpg"), "JPEG", quality=85, optimize=True)
+                display = list(display.size)
+            image.thumbnail((thumb_side, thumb_side), Image.Resampling.LANCZOS)
+            image.save(os.path.join(derived_dir, f"{digest}.thumb.jpg"), "JPEG", quality=80)
+    except Image.DecompressionBombError:
+        raise ValueError(f"Image exceeds {max_pixels} pixels")
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"Image is corrupt: {e}")
+    return {"content_type": content_type, "width": width, "height": height, "display_size": display}
+
+
+class StoredFile:
+    __slots__ = ("digest", "size", "filename", "duplicate")
+
+    def __init__(self, digest: str, size: int, filename: str, duplicate: bool):
+        self.digest = digest
+        self.size = size
+        self.filename = filename
+        self.duplicate = duplicate
+
+
+class _FileWriter:
+    # Streams one upload to a temp file, hashing as it goes; file I/O is
+    # batched into flush_bytes writes run off the event loop
+    def __init__(self, store: "DocumentStore", filename: str):
+        self.store = store
+        self.filename = filename
+        self.path = os.path.join(store.tmp_dir, uuid.uuid4().hex)
+        self._file = None
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self.size = 0
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.store.max_bytes:
+            raise DocumentTooLarge(f"File exceeds {self.store.max_bytes} bytes")
+        self._hash.update(data)
+        self._buffer += data
+        if len(self._buffer) >= self.store.flush_bytes:
+            await self._flush()
+
+    async def _flush(self):
+        data, self._buffer = bytes(self._buffer), bytearray()
+        if self._file is None:
+            self._file = await asyncio.to_thread(open, self.path, "wb")
+        await asyncio.to_thread(self._file.write, data)
+
+    async def finish(self) -> StoredFile:
+        if self.size == 0:
+            raise DocumentRejected("File is empty")
+        await self._flush()
+        await asyncio.to_thread(self._file.close)
+        self._file = None
+        digest = self._hash.hexdigest()
+        duplicate = await asyncio.to_thread(self.store._commit, self.path, digest)
+        return StoredFile(digest, self.size, self.filename, duplicate)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class DocumentStore:
+    # Content-addressed files under root: objects/ab/<sha256> for originals,
+    # derived/ for thumbnails, display copies and the processing result
+    # (<sha256>.json), which lets a re-upload of the same bytes skip
+    # processing. Uploads are written to tmp/ and renamed into place.
+    def __init__(self, root: str, max_bytes: int = 10 * 1024 * 1024, flush_bytes: int = 1024 * 1024,
+                 max_uploads: int = 64):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+        self.max_uploads = max_uploads
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.derived_dir = os.path.join(root, "derived")
+        self._lock = threading.Lock()
+        self._uploads = 0
+        self.files = 0
+        self.duplicates = 0
+        self.bytes_received = 0
+        self.rejected = 0
+
+    def open(self):
+        for path in (self.tmp_dir, self.derived_dir, os.path.join(self.root, "objects")):
+            os.makedirs(path, exist_ok=True)
+        # Leftovers of uploads interrupted by a restart
+        for name in os.listdir(self.tmp_dir):
+            os.unlink(os.path.join(self.tmp_dir, name))
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def derived_path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.derived_dir, f"{digest}.{suffix}")
+
+    def result(self, digest: str):
+        try:
+            with open(self.derived_path(digest, "json"), "rb") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_result(self, digest: str, result: dict):
+        path = self.derived_path(digest, "json")
+        tmp = os.path.join(self.tmp_dir, f"{digest}.json")
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+
+    def _commit(self, tmp_path: str, digest: str) -> bool:
+        # -> True when the content was already stored
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            os.unlink(tmp_path)
+            with self._lock:
+                self.duplicates += 1
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.files += 1
+        return False
+
+    async def read_form(self, stream, content_type: str, file_fields, max_field_bytes: int = 4096):
+        # Parses a multipart/form-data body as it arrives. Parts named in
+        # file_fields go to the store; other parts are short text fields.
+        # -> (fields {name: str}, files {name: StoredFile})
+        with self._lock:
+            if self._uploads >= self.max_uploads:
+                self.rejected += 1
+                raise UploadsOverloaded("Too many concurrent document uploads")
+            self._uploads += 1
+        try:
+            return await self._read_form(stream, content_type, file_fields, max_field_bytes)
+        finally:
+            with self._lock:
+                self._uploads -= 1
+
+    async def _read_form(self, stream, content_type, file_fields, max_field_bytes):
+        kind, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if kind != b"multipart/form-data" or not boundary:
+            raise DocumentRejected("Expected a multipart/form-data body")
+
+        # The parser's callbacks are synchronous; they queue events that are
+        # handled (and written out) after each chunk
+        events = []
+        header = {}
+        current_field = []
+
+        def on_header_field(data, start, end):
+            current_field.append(data[start:end])
+
+        def on_header_value(data, start, end):
+            header.setdefault(b"".join(current_field).lower(), bytearray()).extend(data[start:end])
+
+        def on_header_end():
+            current_field.clear()
+
+        callbacks = {
+            "on_part_begin": lambda: header.clear(),
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": lambda: events.append(("part", bytes(header.get(b"content-disposition", b"")))),
+            "on_part_data": lambda data, start, end: events.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: events.append(("end", None)),
+        }
+        parser = MultipartParser(boundary, callbacks)
+
+        fields, files, writers = {}, {}, []
+        name = writer = text = None
+        try:
+            async for chunk in stream:
+                self.bytes_received += len(chunk)
+                try:
+                    parser.write(chunk)
+                except Exception as e:
+                    raise DocumentRejected(f"Malformed multipart body: {e}")
+                for event, value in events:
+                    if event == "part":
+                        _, options = parse_options_header(value)
+                        name = options.get(b"name", b"").decode("utf-8", "replace")
+                        filename = options.get(b"filename")
+                        if name in fields or name in files:
+                            raise DocumentRejected(f"Duplicate form field '{name}'")
+                        if name in file_fields:
+                            if filename is None:
+                                raise DocumentRejected(f"Form field '{name}' must be a file")
+                            writer = _FileWriter(self, filename.decode("utf-8", "replace"))
+                            writers.append(writer)
+                        else:
+                            text = bytearray()
+                    elif event == "data":
+                        if writer is not None:
+                            await writer.write(value)
+                        elif text is not None:
+                            text += value
+                            if len(text) > max_field_bytes:
+                                raise DocumentRejected(f"Form field '{name}' is too long")
+                    elif writer is not None:
+                        files[name] = await writer.finish()
+                        writers.remove(writer)
+                        writer = None
+                    elif text is not None:
+                        fields[name] = text.decode("utf-8", "replace")
+                        text = None
+                events.clear()
+            parser.finalize()
+            if writers or text is not None:
+                raise DocumentRejected("Multipart body ended inside a part")
+            return fields, files
+        except BaseException:
+            for open_writer in writers:
+                open_writer.abort()
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "uploads_in_progress": self._uploads,
+            "max_uploads": self.max_uploads,
+            "files": self.files,
+            "duplicates": self.duplicates,
+            "bytes_received": self.bytes_received,
+            "rejected": self.rejected,
+        }
+
+
+class DocumentProcessor:
+    # Validates and thumbnails stored uploads in a process pool so image
+    # decoding never holds the event loop or a database worker. Like the
+    # password hasher, calls beyond max_pending are refused (UploadsOverloaded)
+    # instead of queueing behind an onboarding burst.
+    def __init__(self, store: DocumentStore, workers: int = None, max_pending: int = 32,
+                 min_side: int = 600, max_side: int = 2048, thumb_side: int = 320,
+                 max_pixels: int = 40_000_000):
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.limits = (min_side, max_side, thumb_side, max_pixels)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._inflight = {}         # digest -> future, so concurrent duplicates share one run
+        self.processed = 0
+        self.reused = 0
+        self.invalid = 0
+        self.rejected = 0
+        self._latencies = deque(maxlen=1024)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def process(self, stored: StoredFile) -> dict:
+        # -> processing result; raises DocumentRejected for unusable files
+        result = await asyncio.to_thread(self.store.result, stored.digest)
+        if result is None:
+            future = self._inflight.get(stored.digest)
+            if future is None:
+                future = self._inflight[stored.digest] = asyncio.ensure_future(self._run(stored.digest))
+                future.add_done_callback(lambda _: self._inflight.pop(stored.digest, None))
+            result = await asyncio.shield(future)
+        else:
+            self.reused += 1
+        if "error" in result:
+            raise DocumentRejected(result["error"])
+        return result
+
+    async def _run(self, digest: str) -> dict:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise UploadsOverloaded("Too many documents waiting to be processed")
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, process_document, self.store.object_path(digest), self.store.derived_dir,
+                digest, *self.limits)
+            self.processed += 1
+        except ValueError as e:
+            # Remembered like a success, so re-uploads are refused without a decode
+            result = {"error": str(e)}
+            self.invalid += 1
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+            with self._lock:
+                self._pending -= 1
+        await asyncio.to_thread(self.store.save_result, digest, result)
+        return result
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "workers": self.workers,
+            "in_flight": self._pending,
+            "max_pending": self.max_pending,
+            "processed": self.processed,
+            "reused": self.reused,
+            "invalid": self.invalid,
+            "rejected": self.rejected,
+            "latency_ms": {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 3) if latencies else 0.0,
+            },
+        }
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from datetime import datetime
+
+
+class Subscription:
+    def __init__(self, hub, topic: str, max_queue: int):
+        self.hub = hub
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, payload: str):
+        # Slow consumers lose their oldest events rather than stalling fan-out
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.hub.dropped += 1
+        self.queue.put_nowait(payload)
+
+    async def get(self, timeout: float = None) -> str:
+        if timeout is None:
+            return await self.queue.get()
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class InProcessBroker:
+    # Single-worker broker: publish delivers straight to local subscribers
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        pass
+
+    def publish(self, topic: str, payload: str):
+        self._deliver(topic, payload)
+
+
+class RedisBroker:
+    # Multi-worker broker: every worker publishes to Redis and delivers what
+    # it receives on the shared channel to its own subscribers.
+    def __init__(self, url: str, channel_prefix: str = "uber:events:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("EVENT_BROKER=redis requires the 'redis' package")
+        self.prefix = channel_prefix
+        self._client = redis.Redis.from_url(url)
+        self._task = None
+        self._pending = set()
+
+    async def start(self, deliver):
+        self._deliver = deliver
+        self._pubsub = self._client.pubsub()
+        await self._pubsub.psubscribe(self.prefix + "*")
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        await self._pubsub.close()
+        await self._client.close()
+
+    def publish(self, topic: str, payload: str):
+        task = asyncio.create_task(self._client.publish(self.prefix + topic, payload))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _listen(self):
+        async for message in self._pubsub.listen():
+            if message.get("type") != "pmessage":
+                continue
+            channel = message["channel"].decode()
+            self._deliver(channel[len(self.prefix):], message["data"].decode())
+
+
+class EventHub:
+    # Topic fan-out ("ride:{id}", "driver:{id}"). Events are serialized once
+    # and pushed into each subscriber's bounded queue.
+    def __init__(self, broker=None, max_queue: int = 100):
+        self.broker = broker or InProcessBroker()
+        self.max_queue = max_queue
+        self._topics = {}       # topic -> set(Subscription)
+        self._loop = None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        await self.broker.start(self._deliver)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.max_queue)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    def publish(self, topic: str, event_type: str, **data):
+        # Call from the event loop
+        payload = json.dumps({"type": event_type, "at": datetime.utcnow().isoformat(), **data}, default=str)
+        self.published += 1
+        self.broker.publish(topic, payload)
+
+    def publish_threadsafe(self, topic: str, event_type: str, **data):
+        # Call from database worker threads
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: self.publish(topic, event_type, **data))
+
+    def _deliver(self, topic: str, payload: str):
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return
+        for subscription in subscribers:
+            subscription.offer(payload)
+        self.delivered += len(subscribers)
+
+    def stats(self) -> dict:
+        return {
+            "broker": type(self.broker).__name__,
+            "topics": len(self._topics),
+            "subscribers": sum(len(s) for s in self._topics.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
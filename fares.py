@@ -0,0 +1,53 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from geo_index import EARTH_RADIUS_KM
+
+# Mirrors the rates hard-coded in sp_request_ride
+DEFAULT_PRICING = {
+    "standard": {"base_fare": 30.00, "per_km_rate": 12.00},
+    "premium": {"base_fare": 50.00, "per_km_rate": 18.00},
+    "pool": {"base_fare": 20.00, "per_km_rate": 8.00},
+}
+
+
+@lru_cache(maxsize=1)
+def load_pricing() -> dict:
+    # Optional JSON override in the same shape as DEFAULT_PRICING
+    path = os.getenv("PRICING_FILE")
+    if not path:
+        return DEFAULT_PRICING
+    with open(path) as f:
+        pricing = json.load(f)
+    for ride_type, rates in pricing.items():
+        if "base_fare" not in rates or "per_km_rate" not in rates:
+            raise ValueError(f"Pricing for {ride_type} needs base_fare and per_km_rate")
+    return pricing
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def estimate_fares(pickups: np.ndarray, dropoffs: np.ndarray, ride_types, surge: np.ndarray = None) -> dict:
+    # pickups/dropoffs: (n, 2) arrays of lat, lng. Returns distances and one fare
+    # array per ride type, rounded the way the DECIMAL columns store them.
+    pricing = load_pricing()
+    unknown = [t for t in ride_types if t not in pricing]
+    if unknown:
+        raise ValueError(f"Unknown ride_type: {', '.join(unknown)}")
+
+    distance_km = np.round(haversine_km(pickups[:, 0], pickups[:, 1], dropoffs[:, 0], dropoffs[:, 1]), 2)
+    if surge is None:
+        surge = np.ones(len(distance_km))
+
+    fares = {}
+    for ride_type in ride_types:
+        rates = pricing[ride_type]
+        fares[ride_type] = np.round((rates["base_fare"] + distance_km * rates["per_km_rate"]) * surge, 2)
+    return {"distance_km": distance_km, "fares": fares}
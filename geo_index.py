@@ -0,0 +1,124 @@
+import heapq
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class DriverIndex:
+    # Latest position of every driver in a uniform lat/lng grid. Only drivers
+    # flagged available are returned by nearest().
+    def __init__(self, cell_km: float = 1.0):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self._lock = threading.Lock()
+        self._positions = {}    # driver_id -> (lat, lng, cell)
+        self._cells = {}        # cell -> set(driver_id)
+        self._available = set()
+
+    def cell_of(self, lat: float, lng: float):
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def update(self, driver_id: int, lat: float, lng: float, available: bool = None):
+        cell = self.cell_of(lat, lng)
+        with self._lock:
+            old = self._positions.get(driver_id)
+            if old is not None and old[2] != cell:
+                members = self._cells.get(old[2])
+                if members is not None:
+                    members.discard(driver_id)
+                    if not members:
+                        del self._cells[old[2]]
+            if old is None or old[2] != cell:
+                self._cells.setdefault(cell, set()).add(driver_id)
+            self._positions[driver_id] = (lat, lng, cell)
+            if available is True:
+                self._available.add(driver_id)
+            elif available is False:
+                self._available.discard(driver_id)
+
+    def set_available(self, driver_id: int, available: bool):
+        with self._lock:
+            if available:
+                self._available.add(driver_id)
+            else:
+                self._available.discard(driver_id)
+
+    def remove(self, driver_id: int):
+        with self._lock:
+            old = self._positions.pop(driver_id, None)
+            self._available.discard(driver_id)
+            if old is not None:
+                members = self._cells.get(old[2])
+                if members is not None:
+                    members.discard(driver_id)
+                    if not members:
+                        del self._cells[old[2]]
+
+    def position(self, driver_id: int):
+        entry = self._positions.get(driver_id)
+        return None if entry is None else (entry[0], entry[1])
+
+    def nearest(self, lat: float, lng: float, k: int = 10, radius_km: float = 5.0, available_only: bool = True):
+        # Scan rings of cells outward from the query cell; stop once the ring is
+        # farther than both the radius and the current k-th best distance.
+        cell_lat, cell_lng = self.cell_of(lat, lng)
+        cell_km = self.cell_deg * KM_PER_DEGREE
+        lng_scale = max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(math.ceil(radius_km / (cell_km * lng_scale))) + 1
+        best = []   # max-heap of (-distance, driver_id)
+
+        with self._lock:
+            for ring in range(max_ring + 1):
+                # Closest any point in this ring can be (latitude spacing is the tighter bound)
+                ring_min_km = max(0, ring - 1) * cell_km * lng_scale
+                if ring_min_km > radius_km or (len(best) == k and ring_min_km > -best[0][0]):
+                    break
+                for cell in _ring_cells(cell_lat, cell_lng, ring):
+                    members = self._cells.get(cell)
+                    if not members:
+                        continue
+                    for driver_id in members:
+                        if available_only and driver_id not in self._available:
+                            continue
+                        d_lat, d_lng, _ = self._positions[driver_id]
+                        dist = haversine_km(lat, lng, d_lat, d_lng)
+                        if dist > radius_km:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-dist, driver_id))
+                        elif dist < -best[0][0]:
+                            heapq.heapreplace(best, (-dist, driver_id))
+
+        return [(driver_id, -neg) for neg, driver_id in sorted(best, reverse=True)]
+
+    def count_available(self, lat: float, lng: float, radius_km: float) -> int:
+        return len(self.nearest(lat, lng, k=len(self._available) or 1, radius_km=radius_km))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "drivers": len(self._positions),
+                "available": len(self._available),
+                "cells": len(self._cells),
+            }
+
+
+def _ring_cells(cell_lat: int, cell_lng: int, ring: int):
+    if ring == 0:
+        yield (cell_lat, cell_lng)
+        return
+    for dlng in range(-ring, ring + 1):
+        yield (cell_lat - ring, cell_lng + dlng)
+        yield (cell_lat + ring, cell_lng + dlng)
+    for dlat in range(-ring + 1, ring):
+        yield (cell_lat + dlat, cell_lng - ring)
+        yield (cell_lat + dlat, cell_lng + ring)
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+
+from fastapi import Response
+
+from cache import _MISSING
+from rows import dumps
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+class IdempotencyStore:
+    # Responses of retried writes, keyed by scope + Idempotency-Key. A repeat
+    # with the same request fingerprint gets the stored response back; repeats
+    # that arrive while the first is still running wait for it instead of
+    # executing again. Only 2xx results are kept, so a failed request can be
+    # retried with the same key. Coalescing is per process; stored responses
+    # are shared when the backend is (RedisCache).
+    def __init__(self, backend, ttl: float = 86400.0, offload=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.offload = offload
+        self._inflight = {}     # key -> (fingerprint, future); event loop thread only
+        self.executed = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.reused = 0
+        self.errors = 0
+
+    @staticmethod
+    def fingerprint(*parts) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else str(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def run(self, scope: str, key: str, fingerprint: str, execute) -> Response:
+        # execute() -> a Response, or a value returned as 200 JSON
+        store_key = f"idem:{scope}:{key}"
+
+        inflight = self._inflight.get(store_key)
+        if inflight is not None:
+            return await self._join(inflight, fingerprint)
+
+        try:
+            stored = await self._call(self.backend.get, store_key, _MISSING)
+        except Exception:
+            self.errors += 1
+            stored = _MISSING
+        if stored is not _MISSING:
+            self._check(stored[0], fingerprint)
+            self.replayed += 1
+            return _response(stored[1], stored[2], replayed=True)
+        inflight = self._inflight.get(store_key)
+        if inflight is not None:
+            # Started while we were reading a remote backend
+            return await self._join(inflight, fingerprint)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[store_key] = (fingerprint, future)
+        try:
+            result = await execute()
+            if isinstance(result, Response):
+                status_code, body = result.status_code, result.body
+            else:
+                status_code, body = 200, dumps(result)
+            self.executed += 1
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()      # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            del self._inflight[store_key]
+        future.set_result((status_code, body))
+        if 200 <= status_code < 300:
+            try:
+                await self._call(self.backend.set, store_key, (fingerprint, status_code, body), self.ttl)
+            except Exception:
+                self.errors += 1
+        return _response(status_code, body, replayed=False)
+
+    async def _join(self, inflight, fingerprint):
+        self._check(inflight[0], fingerprint)
+        self.coalesced += 1
+        status_code, body = await asyncio.shield(inflight[1])
+        return _response(status_code, body, replayed=True)
+
+    def _check(self, stored_fingerprint, fingerprint):
+        if stored_fingerprint != fingerprint:
+            self.reused += 1
+            raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+            "reused": self.reused,
+            "errors": self.errors,
+            **self.backend.stats(),
+        }
+
+    async def _call(self, fn, *args):
+        if self.backend.is_local or self.offload is None:
+            return fn(*args)
+        return await self.offload(fn, *args)
+
+
+def _response(status_code: int, body: bytes, replayed: bool) -> Response:
+    return Response(
+        content=body, status_code=status_code, media_type="application/json",
+        headers={"Idempotent-Replayed": "true" if replayed else "false"},
+    )
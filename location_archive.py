@@ -0,0 +1,145 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+ARCHIVE_CHUNK_ROWS = 50000
+
+
+class LocationMaintenance:
+    # Retention for the driver_locations history: exports whole days past the
+    # retention window to Parquet (one file per day), then runs
+    # sp_compact_driver_locations to downsample recent history, truncate the
+    # expired partitions and pre-create upcoming ones.
+    def __init__(
+        self,
+        pool,
+        retention_days: int = 30,
+        compact_after_hours: int = 24,
+        bucket_seconds: int = 30,
+        archive_dir: str = None,
+        compression: str = "zstd",
+    ):
+        self.pool = pool
+        self.retention_days = retention_days
+        self.compact_after_hours = compact_after_hours
+        self.bucket_seconds = bucket_seconds
+        self.archive_dir = archive_dir
+        self.compression = compression
+        self._lock = threading.Lock()   # one run at a time
+        self._runs = 0
+        self._last_run = {}
+
+    def run_once(self) -> dict:
+        with self._lock:
+            started = time.perf_counter()
+            purge_before = datetime.combine(
+                datetime.now().date() - timedelta(days=self.retention_days), datetime.min.time()
+            )
+            archived = self.archive(purge_before) if self.archive_dir else []
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("""
+                        EXEC sp_compact_driver_locations
+                            @compact_after_hours = ?, @bucket_seconds = ?, @retention_days = ?
+                    """, self.compact_after_hours, self.bucket_seconds, self.retention_days)
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+
+            self._runs += 1
+            self._last_run = {
+                "at": datetime.now().isoformat(),
+                "archived_files": archived,
+                "rows_compacted": row.rows_compacted if row else 0,
+                "partitions_purged": row.partitions_purged if row else 0,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            return self._last_run
+
+    def archive(self, before: datetime) -> list:
+        # Days already on disk are skipped, so a failed purge can simply rerun
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("LOCATION_ARCHIVE_DIR requires the 'pyarrow' package")
+
+        schema = pa.schema([
+            ("driver_id", pa.int32()),
+            ("latitude", pa.float64()),
+            ("longitude", pa.float64()),
+            ("recorded_at", pa.timestamp("ms")),
+        ])
+        os.makedirs(self.archive_dir, exist_ok=True)
+        written = []
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT MIN(recorded_at) FROM driver_locations WHERE recorded_at < ?", before)
+                oldest = cursor.fetchone()[0]
+                day = oldest.date() if oldest else before.date()
+                while day < before.date():
+                    path = os.path.join(self.archive_dir, f"driver_locations_{day.isoformat()}.parquet")
+                    if not os.path.exists(path):
+                        start = datetime.combine(day, datetime.min.time())
+                        cursor.execute("""
+                            SELECT driver_id, location.Lat AS latitude, location.Long AS longitude, recorded_at
+                            FROM driver_locations
+                            WHERE recorded_at >= ? AND recorded_at < ?
+                            ORDER BY recorded_at, driver_id
+                        """, start, start + timedelta(days=1))
+                        if self._write_day(cursor, path, schema, pa, pq):
+                            written.append(os.path.basename(path))
+                    day += timedelta(days=1)
+            finally:
+                cursor.close()
+        return written
+
+    def _write_day(self, cursor, path, schema, pa, pq) -> bool:
+        # Stream the day in chunks; the file only appears once it is complete
+        partial = path + ".partial"
+        writer = None
+        try:
+            while True:
+                rows = cursor.fetchmany(ARCHIVE_CHUNK_ROWS)
+                if not rows:
+                    break
+                if writer is None:
+                    writer = pq.ParquetWriter(partial, schema, compression=self.compression)
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema,
+                ))
+        except Exception:
+            if writer is not None:
+                writer.close()
+                os.remove(partial)
+            raise
+        if writer is None:
+            return False
+        writer.close()
+        os.replace(partial, path)
+        return True
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"Location maintenance error: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "retention_days": self.retention_days,
+            "compact_after_hours": self.compact_after_hours,
+            "bucket_seconds": self.bucket_seconds,
+            "archive_dir": self.archive_dir,
+            "runs": self._runs,
+            "last_run": self._last_run,
+        }
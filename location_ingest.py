@@ -0,0 +1,246 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+DURABILITY_MODES = ("buffered", "flushed")
+
+
+class IngestBufferFull(Exception):
+    pass
+
+
+class _Pending:
+    __slots__ = ("lat", "lng", "recorded_at", "futures")
+
+    def __init__(self, lat, lng, recorded_at):
+        self.lat = lat
+        self.lng = lng
+        self.recorded_at = recorded_at
+        self.futures = []
+
+
+class LocationIngestor:
+    # Write-behind buffer for driver location pings. Pings are coalesced per
+    # driver (latest wins) and flushed in bulk when the buffer reaches
+    # batch_size or flush_interval elapses.
+    #
+    # Durability:
+    #   buffered - acknowledge once queued; a crash loses at most one interval
+    #   flushed  - acknowledge only after the batch containing the ping commits
+    def __init__(
+        self,
+        pool,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_pending: int = 20000,
+        durability: str = "buffered",
+        on_flush=None,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}")
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.durability = durability
+        self.on_flush = on_flush
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = {}          # driver_id -> _Pending
+        self._statuses = {}         # driver_id -> last current_status seen at flush
+        self._running = False
+        self._thread = None
+
+        # Metrics
+        self._received = 0
+        self._coalesced = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._flush_failures = 0
+        self._flush_latencies = deque(maxlen=256)
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="location-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def submit(self, driver_id: int, lat: float, lng: float):
+        # Returns (future, last_known_status). The future resolves to the
+        # driver's current_status (None for unknown drivers) once flushed.
+        future = Future()
+        with self._lock:
+            self._received += 1
+            entry = self._pending.get(driver_id)
+            if entry is None:
+                if len(self._pending) >= self.max_pending:
+                    self._rejected += 1
+                    raise IngestBufferFull("Location buffer is full")
+                entry = self._pending[driver_id] = _Pending(lat, lng, datetime.now())
+            else:
+                self._coalesced += 1
+                entry.lat, entry.lng, entry.recorded_at = lat, lng, datetime.now()
+            entry.futures.append(future)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+            return future, self._statuses.get(driver_id)
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            statuses = self._write(batch)
+        except Exception as e:
+            with self._lock:
+                self._flush_failures += 1
+                if self.durability == "buffered":
+                    # Already acknowledged: keep the rows unless a newer ping superseded them
+                    for driver_id, entry in batch.items():
+                        if driver_id not in self._pending and len(self._pending) < self.max_pending:
+                            self._pending[driver_id] = _Pending(entry.lat, entry.lng, entry.recorded_at)
+            print(f"Location flush error: {str(e)}")
+            for entry in batch.values():
+                for future in entry.futures:
+                    future.set_exception(e)
+            return 0
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._flushes += 1
+            self._rows_flushed += len(batch)
+            self._flush_latencies.append(elapsed)
+            for driver_id, (current_status, _) in statuses.items():
+                self._statuses[driver_id] = current_status
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush(batch, statuses)
+            except Exception as e:
+                print(f"Location flush callback error: {str(e)}")
+
+        for driver_id, entry in batch.items():
+            result = statuses.get(driver_id)
+            for future in entry.futures:
+                future.set_result(result[0] if result else None)
+        return len(batch)
+
+    def set_status(self, driver_id: int, current_status: str):
+        # Keep acknowledgements in step with status changes made elsewhere
+        with self._lock:
+            if driver_id in self._statuses:
+                self._statuses[driver_id] = current_status
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._flush_latencies)
+            return {
+                "durability": self.durability,
+                "queue_depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "received": self._received,
+                "coalesced": self._coalesced,
+                "rejected": self._rejected,
+                "flushes": self._flushes,
+                "rows_flushed": self._rows_flushed,
+                "flush_failures": self._flush_failures,
+                "flush_latency_ms": {
+                    "avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                    "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+                },
+            }
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                if len(self._pending) < self.batch_size:
+                    self._wakeup.wait(self.flush_interval)
+                if not self._running:
+                    return
+            self.flush()
+
+    def _write(self, batch: dict) -> dict:
+        rows = [
+            (driver_id, entry.lat, entry.lng, entry.recorded_at)
+            for driver_id, entry in batch.items()
+        ]
+        statuses = {}
+        with self.pool.connection() as conn:
+            conn.autocommit = False
+            cursor = conn.cursor()
+            try:
+                # Stage the batch, then write history and latest position set-based
+                cursor.execute("""
+                    CREATE TABLE #location_batch (
+                        driver_id INT PRIMARY KEY, latitude FLOAT, longitude FLOAT, recorded_at DATETIME
+                    )
+                """)
+                cursor.fast_executemany = True
+                cursor.executemany("INSERT INTO #location_batch VALUES (?, ?, ?, ?)", rows)
+
+                # Unknown driver ids are skipped rather than failing the whole batch
+                cursor.execute("""
+                    INSERT INTO driver_locations (driver_id, location, recorded_at)
+                    SELECT b.driver_id, geography::Point(b.latitude, b.longitude, 4326), b.recorded_at
+                    FROM #location_batch b
+                    WHERE EXISTS (SELECT 1 FROM drivers d WHERE d.driver_id = b.driver_id)
+                """)
+                cursor.execute("""
+                    UPDATE c
+                    SET location = geography::Point(b.latitude, b.longitude, 4326),
+                        latitude = b.latitude, longitude = b.longitude, recorded_at = b.recorded_at
+                    FROM driver_current_location c
+                    JOIN #location_batch b ON c.driver_id = b.driver_id
+                    WHERE b.recorded_at >= c.recorded_at
+                """)
+                cursor.execute("""
+                    INSERT INTO driver_current_location (driver_id, location, latitude, longitude, recorded_at)
+                    SELECT b.driver_id, geography::Point(b.latitude, b.longitude, 4326),
+                           b.latitude, b.longitude, b.recorded_at
+                    FROM #location_batch b
+                    WHERE EXISTS (SELECT 1 FROM drivers d WHERE d.driver_id = b.driver_id)
+                    AND NOT EXISTS (SELECT 1 FROM driver_current_location c WHERE c.driver_id = b.driver_id)
+                """)
+
+                cursor.execute("""
+                    UPDATE d
+                    SET current_status = 'available'
+                    FROM drivers d
+                    JOIN #location_batch b ON d.driver_id = b.driver_id
+                    WHERE d.current_status = 'offline'
+                """)
+                cursor.execute("""
+                    SELECT d.driver_id, d.current_status, d.is_verified
+                    FROM drivers d
+                    JOIN #location_batch b ON d.driver_id = b.driver_id
+                """)
+                for row in cursor.fetchall():
+                    statuses[row.driver_id] = (row.current_status, bool(row.is_verified))
+                cursor.execute("DROP TABLE #location_batch")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.autocommit = True
+        return statuses
@@ -0,0 +1,401 @@
+import contextvars
+import re
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, shared by the HTTP and database histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# [db seconds, statements] for the request being served; copied into DB worker threads
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}       # label values tuple -> float
+
+    def inc(self, labels=(), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} counter")
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}       # label values tuple -> [bucket counts (+Inf last), sum]
+
+    def observe(self, labels, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][index] += 1
+            data[1] += value
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if isinstance(bound, str) else _number(bound)
+                out.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+
+
+class Gauge:
+    # Read at scrape time: fn() returns a number, or {label values tuple: number}
+    def __init__(self, name: str, help: str, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} gauge")
+        value = self.fn()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, v in items:
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(v)}")
+
+
+class Metrics:
+    # Request, statement and connection-pool metrics in Prometheus text format.
+    # Recording is a bisect plus a dict update under a lock, so it stays in the
+    # low microseconds; spans are only created when a tracer is configured.
+    def __init__(self, tracer=None, max_statement_names: int = 2048):
+        self.tracer = tracer
+        self.max_statement_names = max_statement_names
+        self._statement_names = {}      # sql text -> statement label
+        self._routes = None             # endpoint -> path template, built on first request
+        self._collectors = []
+
+        self.http_duration = self.histogram(
+            "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+        self.http_db_duration = self.histogram(
+            "http_request_db_seconds", "Time spent in database statements per HTTP request", ("method", "route"))
+        self.http_exceptions = self.counter(
+            "http_unhandled_exceptions_total", "Exceptions that escaped the handlers", ("route", "type"))
+        self.db_execute = self.histogram(
+            "db_statement_duration_seconds", "Statement / stored procedure execution time", ("statement",))
+        self.db_fetch = self.counter(
+            "db_fetch_seconds_total", "Time spent fetching result rows and sets", ("statement",))
+        self.db_rows = self.counter(
+            "db_rows_fetched_total", "Result rows fetched", ("statement",))
+        self.db_errors = self.counter(
+            "db_errors_total", "Failed statements", ("statement", "type", "sqlstate"))
+        self.pool_acquire = self.histogram(
+            "db_pool_acquire_seconds", "Time to check out a pooled connection")
+
+    # Registry
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        return self._register(Gauge(name, help, fn, labelnames))
+
+    def _register(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        out = []
+        for collector in self._collectors:
+            try:
+                collector.render(out)
+            except Exception as e:
+                out.append(f"# {collector.name} unavailable: {type(e).__name__}")
+        out.append("")
+        return "\n".join(out)
+
+    # Database
+    def instrument(self, conn):
+        return InstrumentedConnection(conn, self)
+
+    def observe_acquire(self, seconds: float):
+        self.pool_acquire.observe((), seconds)
+
+    def statement_name(self, sql: str) -> str:
+        name = self._statement_names.get(sql)
+        if name is None:
+            name = _statement_name(sql)
+            if len(self._statement_names) < self.max_statement_names:
+                self._statement_names[sql] = name
+        return name
+
+    def _observe_statement(self, name, seconds):
+        self.db_execute.observe((name,), seconds)
+        current = _request_db.get()
+        if current is not None:
+            current[0] += seconds
+            current[1] += 1
+
+    def _observe_fetch(self, name, seconds, rows):
+        self.db_fetch.inc((name,), seconds)
+        if rows:
+            self.db_rows.inc((name,), rows)
+        current = _request_db.get()
+        if current is not None:
+            current[0] += seconds
+
+    def _observe_error(self, name, exc):
+        args = getattr(exc, "args", ())
+        sqlstate = args[0] if args and isinstance(args[0], str) and len(args[0]) == 5 else ""
+        self.db_errors.inc((name, type(exc).__name__, sqlstate))
+
+    # HTTP
+    def route_template(self, app, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            self._routes = {
+                getattr(route, "endpoint", None): route.path for route in app.routes if hasattr(route, "path")
+            }
+        return self._routes.get(endpoint, "unmatched")
+
+
+class MetricsMiddleware:
+    # Pure ASGI middleware (no per-request task or body buffering)
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metrics = self.metrics
+        status_code = 500
+        db_time = [0.0, 0]
+        token = _request_db.set(db_time)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        span = None
+        if metrics.tracer is not None:
+            span = metrics.tracer.start_span(f"{scope['method']} {scope['path']}", kind=_server_kind())
+            span_token = _attach_span(span)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            metrics.http_exceptions.inc((metrics.route_template(scope["app"], scope), type(e).__name__))
+            if span is not None:
+                span.record_exception(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db.reset(token)
+            route = metrics.route_template(scope["app"], scope)
+            metrics.http_duration.observe((scope["method"], route, str(status_code)), elapsed)
+            if db_time[1]:
+                metrics.http_db_duration.observe((scope["method"], route), db_time[0])
+            if span is not None:
+                span.update_name(f"{scope['method']} {route}")
+                span.set_attribute("http.route", route)
+                span.set_attribute("http.status_code", status_code)
+                span.set_attribute("db.statements", db_time[1])
+                span.end()
+                _detach_span(span_token)
+
+
+class InstrumentedConnection:
+    # pyodbc connection proxy whose cursors time every statement
+    __slots__ = ("_conn", "_metrics")
+
+    def __init__(self, conn, metrics: Metrics):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_metrics", metrics)
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor(), self._metrics)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+class InstrumentedCursor:
+    __slots__ = ("_cursor", "_metrics", "_statement")
+
+    def __init__(self, cursor, metrics: Metrics):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_metrics", metrics)
+        object.__setattr__(self, "_statement", "unknown")
+
+    def execute(self, sql, *params):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, params):
+        return self._run(self._cursor.executemany, sql, (params,))
+
+    def _run(self, method, sql, params):
+        metrics = self._metrics
+        name = metrics.statement_name(sql)
+        object.__setattr__(self, "_statement", name)
+        span = None
+        if metrics.tracer is not None:
+            span = metrics.tracer.start_span(f"db {name}", kind=_client_kind())
+            span.set_attribute("db.system", "mssql")
+            span.set_attribute("db.statement", name)
+        start = time.perf_counter()
+        try:
+            method(sql, *params)
+        except Exception as e:
+            metrics._observe_error(name, e)
+            if span is not None:
+                span.record_exception(e)
+            raise
+        finally:
+            metrics._observe_statement(name, time.perf_counter() - start)
+            if span is not None:
+                span.end()
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._metrics._observe_fetch(self._statement, time.perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._metrics._observe_fetch(self._statement, time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        self._metrics._observe_fetch(self._statement, time.perf_counter() - start, len(rows))
+        return rows
+
+    def nextset(self):
+        start = time.perf_counter()
+        more = self._cursor.nextset()
+        self._metrics._observe_fetch(self._statement, time.perf_counter() - start, 0)
+        return more
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+_EXEC = re.compile(r"^(?:EXEC(?:UTE)?\s+(?:@\w+\s*=\s*)?|\{\s*\??\s*=?\s*CALL\s+)([\w.\[\]]+)", re.I)
+_VERB = re.compile(r"^(SELECT|INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|DROP|WITH|IF|DECLARE)\b", re.I)
+_TARGET = re.compile(r"\b(?:FROM|INTO|UPDATE|MERGE|TABLE)\s+([#\w.\[\]]+)", re.I)
+_PREAMBLE = re.compile(r"^(?:\s|--[^\n]*\n|SET\s+\w+\s+\w+\s*;?)+", re.I)
+
+
+def _statement_name(sql: str) -> str:
+    # "sp_request_ride" for procedure calls, otherwise "<verb> <first table>"
+    text = _PREAMBLE.sub("", sql, count=1)
+    match = _EXEC.match(text)
+    if match:
+        return match.group(1).strip("[]").split(".")[-1]
+    verb = _VERB.match(text)
+    if verb is None:
+        return "other"
+    target = _TARGET.search(text, verb.end())
+    name = verb.group(1).lower()
+    return f"{name} {target.group(1).strip('[]').lower()}" if target else name
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# OpenTelemetry (optional)
+def configure_tracing(exporter: str, service_name: str = "uber-api"):
+    # "none" disables spans entirely; "noop" uses whatever tracer provider the
+    # process has (the API's no-op one unless an SDK is configured); "console"
+    # installs the SDK with a batched console exporter for local debugging.
+    if exporter == "none":
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        raise RuntimeError("TRACING_EXPORTER requires the 'opentelemetry-api' package")
+    if exporter == "console":
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        except ImportError:
+            raise RuntimeError("TRACING_EXPORTER=console requires the 'opentelemetry-sdk' package")
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+        trace.set_tracer_provider(provider)
+    elif exporter != "noop":
+        raise ValueError(f"Unknown TRACING_EXPORTER: {exporter}")
+    return trace.get_tracer(__name__)
+
+
+def _server_kind():
+    from opentelemetry.trace import SpanKind
+    return SpanKind.SERVER
+
+
+def _client_kind():
+    from opentelemetry.trace import SpanKind
+    return SpanKind.CLIENT
+
+
+def _attach_span(span):
+    from opentelemetry import context, trace
+    return context.attach(trace.set_span_in_context(span))
+
+
+def _detach_span(token):
+    from opentelemetry import context
+    context.detach(token)
@@ -0,0 +1,129 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+
+from rows import dumps, mapper_for
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 1000
+
+
+def encode_cursor(values) -> str:
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types) -> list:
+    # types: one of datetime/int/str per key column
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if len(payload) != len(types):
+            raise ValueError("wrong arity")
+        return [datetime.fromisoformat(v) if t is datetime else t(v) for v, t in zip(payload, types)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset_query(select_sql: str, where_sql: str, params: list, keys, descending: bool, after, limit):
+    # Keyset pagination over an ordered tuple of key columns. `after` holds the
+    # key values of the last row already seen, so with an index on the filter
+    # columns followed by the keys (schema_ride_pagination.sql) each page is a seek.
+    op = "<" if descending else ">"
+    direction = "DESC" if descending else "ASC"
+    conditions = [where_sql] if where_sql else []
+    params = list(params)
+
+    if after is not None:
+        # (k1 op v1) OR (k1 = v1 AND k2 op v2) OR ...
+        # Datetimes come back from the cursor with microseconds; cast them to the
+        # columns' DATETIME (1/300 s) so they compare equal to the stored value
+        marks = ["CAST(? AS DATETIME)" if isinstance(v, datetime) else "?" for v in after]
+        clauses = []
+        for i, key in enumerate(keys):
+            parts = [f"{k} = {m}" for k, m in zip(keys[:i], marks)] + [f"{key} {op} {marks[i]}"]
+            clauses.append("(" + " AND ".join(parts) + ")")
+            params.extend(after[:i + 1])
+        conditions.append("(" + " OR ".join(clauses) + ")")
+
+    top = ""
+    if limit is not None:
+        top = "TOP (?) "
+        params.insert(0, limit)
+
+    sql = select_sql.replace("SELECT ", "SELECT " + top, 1)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + ", ".join(f"{k} {direction}" for k in keys)
+    return sql, params
+
+
+def fetch_page(conn, sql: str, params: list, limit: int, key_names):
+    # Runs a keyset query built with limit + 1 and returns (rows, next_cursor)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, *params)
+        rows = mapper_for(sql).all(cursor, cursor.fetchmany(limit + 1))
+    finally:
+        cursor.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][k] for k in key_names])
+    return rows, next_cursor
+
+
+async def stream_ndjson(db, sql: str, params: list, chunk_size: int = STREAM_CHUNK_SIZE):
+    mapper = mapper_for(sql)
+    async for cursor, rows in _stream_rows(db, sql, params, chunk_size):
+        yield b"".join(dumps(record) + b"\n" for record in mapper.all(cursor, rows))
+
+
+async def stream_csv(db, sql: str, params: list, chunk_size: int = STREAM_CHUNK_SIZE):
+    mapper = mapper_for(sql)
+    header_sent = False
+    async for cursor, rows in _stream_rows(db, sql, params, chunk_size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if not header_sent:
+            writer.writerow(mapper.columns(cursor))
+            header_sent = True
+        writer.writerows(mapper.values(cursor, rows))
+        yield buffer.getvalue().encode()
+
+
+async def _stream_rows(db, sql: str, params: list, chunk_size: int):
+    # Rows leave the database in fetchmany() chunks and are written as they
+    # arrive; blocking calls go through the database executor.
+    conn = await db.submit(db.pool.acquire)
+    cursor = None
+    discard = False
+    try:
+        cursor = await db.submit(_execute, conn, sql, params)
+        while True:
+            rows = await db.submit(cursor.fetchmany, chunk_size)
+            if not rows:
+                break
+            yield cursor, rows
+    except Exception as e:
+        discard = type(e).__name__ == "OperationalError"
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        db.pool.release(conn, discard=discard)
+
+
+def _execute(conn, sql, params):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, *params)
+    except Exception:
+        cursor.close()
+        raise
+    return cursor
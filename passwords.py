@@ -0,0 +1,133 @@
+import asyncio
+import hmac
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+
+class HasherOverloaded(Exception):
+    pass
+
+
+# One context per process; worker processes build theirs on first use
+_contexts = {}
+
+
+def _context(rounds: int) -> CryptContext:
+    context = _contexts.get(rounds)
+    if context is None:
+        context = _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return context
+
+
+def hash_password(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def verify_password(password: str, stored_hash: str, rounds: int):
+    # -> (matches, replacement hash or None). Values that aren't a recognised
+    # hash are legacy client-supplied secrets: compare them directly and
+    # upgrade them to bcrypt on a match.
+    context = _context(rounds)
+    if not stored_hash or context.identify(stored_hash, required=False) is None:
+        if stored_hash and hmac.compare_digest(password.encode(), stored_hash.encode()):
+            return True, context.hash(password)
+        return False, None
+    return context.verify_and_update(password, stored_hash)
+
+
+class PasswordHasher:
+    # Runs bcrypt in a small process pool so logins never hold the event loop
+    # or a database worker. Calls beyond max_pending are refused with
+    # HasherOverloaded rather than queued behind a login spike.
+    def __init__(self, workers: int = None, max_pending: int = 64, rounds: int = 12):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._dummy_hash = None
+        self.hashes = 0
+        self.verifications = 0
+        self.failures = 0
+        self.rehashes = 0
+        self.rejected = 0
+        self._latencies = deque(maxlen=1024)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            # Verified against for unknown accounts so they cost the same
+            self._dummy_hash = hash_password(os.urandom(16).hex(), self.rounds)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def hash(self, password: str) -> str:
+        result = await self._submit(hash_password, password, self.rounds)
+        self.hashes += 1
+        return result
+
+    async def hash_many(self, passwords) -> list:
+        # Bulk imports: stay within max_pending so logins aren't starved
+        window = max(1, self.max_pending // 2)
+        hashed = []
+        for i in range(0, len(passwords), window):
+            hashed.extend(await asyncio.gather(*(self.hash(p) for p in passwords[i:i + window])))
+        return hashed
+
+    def is_hash(self, value: str) -> bool:
+        return _context(self.rounds).identify(value, required=False) is not None
+
+    async def verify(self, password: str, stored_hash: str = None):
+        # stored_hash None means the account doesn't exist
+        if stored_hash is None:
+            await self._submit(verify_password, password, self._dummy_hash, self.rounds)
+            self.failures += 1
+            return False, None
+        matches, new_hash = await self._submit(verify_password, password, stored_hash, self.rounds)
+        self.verifications += 1
+        if not matches:
+            self.failures += 1
+        elif new_hash is not None:
+            self.rehashes += 1
+        return matches, new_hash
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "in_flight": self._pending,
+            "max_pending": self.max_pending,
+            "hashes": self.hashes,
+            "verifications": self.verifications,
+            "failures": self.failures,
+            "rehashes": self.rehashes,
+            "rejected": self.rejected,
+            "latency_ms": {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 3) if latencies else 0.0,
+            },
+        }
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherOverloaded("Too many concurrent password checks")
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+            with self._lock:
+                self._pending -= 1
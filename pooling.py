@@ -0,0 +1,324 @@
+import threading
+import time
+
+from geo_index import DriverIndex, haversine_km
+
+PICKUP = "pickup"
+DROPOFF = "dropoff"
+
+
+class _Route:
+    __slots__ = ("stops", "legs", "riders", "version")
+
+    def __init__(self):
+        self.stops = []         # [(ride_id, kind, lat, lng)] in driving order
+        self.legs = []          # seconds between consecutive stops (None = not known yet)
+        self.riders = {}        # ride_id -> [pickup_deadline, max_ride_seconds, picked_up_at]
+        self.version = 0
+
+
+class PoolPlanner:
+    # Live stop sequence of every driver carrying pool riders. A new pool
+    # request is tried at every pickup/dropoff position of the routes of
+    # nearby pool vehicles (spatial prefilter: the vehicles' own grid index,
+    # search_radius_km around the pickup). An insertion is feasible when the
+    # vehicle never carries more than `capacity` riders at once, every rider
+    # not yet on board is still picked up within max_wait_seconds of being
+    # matched, and nobody's time in the vehicle exceeds their direct trip plus
+    # max(max_detour_ratio * direct, min_detour_seconds). The feasible
+    # insertion adding the least vehicle time wins. Planning works on a
+    # snapshot outside the lock; it is applied only if the route is unchanged.
+    def __init__(self, travel_seconds, capacity: int = 3, max_riders: int = 4,
+                 max_wait_seconds: float = 600.0, max_detour_ratio: float = 0.5,
+                 min_detour_seconds: float = 300.0, search_radius_km: float = 3.0,
+                 candidates: int = 8, arrive_m: float = 75.0, cell_km: float = 1.0, clock=time.monotonic):
+        self.travel_seconds = travel_seconds    # ([(lat, lng)], (lat, lng)) -> [seconds]
+        self.clock = clock
+        self.capacity = capacity
+        self.max_riders = max_riders
+        self.max_wait_seconds = max_wait_seconds
+        self.max_detour_ratio = max_detour_ratio
+        self.min_detour_seconds = min_detour_seconds
+        self.search_radius_km = search_radius_km
+        self.candidates = candidates
+        self.arrive_km = arrive_m / 1000
+        self._vehicles = DriverIndex(cell_km=cell_km)
+        self._lock = threading.Lock()
+        self._routes = {}       # driver_id -> _Route
+        self._ride_driver = {}  # ride_id -> driver_id
+        self._plans = 0
+        self._inserted = 0
+        self._no_vehicle = 0
+        self._infeasible = 0
+        self._conflicts = 0
+        self._routes_checked = 0
+        self._added_seconds_total = 0.0
+        self._plan_seconds_total = 0.0
+
+    def open(self, driver_id: int, ride_id: int, pickup, dropoff, position=None):
+        # A pool ride accepted through normal dispatch starts (or, on restart,
+        # extends) the driver's route
+        direct = self.travel_seconds([pickup], dropoff)[0]
+        now = self.clock()
+        with self._lock:
+            route = self._routes.get(driver_id)
+            if route is None:
+                route = self._routes[driver_id] = _Route()
+            if route.stops:
+                route.legs.append(None)
+            route.stops.append((ride_id, PICKUP, pickup[0], pickup[1]))
+            route.stops.append((ride_id, DROPOFF, dropoff[0], dropoff[1]))
+            route.legs.append(direct)
+            route.riders[ride_id] = [now + self.max_wait_seconds, self._max_ride(direct), None]
+            route.version += 1
+            self._ride_driver[ride_id] = driver_id
+        lat, lng = position if position is not None else pickup
+        self._vehicles.update(driver_id, lat, lng, available=True)
+
+    def insert(self, ride_id: int, pickup, dropoff, attempts: int = 2):
+        # Best feasible insertion, applied; None when no nearby route can take it
+        for _ in range(attempts):
+            insertion = self.plan(ride_id, pickup, dropoff)
+            if insertion is None:
+                return None
+            if self.commit(insertion):
+                return insertion
+        return None
+
+    def plan(self, ride_id: int, pickup, dropoff):
+        started = time.perf_counter()
+        now = self.clock()
+        nearby = self._vehicles.nearest(pickup[0], pickup[1], k=self.candidates, radius_km=self.search_radius_km)
+        best = None
+        if nearby:
+            direct = self.travel_seconds([pickup], dropoff)[0]
+            max_ride = self._max_ride(direct)
+            for driver_id, _ in nearby:
+                snapshot = self._snapshot(driver_id, now)
+                if snapshot is None:
+                    continue
+                option = _best_insertion(snapshot, pickup, dropoff, max_ride, self.travel_seconds,
+                                         self.capacity, self.max_wait_seconds)
+                if option is not None and (best is None or option[:2] < best[:2]):
+                    best = option + (snapshot, max_ride)
+
+        with self._lock:
+            self._plans += 1
+            self._routes_checked += len(nearby)
+            self._plan_seconds_total += time.perf_counter() - started
+            if not nearby:
+                self._no_vehicle += 1
+            elif best is None:
+                self._infeasible += 1
+        if best is None:
+            return None
+
+        added, pickup_eta, dropoff_eta, i, j, legs, snapshot, max_ride = best
+        driver_id, version, _, stops, _, _ = snapshot
+        new_stops = (stops[:i] + [(ride_id, PICKUP, pickup[0], pickup[1])] + stops[i:j]
+                     + [(ride_id, DROPOFF, dropoff[0], dropoff[1])] + stops[j:])
+        return {
+            "driver_id": driver_id,
+            "ride_id": ride_id,
+            "version": version,
+            "stops": new_stops,
+            "legs": legs,
+            "max_ride_seconds": max_ride,
+            "pickup_eta_seconds": pickup_eta,
+            "dropoff_eta_seconds": dropoff_eta,
+            "added_seconds": added,
+        }
+
+    def commit(self, insertion: dict) -> bool:
+        driver_id, ride_id = insertion["driver_id"], insertion["ride_id"]
+        now = self.clock()
+        with self._lock:
+            route = self._routes.get(driver_id)
+            if route is None or route.version != insertion["version"] or ride_id in self._ride_driver:
+                self._conflicts += 1
+                return False
+            route.stops = list(insertion["stops"])
+            route.legs = list(insertion["legs"])
+            route.riders[ride_id] = [now + self.max_wait_seconds, insertion["max_ride_seconds"], None]
+            route.version += 1
+            self._ride_driver[ride_id] = driver_id
+            self._inserted += 1
+            self._added_seconds_total += insertion["added_seconds"]
+        return True
+
+    def remove(self, ride_id: int):
+        # Ride completed, cancelled or its insertion rolled back. Returns the
+        # driver, or None if the ride wasn't on a route.
+        with self._lock:
+            driver_id = self._ride_driver.pop(ride_id, None)
+            route = self._routes.get(driver_id)
+            if route is None:
+                return driver_id
+            route.riders.pop(ride_id, None)
+            stops, legs = [], []
+            for k, stop in enumerate(route.stops):
+                if stop[0] == ride_id:
+                    continue
+                if stops:
+                    # Neighbours of a removed stop need a new leg
+                    legs.append(route.legs[k - 1] if route.stops[k - 1] is stops[-1] else None)
+                stops.append(stop)
+            route.stops, route.legs = stops, legs
+            route.version += 1
+            closed = not route.riders
+            if closed:
+                del self._routes[driver_id]
+        if closed:
+            self._vehicles.remove(driver_id)
+        return driver_id
+
+    def update_position(self, driver_id: int, lat: float, lng: float):
+        # Moves the vehicle and pops the stops it has reached; returns them
+        if driver_id not in self._routes:
+            return []
+        self._vehicles.update(driver_id, lat, lng, available=True)
+        reached = []
+        with self._lock:
+            route = self._routes.get(driver_id)
+            if route is None:
+                return []
+            while route.stops and haversine_km(lat, lng, route.stops[0][2], route.stops[0][3]) <= self.arrive_km:
+                stop = route.stops.pop(0)
+                if route.legs:
+                    route.legs.pop(0)
+                if stop[1] == PICKUP:
+                    route.riders[stop[0]][2] = self.clock()
+                reached.append(stop)
+            if reached:
+                route.version += 1
+        return reached
+
+    def route_of(self, driver_id: int):
+        with self._lock:
+            route = self._routes.get(driver_id)
+            if route is None:
+                return None
+            return [
+                {"ride_id": ride_id, "kind": kind, "latitude": lat, "longitude": lng}
+                for ride_id, kind, lat, lng in route.stops
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "routes": len(self._routes),
+                "riders": len(self._ride_driver),
+                "plans": self._plans,
+                "inserted": self._inserted,
+                "no_vehicle": self._no_vehicle,
+                "infeasible": self._infeasible,
+                "conflicts": self._conflicts,
+                "avg_routes_checked": round(self._routes_checked / self._plans, 2) if self._plans else 0.0,
+                "avg_added_seconds": round(self._added_seconds_total / self._inserted, 1) if self._inserted else 0.0,
+                "avg_plan_ms": round(self._plan_seconds_total / self._plans * 1000, 3) if self._plans else 0.0,
+            }
+
+    def _max_ride(self, direct: float) -> float:
+        return direct + max(direct * self.max_detour_ratio, self.min_detour_seconds)
+
+    def _snapshot(self, driver_id, now):
+        position = self._vehicles.position(driver_id)
+        with self._lock:
+            route = self._routes.get(driver_id)
+            if route is None or position is None or len(route.riders) >= self.max_riders:
+                return None
+            # Deadlines relative to now, in the same clock as the planned times
+            riders = {
+                ride_id: (deadline - now, max_ride, None if picked_up is None else picked_up - now)
+                for ride_id, (deadline, max_ride, picked_up) in route.riders.items()
+            }
+            return driver_id, route.version, position, list(route.stops), list(route.legs), riders
+
+
+def _best_insertion(snapshot, pickup, dropoff, max_ride, travel_seconds, capacity, max_wait):
+    # Tries the new pickup after every point of the route (point 0 is the
+    # vehicle, point k the k-th stop) and the dropoff after every point from
+    # there on. Returns (added, pickup_eta, dropoff_eta, i, j, new_legs) for
+    # the cheapest feasible pair: pickup goes before stop i, dropoff before stop j.
+    _, _, position, stops, legs, riders = snapshot
+    n = len(stops)
+    points = [position] + [(stop[2], stop[3]) for stop in stops]
+    to_pickup = travel_seconds(points, pickup)
+    to_dropoff = travel_seconds(points + [pickup], dropoff)
+    from_pickup = [travel_seconds([pickup], point)[0] for point in points[1:]]
+    from_dropoff = [travel_seconds([dropoff], point)[0] for point in points[1:]]
+    base = [travel_seconds([position], points[1])[0]] if n else []
+    for k in range(n - 1):
+        base.append(legs[k] if legs[k] is not None else travel_seconds([points[k + 1]], points[k + 2])[0])
+
+    arrive = [0.0]                  # arrival time at each point on the current route
+    for seconds in base:
+        arrive.append(arrive[-1] + seconds)
+    pickup_point = {stop[0]: k for k, stop in enumerate(stops, start=1) if stop[1] == PICKUP}
+    load = [sum(1 for stop in stops if stop[1] == DROPOFF and stop[0] not in pickup_point)]   # on board now
+    for ride_id, kind, _, _ in stops:
+        load.append(load[-1] + (1 if kind == PICKUP else -1))
+
+    best = None
+    for i in range(n + 1):
+        t_pickup = arrive[i] + to_pickup[i]
+        if t_pickup > max_wait:
+            continue
+        peak = load[i]
+        for j in range(i, n + 1):
+            if j > i:
+                peak = max(peak, load[j])
+            if peak + 1 > capacity:
+                break
+            if j == i:
+                t_dropoff = t_pickup + to_dropoff[n + 1]
+                shift_inside = 0.0
+                shift_after = t_dropoff + from_dropoff[i] - arrive[i + 1] if i < n else 0.0
+            else:
+                shift_inside = t_pickup + from_pickup[i] - arrive[i + 1]
+                t_dropoff = arrive[j] + shift_inside + to_dropoff[j]
+                shift_after = t_dropoff + from_dropoff[j] - arrive[j + 1] if j < n else 0.0
+            if t_dropoff - t_pickup > max_ride:
+                continue
+            added = (arrive[n] + shift_after if j < n else t_dropoff) - arrive[n]
+            if best is not None and (added, t_pickup) >= best[:2]:
+                continue
+            if not _existing_riders_ok(stops, riders, pickup_point, arrive, i, j, shift_inside, shift_after):
+                continue
+            best = (added, t_pickup, t_dropoff, i, j)
+    if best is None:
+        return None
+
+    # Legs between consecutive stops of the new sequence
+    _, _, _, i, j = best
+    sequence = [("stop", k) for k in range(i)] + [("pickup", None)] + [("stop", k) for k in range(i, j)] \
+        + [("dropoff", None)] + [("stop", k) for k in range(j, n)]
+    new_legs = []
+    for (a_kind, a), (b_kind, b) in zip(sequence, sequence[1:]):
+        if a_kind == "stop" and b_kind == "stop":
+            new_legs.append(base[b])
+        elif b_kind == "pickup":
+            new_legs.append(to_pickup[a + 1])
+        elif b_kind == "dropoff":
+            new_legs.append(to_dropoff[n + 1] if a_kind == "pickup" else to_dropoff[a + 1])
+        else:
+            new_legs.append(from_pickup[b] if a_kind == "pickup" else from_dropoff[b])
+    return best + (new_legs,)
+
+
+def _existing_riders_ok(stops, riders, pickup_point, arrive, i, j, shift_inside, shift_after):
+    def at(k):
+        return arrive[k] + (0.0 if k <= i else shift_inside if k <= j else shift_after)
+
+    for k, (ride_id, kind, _, _) in enumerate(stops, start=1):
+        if k <= i:
+            continue    # not delayed by the insertion
+        deadline, max_ride, picked_up = riders[ride_id]
+        if kind == PICKUP:
+            if at(k) > deadline:
+                return False
+        else:
+            boarded = picked_up if picked_up is not None else at(pickup_point[ride_id])
+            if at(k) - boarded > max_ride:
+                return False
+    return True
@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    # Per-key token buckets: `burst` attempts up front, refilled at `rate`
+    # per second. Idle keys are forgotten LRU-first beyond max_keys (a
+    # forgotten key simply starts again with a full bucket).
+    def __init__(self, rate: float, burst: int, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # key -> [tokens, updated_at]
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, key) -> float:
+        # Takes one token; returns 0 if allowed, else seconds until one is free
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0.0
+            self.limited += 1
+            return (1 - bucket[0]) / self.rate
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "tracked_keys": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
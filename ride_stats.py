@@ -0,0 +1,92 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pyodbc
+
+# SQLSTATE of a deadlock victim; the backfill takes range locks that live
+# completions can deadlock against, and the batch is simply run again
+_DEADLOCK = "40001"
+
+
+class RideStatsBackfill:
+    # Rebuilds driver_stats / rider_stats in batches of users
+    # (sp_backfill_ride_stats) and the hourly / daily rollups one day at a
+    # time (sp_backfill_ride_rollups). Each batch is its own transaction, so
+    # the job can run next to live traffic and be re-run at any time.
+    def __init__(self, pool, batch_size: int = 1000, retries: int = 3):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.retries = retries
+        self._lock = threading.Lock()   # one run at a time
+        self._runs = 0
+        self._progress = {}
+        self._last_run = {}
+
+    def run_once(self, since: date = None) -> dict:
+        # since: first day of rollups to rebuild; default the first ride's day
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Ride stats backfill is already running")
+        try:
+            started = time.perf_counter()
+            self._progress = {"users": 0, "last_user_id": 0, "days": 0, "day": None, "retries": 0}
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    self._backfill_users(cursor)
+                    self._backfill_rollups(cursor, since)
+                finally:
+                    cursor.close()
+            self._runs += 1
+            self._last_run = {
+                "at": datetime.now().isoformat(),
+                **self._progress,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            return self._last_run
+        finally:
+            self._lock.release()
+
+    def _backfill_users(self, cursor):
+        after = 0
+        while True:
+            row = self._execute(cursor, "EXEC sp_backfill_ride_stats @after_user_id = ?, @batch_size = ?",
+                                after, self.batch_size)
+            if row is None or row.last_user_id is None:
+                return
+            after = row.last_user_id
+            self._progress["users"] += row.users
+            self._progress["last_user_id"] = after
+
+    def _backfill_rollups(self, cursor, since):
+        if since is None:
+            cursor.execute("SELECT CAST(MIN(requested_at) AS DATE) FROM rides")
+            since = cursor.fetchone()[0]
+            if since is None:
+                return
+        day, today = since, date.today()
+        while day <= today:
+            self._execute(cursor, "EXEC sp_backfill_ride_rollups @day = ?", day)
+            self._progress["days"] += 1
+            self._progress["day"] = day.isoformat()
+            day += timedelta(days=1)
+
+    def _execute(self, cursor, sql, *params):
+        for attempt in range(self.retries + 1):
+            try:
+                cursor.execute(sql, *params)
+                return cursor.fetchone()
+            except pyodbc.Error as e:
+                if attempt == self.retries or not e.args or e.args[0] != _DEADLOCK:
+                    raise
+                self._progress["retries"] += 1
+                time.sleep(0.1 * (attempt + 1))
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "running": self._lock.locked(),
+            "progress": self._progress if self._lock.locked() else None,
+            "runs": self._runs,
+            "last_run": self._last_run,
+        }
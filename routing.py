@@ -0,0 +1,407 @@
+import csv
+import heapq
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from cache import TTLCache
+from geo_index import KM_PER_DEGREE, haversine_km
+
+GRAPH_FORMAT = "ch-v1"
+
+# Flat arrays of a built graph, one .npy file each (loaded memory-mapped).
+# fwd_*: for each node, edges to higher-ranked nodes (CSR by source).
+# bwd_*: for each node, edges arriving from higher-ranked nodes (CSR by target).
+_ARRAYS = (
+    "node_lat", "node_lng",
+    "fwd_offsets", "fwd_targets", "fwd_seconds", "fwd_meters",
+    "bwd_offsets", "bwd_sources", "bwd_seconds", "bwd_meters",
+)
+
+_INF = float("inf")
+
+# The 3x3 block of snapping cells around a point
+_RING_LAT = np.repeat(np.arange(-1, 2), 3)
+_RING_LNG = np.tile(np.arange(-1, 2), 3)
+
+
+# Building (offline): road extract -> contraction hierarchy
+def read_extract(nodes_csv: str, edges_csv: str):
+    # nodes.csv: node_id,lat,lng   edges.csv: from_id,to_id,length_m,speed_kmh,oneway
+    with open(nodes_csv, newline="") as f:
+        nodes = [(r["node_id"], float(r["lat"]), float(r["lng"])) for r in csv.DictReader(f)]
+    with open(edges_csv, newline="") as f:
+        edges = [
+            (r["from_id"], r["to_id"], float(r["length_m"]), float(r["speed_kmh"]),
+             r.get("oneway", "0").strip().lower() in ("1", "true", "yes"))
+            for r in csv.DictReader(f)
+        ]
+    return nodes, edges
+
+
+def build_graph(nodes, edges, out_dir: str, witness_settle_limit: int = 200, log=print):
+    # nodes: [(node_id, lat, lng)], edges: [(from_id, to_id, length_m, speed_kmh, oneway)]
+    started = time.perf_counter()
+    index = {node_id: i for i, (node_id, _, _) in enumerate(nodes)}
+    n = len(nodes)
+    out_adj = [{} for _ in range(n)]    # v -> {w: (seconds, meters)} over uncontracted nodes
+    in_adj = [{} for _ in range(n)]
+
+    def add_edge(u, w, seconds, meters):
+        if u == w:
+            return
+        current = out_adj[u].get(w)
+        if current is None or seconds < current[0]:
+            out_adj[u][w] = in_adj[w][u] = (seconds, meters)
+
+    for from_id, to_id, length_m, speed_kmh, oneway in edges:
+        u, w = index[from_id], index[to_id]
+        seconds = length_m / (speed_kmh / 3.6)
+        add_edge(u, w, seconds, length_m)
+        if not oneway:
+            add_edge(w, u, seconds, length_m)
+    edge_count = sum(len(a) for a in out_adj)
+
+    def shortcuts_for(v):
+        # u -> v -> w pairs with no path of at most the same cost avoiding v
+        outs = out_adj[v]
+        if not outs or not in_adj[v]:
+            return []
+        max_out = max(seconds for seconds, _ in outs.values())
+        needed = []
+        for u, (su, mu) in in_adj[v].items():
+            reach = _witness_search(out_adj, u, v, su + max_out, witness_settle_limit)
+            for w, (sw, mw) in outs.items():
+                if w != u and reach.get(w, _INF) > su + sw:
+                    needed.append((u, w, su + sw, mu + mw))
+        return needed
+
+    deleted = [0] * n
+
+    def priority(v, shortcuts):
+        # Edge difference plus contracted-neighbour count keeps the hierarchy flat
+        return len(shortcuts) - len(in_adj[v]) - len(out_adj[v]) + deleted[v]
+
+    queue = [(priority(v, shortcuts_for(v)), v) for v in range(n)]
+    heapq.heapify(queue)
+    rank = np.empty(n, dtype=np.int32)
+    up_fwd = [None] * n
+    up_bwd = [None] * n
+    shortcut_count = 0
+    order = 0
+    while queue:
+        _, v = heapq.heappop(queue)
+        shortcuts = shortcuts_for(v)
+        current = priority(v, shortcuts)
+        if queue and current > queue[0][0]:
+            # Lazy update: priority went up since it was queued
+            heapq.heappush(queue, (current, v))
+            continue
+
+        rank[v] = order
+        order += 1
+        up_fwd[v] = list(out_adj[v].items())
+        up_bwd[v] = list(in_adj[v].items())
+        neighbours = set(out_adj[v]) | set(in_adj[v])
+        for w in out_adj[v]:
+            del in_adj[w][v]
+        for u in in_adj[v]:
+            del out_adj[u][v]
+        out_adj[v] = {}
+        in_adj[v] = {}
+        for u, w, seconds, meters in shortcuts:
+            add_edge(u, w, seconds, meters)
+        shortcut_count += len(shortcuts)
+        for x in neighbours:
+            deleted[x] += 1
+        if log and order % 50000 == 0:
+            log(f"contracted {order}/{n} nodes, {shortcut_count} shortcuts")
+
+    arrays = {
+        "node_lat": np.array([lat for _, lat, _ in nodes], dtype=np.float64),
+        "node_lng": np.array([lng for _, _, lng in nodes], dtype=np.float64),
+    }
+    for prefix, other, lists in (("fwd", "targets", up_fwd), ("bwd", "sources", up_bwd)):
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(edges_of) for edges_of in lists])
+        flat = [edge for edges_of in lists for edge in edges_of]
+        arrays[f"{prefix}_offsets"] = offsets
+        arrays[f"{prefix}_{other}"] = np.array([x for x, _ in flat], dtype=np.int32)
+        arrays[f"{prefix}_seconds"] = np.array([s for _, (s, _) in flat], dtype=np.float32)
+        arrays[f"{prefix}_meters"] = np.array([m for _, (_, m) in flat], dtype=np.float32)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name in _ARRAYS:
+        np.save(os.path.join(out_dir, f"{name}.npy"), arrays[name])
+    meta = {
+        "format": GRAPH_FORMAT,
+        "nodes": n,
+        "edges": edge_count,
+        "shortcuts": shortcut_count,
+        "build_seconds": round(time.perf_counter() - started, 1),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _witness_search(out_adj, source, excluded, max_cost, settle_limit):
+    # Bounded Dijkstra over the remaining graph; an incomplete search only
+    # means an extra (harmless) shortcut
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and settled < settle_limit:
+        d, x = heapq.heappop(heap)
+        if d > dist[x]:
+            continue
+        if d > max_cost:
+            break
+        settled += 1
+        for y, (seconds, _) in out_adj[x].items():
+            if y == excluded:
+                continue
+            nd = d + seconds
+            if nd < dist.get(y, _INF):
+                dist[y] = nd
+                heapq.heappush(heap, (nd, y))
+    return dist
+
+
+# Querying (in-process)
+class RoadGraph:
+    def __init__(self, arrays: dict, meta: dict):
+        self.meta = meta
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.nodes = len(self.node_lat)
+
+    @classmethod
+    def load(cls, path: str):
+        # Arrays stay memory-mapped: pages are shared between workers and only
+        # the parts of the graph that queries touch are read in
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format") != GRAPH_FORMAT:
+            raise RuntimeError(f"Road graph at {path} is not in {GRAPH_FORMAT} format")
+        # (plain ndarray views of the maps: np.memmap indexing is far slower per element)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r").view(np.ndarray) for name in _ARRAYS
+        }
+        return cls(arrays, meta)
+
+
+class RoutingEngine:
+    # Point-to-point and many-to-one travel times over a contraction
+    # hierarchy. Points are snapped to the nearest graph node; the distance to
+    # it is covered at access_speed. Results are cached per origin/destination
+    # cell pair, so nearby drivers heading to the same pickup share an entry.
+    def __init__(self, graph: RoadGraph, snap_radius_km: float = 1.0, access_speed_kmh: float = 15.0,
+                 cache_cell_m: float = 200.0, cache_entries: int = 200000, cache_ttl: float = 3600.0):
+        self.graph = graph
+        self.snap_radius_km = snap_radius_km
+        self.access_speed_kmh = access_speed_kmh
+        self.cache_cell_deg = cache_cell_m / 1000 / KM_PER_DEGREE
+        self.cache_ttl = cache_ttl
+        self._cache = TTLCache(max_entries=cache_entries)
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.cache_hits = 0
+        self.unreachable = 0
+        self.searches = 0
+        self._search_seconds = 0.0
+
+        # Snapping grid: node ids sorted by cell key
+        self._snap_cell_deg = snap_radius_km / KM_PER_DEGREE
+        self._snap_order, self._snap_keys = self._grid_keys(graph.node_lat, graph.node_lng)
+
+    def _grid_keys(self, lat, lng):
+        keys = self._cell_key(np.floor(lat / self._snap_cell_deg), np.floor(lng / self._snap_cell_deg))
+        order = np.argsort(keys, kind="stable")
+        return order, keys[order]
+
+    @staticmethod
+    def _cell_key(cell_lat, cell_lng):
+        return (np.asarray(cell_lat, dtype=np.int64) << 32) + (np.asarray(cell_lng, dtype=np.int64) & 0xFFFFFFFF)
+
+    def snap(self, lat: float, lng: float):
+        # -> (node, km) for the nearest node within snap_radius_km, else None
+        cell_lat = math.floor(lat / self._snap_cell_deg)
+        cell_lng = math.floor(lng / self._snap_cell_deg)
+        keys = self._cell_key(cell_lat + _RING_LAT, cell_lng + _RING_LNG)
+        lo = np.searchsorted(self._snap_keys, keys, side="left")
+        hi = np.searchsorted(self._snap_keys, keys, side="right")
+        candidates = [self._snap_order[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a]
+        if not candidates:
+            return None
+        nodes = np.concatenate(candidates)
+        # Equirectangular distance is plenty at snapping range
+        d_lat = (self.graph.node_lat[nodes] - lat) * KM_PER_DEGREE
+        d_lng = (self.graph.node_lng[nodes] - lng) * KM_PER_DEGREE * math.cos(math.radians(lat))
+        dist = np.hypot(d_lat, d_lng)
+        best = int(np.argmin(dist))
+        if dist[best] > self.snap_radius_km:
+            return None
+        return int(nodes[best]), float(dist[best])
+
+    def route(self, from_lat: float, from_lng: float, to_lat: float, to_lng: float):
+        # -> (seconds, km) by road, or None when either end is off the graph or unreachable
+        return self._cached(from_lat, from_lng, to_lat, to_lng, lambda: self._route(from_lat, from_lng, to_lat, to_lng))
+
+    def etas_to(self, lat: float, lng: float, origins) -> dict:
+        # origins: [(key, lat, lng)] -> {key: seconds or None}. One backward
+        # search from the destination is shared by every origin's forward search.
+        results = {}
+        misses = []
+        for key, o_lat, o_lng in origins:
+            cached = self._cache_get(o_lat, o_lng, lat, lng)
+            if cached is not None:
+                results[key] = cached[0] if cached else None
+            else:
+                misses.append((key, o_lat, o_lng))
+        if not misses:
+            return results
+
+        target = self.snap(lat, lng)
+        backward = self._upward(target[0]) if target is not None else None
+        for key, o_lat, o_lng in misses:
+            route = None
+            if backward is not None:
+                source = self.snap(o_lat, o_lng)
+                if source is not None:
+                    route = self._meet(source[0], backward, source[1], target[1])
+            self._cache_put(o_lat, o_lng, lat, lng, route)
+            results[key] = route[0] if route else None
+        return results
+
+    def _route(self, from_lat, from_lng, to_lat, to_lng):
+        source = self.snap(from_lat, from_lng)
+        target = self.snap(to_lat, to_lng)
+        if source is None or target is None:
+            return None
+        return self._meet(source[0], self._upward(target[0]), source[1], target[1])
+
+    def _meet(self, source, backward, source_km, target_km):
+        # Forward upward search from source, stopped once it can no longer beat
+        # the best meeting point with the (complete) backward search space
+        g = self.graph
+        offsets, targets, seconds_arr, meters_arr = g.fwd_offsets, g.fwd_targets, g.fwd_seconds, g.fwd_meters
+        started = time.perf_counter()
+        best = None
+        reached = {source: (0.0, 0.0)}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap:
+            d, x = heapq.heappop(heap)
+            if best is not None and d >= best[0]:
+                break
+            if x in settled:
+                continue
+            settled.add(x)
+            length = reached[x][1]
+            other = backward.get(x)
+            if other is not None and (best is None or d + other[0] < best[0]):
+                best = (d + other[0], length + other[1])
+            lo, hi = int(offsets[x]), int(offsets[x + 1])
+            if lo == hi:
+                continue
+            for y, s, m in zip(targets[lo:hi].tolist(), seconds_arr[lo:hi].tolist(), meters_arr[lo:hi].tolist()):
+                nd = d + s
+                current = reached.get(y)
+                if current is None or nd < current[0]:
+                    reached[y] = (nd, length + m)
+                    heapq.heappush(heap, (nd, y))
+        with self._lock:
+            self.searches += 1
+            self._search_seconds += time.perf_counter() - started
+        if best is None:
+            return None
+        access_km = source_km + target_km
+        return best[0] + access_km / self.access_speed_kmh * 3600, best[1] / 1000 + access_km
+
+    def _upward(self, node):
+        # Complete backward Dijkstra over edges from higher-ranked nodes -> {node: (seconds, meters)};
+        # the forward side is searched by _meet
+        g = self.graph
+        offsets, others, seconds_arr, meters_arr = g.bwd_offsets, g.bwd_sources, g.bwd_seconds, g.bwd_meters
+        started = time.perf_counter()
+        best = {node: (0.0, 0.0)}
+        settled = {}
+        heap = [(0.0, node)]
+        while heap:
+            d, x = heapq.heappop(heap)
+            if x in settled:
+                continue
+            length = best[x][1]
+            settled[x] = (d, length)
+            lo, hi = int(offsets[x]), int(offsets[x + 1])
+            if lo == hi:
+                continue
+            for y, s, m in zip(others[lo:hi].tolist(), seconds_arr[lo:hi].tolist(), meters_arr[lo:hi].tolist()):
+                nd = d + s
+                current = best.get(y)
+                if current is None or nd < current[0]:
+                    best[y] = (nd, length + m)
+                    heapq.heappush(heap, (nd, y))
+        with self._lock:
+            self.searches += 1
+            self._search_seconds += time.perf_counter() - started
+        return settled
+
+    # Cell-to-cell cache
+    def _cache_key(self, from_lat, from_lng, to_lat, to_lng):
+        c = self.cache_cell_deg
+        return (math.floor(from_lat / c), math.floor(from_lng / c), math.floor(to_lat / c), math.floor(to_lng / c))
+
+    def _cache_get(self, from_lat, from_lng, to_lat, to_lng):
+        # -> (seconds, km), () for a cached miss, or None when not cached
+        with self._lock:
+            self.queries += 1
+        value = self._cache.get(self._cache_key(from_lat, from_lng, to_lat, to_lng), None)
+        if value is not None:
+            with self._lock:
+                self.cache_hits += 1
+        return value
+
+    def _cache_put(self, from_lat, from_lng, to_lat, to_lng, route):
+        if route is None:
+            with self._lock:
+                self.unreachable += 1
+        self._cache.set(self._cache_key(from_lat, from_lng, to_lat, to_lng), route or (), self.cache_ttl)
+
+    def _cached(self, from_lat, from_lng, to_lat, to_lng, compute):
+        cached = self._cache_get(from_lat, from_lng, to_lat, to_lng)
+        if cached is not None:
+            return cached or None
+        route = compute()
+        self._cache_put(from_lat, from_lng, to_lat, to_lng, route)
+        return route
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "graph": self.graph.meta,
+                "queries": self.queries,
+                "cache_hits": self.cache_hits,
+                "unreachable": self.unreachable,
+                "searches": self.searches,
+                "avg_search_ms": round(self._search_seconds / self.searches * 1000, 3) if self.searches else 0.0,
+                "cache": self._cache.stats(),
+            }
+
+
+def straight_line_eta(from_lat, from_lng, to_lat, to_lng, speed_kmh: float) -> float:
+    return haversine_km(from_lat, from_lng, to_lat, to_lng) / speed_kmh * 3600
+
+
+if __name__ == "__main__":
+    # python routing.py build nodes.csv edges.csv out_dir
+    if len(sys.argv) != 5 or sys.argv[1] != "build":
+        raise SystemExit("usage: python routing.py build nodes.csv edges.csv out_dir")
+    nodes, edges = read_extract(sys.argv[2], sys.argv[3])
+    print(json.dumps(build_graph(nodes, edges, sys.argv[4]), indent=2))
@@ -0,0 +1,108 @@
+import struct
+import threading
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# Column metadata kept per statement text; keyset queries vary with the cursor
+MAX_CACHED_STATEMENTS = 1024
+
+
+class ORJSONResponse(JSONResponse):
+    # For trusted, already-converted DB rows: skips jsonable_encoder and
+    # response_model re-validation. datetime/date are written as ISO 8601.
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+class RowMapper:
+    # Column names and per-column converters for one statement, worked out
+    # from cursor.description on first use and reused while the result shape
+    # stays the same. Rows come out as plain dicts of JSON-ready values.
+    def __init__(self):
+        self._signature = None
+        self._columns = ()
+        self._converters = ()     # (index, fn) for columns that need converting
+
+    def _plan(self, description):
+        signature = tuple((d[0], d[1]) for d in description)
+        if signature != self._signature:
+            self._columns = tuple(name for name, _ in signature)
+            self._converters = tuple(
+                (i, _CONVERTERS[type_code]) for i, (_, type_code) in enumerate(signature)
+                if type_code in _CONVERTERS
+            )
+            self._signature = signature
+        return self._columns, self._converters
+
+    def columns(self, cursor):
+        return self._plan(cursor.description)[0]
+
+    def one(self, cursor, row):
+        if row is None:
+            return None
+        columns, converters = self._plan(cursor.description)
+        return _convert(columns, converters, row)
+
+    def all(self, cursor, rows):
+        columns, converters = self._plan(cursor.description)
+        return [_convert(columns, converters, row) for row in rows]
+
+    def values(self, cursor, rows):
+        # Converted value lists (for CSV writers and the like)
+        _, converters = self._plan(cursor.description)
+        if not converters:
+            return rows
+        out = []
+        for row in rows:
+            values = list(row)
+            for i, fn in converters:
+                if values[i] is not None:
+                    values[i] = fn(values[i])
+            out.append(values)
+        return out
+
+
+_mappers = {}
+_mappers_lock = threading.Lock()
+
+
+def mapper_for(sql: str) -> RowMapper:
+    mapper = _mappers.get(sql)
+    if mapper is None:
+        mapper = RowMapper()
+        with _mappers_lock:
+            if len(_mappers) < MAX_CACHED_STATEMENTS:
+                mapper = _mappers.setdefault(sql, mapper)
+    return mapper
+
+
+def _convert(columns, converters, row):
+    record = dict(zip(columns, row))
+    for i, fn in converters:
+        value = row[i]
+        if value is not None:
+            record[columns[i]] = fn(value)
+    return record
+
+
+def geography_point(value: bytes):
+    # SQL Server serialized geography: SRID (int32), version, properties, then
+    # lat/long as little-endian doubles for a single point (properties 0x0C).
+    # Anything other than a point is returned hex-encoded.
+    if len(value) == 22 and value[5] & 0x08:
+        latitude, longitude = struct.unpack_from("<dd", value, 6)
+        return {"latitude": latitude, "longitude": longitude}
+    return value.hex()
+
+
+_CONVERTERS = {
+    Decimal: float,
+    bytes: geography_point,
+    bytearray: lambda v: geography_point(bytes(v)),
+}
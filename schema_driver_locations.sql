@@ -0,0 +1,73 @@
+USE [uber_ride]
+GO
+
+-- Latest position per driver, maintained by upsert on every location flush.
+-- Matching reads one row per driver here instead of scanning the history.
+IF OBJECT_ID('driver_current_location', 'U') IS NULL
+BEGIN
+    CREATE TABLE driver_current_location (
+        driver_id INT NOT NULL PRIMARY KEY,
+        location GEOGRAPHY NOT NULL,
+        latitude FLOAT NOT NULL,
+        longitude FLOAT NOT NULL,
+        recorded_at DATETIME NOT NULL
+    );
+
+    CREATE SPATIAL INDEX SIX_driver_current_location
+    ON driver_current_location (location);
+END
+GO
+
+-- Daily partitions for the append-only history. Boundaries are added ahead
+-- of time and old ones merged away by sp_compact_driver_locations.
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pf_driver_locations_day')
+BEGIN
+    DECLARE @first DATE = DATEADD(DAY, -30, CAST(GETDATE() AS DATE));
+    DECLARE @boundaries NVARCHAR(MAX) = '';
+    DECLARE @day INT = 0;
+    WHILE @day <= 37
+    BEGIN
+        SET @boundaries = @boundaries + CASE WHEN @day > 0 THEN ', ' ELSE '' END
+            + '''' + CONVERT(CHAR(10), DATEADD(DAY, @day, @first), 120) + '''';
+        SET @day = @day + 1;
+    END
+
+    EXEC ('CREATE PARTITION FUNCTION pf_driver_locations_day (DATETIME) AS RANGE RIGHT FOR VALUES (' + @boundaries + ')');
+    EXEC ('CREATE PARTITION SCHEME ps_driver_locations_day AS PARTITION pf_driver_locations_day ALL TO ([PRIMARY])');
+END
+GO
+
+-- Move the existing history onto the partition scheme. The old table is kept
+-- as driver_locations_legacy until it has been checked and dropped by hand.
+IF OBJECT_ID('driver_locations_legacy', 'U') IS NULL
+BEGIN
+    CREATE TABLE driver_locations_partitioned (
+        driver_id INT NOT NULL,
+        location GEOGRAPHY NOT NULL,
+        recorded_at DATETIME NOT NULL
+            CONSTRAINT DF_driver_locations_recorded_at DEFAULT GETDATE()
+    ) ON ps_driver_locations_day (recorded_at);
+
+    CREATE CLUSTERED INDEX CIX_driver_locations_recorded
+    ON driver_locations_partitioned (recorded_at, driver_id)
+    ON ps_driver_locations_day (recorded_at);
+
+    INSERT INTO driver_locations_partitioned WITH (TABLOCK) (driver_id, location, recorded_at)
+    SELECT driver_id, location, recorded_at
+    FROM driver_locations;
+
+    EXEC sp_rename 'driver_locations', 'driver_locations_legacy';
+    EXEC sp_rename 'driver_locations_partitioned', 'driver_locations';
+
+    -- Seed the latest-position table from the history
+    INSERT INTO driver_current_location (driver_id, location, latitude, longitude, recorded_at)
+    SELECT driver_id, location, location.Lat, location.Long, recorded_at
+    FROM (
+        SELECT driver_id, location, recorded_at,
+               ROW_NUMBER() OVER (PARTITION BY driver_id ORDER BY recorded_at DESC) AS rn
+        FROM driver_locations
+    ) latest
+    WHERE rn = 1
+    AND NOT EXISTS (SELECT 1 FROM driver_current_location c WHERE c.driver_id = latest.driver_id);
+END
+GO
@@ -0,0 +1,12 @@
+USE [uber_ride]
+GO
+
+-- Keyset pagination of ride history (pagination.keyset_query): the
+-- filter columns followed by the sort keys, so each page is a range seek
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_rides_rider_completed_page')
+    CREATE INDEX ix_rides_rider_completed_page ON rides (rider_id, ride_status, completed_at, ride_id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_rides_driver_requested_page')
+    CREATE INDEX ix_rides_driver_requested_page ON rides (driver_id, requested_at, ride_id);
+GO
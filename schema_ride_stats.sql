@@ -0,0 +1,97 @@
+USE [uber_ride]
+GO
+
+-- Running per-driver and per-rider aggregates. sp_record_ride_stats applies
+-- each completion / cancellation in the same transaction as the status
+-- change and sp_rate_ride applies ratings; sp_backfill_ride_stats rebuilds
+-- them from rides and ride_ratings. fare_total is earnings for drivers and
+-- spend for riders; ratings are the ones the user received.
+IF OBJECT_ID('driver_stats', 'U') IS NULL
+BEGIN
+    CREATE TABLE driver_stats (
+        driver_id INT NOT NULL PRIMARY KEY REFERENCES drivers (driver_id),
+        completed_trips INT NOT NULL DEFAULT 0,
+        fare_total DECIMAL(14,2) NOT NULL DEFAULT 0,
+        distance_km DECIMAL(14,2) NOT NULL DEFAULT 0,
+        duration_minutes INT NOT NULL DEFAULT 0,
+        cancelled_by_rider INT NOT NULL DEFAULT 0,
+        cancelled_by_driver INT NOT NULL DEFAULT 0,
+        rating_count INT NOT NULL DEFAULT 0,
+        rating_sum INT NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL DEFAULT GETDATE()
+    );
+END
+GO
+
+IF OBJECT_ID('rider_stats', 'U') IS NULL
+BEGIN
+    CREATE TABLE rider_stats (
+        rider_id INT NOT NULL PRIMARY KEY REFERENCES users (user_id),
+        completed_trips INT NOT NULL DEFAULT 0,
+        fare_total DECIMAL(14,2) NOT NULL DEFAULT 0,
+        distance_km DECIMAL(14,2) NOT NULL DEFAULT 0,
+        duration_minutes INT NOT NULL DEFAULT 0,
+        cancelled_by_rider INT NOT NULL DEFAULT 0,
+        cancelled_by_driver INT NOT NULL DEFAULT 0,
+        rating_count INT NOT NULL DEFAULT 0,
+        rating_sum INT NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL DEFAULT GETDATE()
+    );
+END
+GO
+
+-- One rating per side of a completed ride: rated_by 'rider' rates the
+-- driver, 'driver' rates the rider
+IF OBJECT_ID('ride_ratings', 'U') IS NULL
+BEGIN
+    CREATE TABLE ride_ratings (
+        ride_id INT NOT NULL REFERENCES rides (ride_id),
+        rated_by VARCHAR(10) NOT NULL CHECK (rated_by IN ('rider', 'driver')),
+        rating TINYINT NOT NULL CHECK (rating BETWEEN 1 AND 5),
+        rated_at DATETIME NOT NULL DEFAULT GETDATE(),
+        PRIMARY KEY (ride_id, rated_by)
+    );
+END
+GO
+
+-- Platform totals per hour ('H') and day ('D'). Completions count in the
+-- bucket of completed_at, cancellations in that of cancelled_at; ratings
+-- (of drivers) in the bucket of the rated ride's completion.
+IF OBJECT_ID('ride_stats_rollup', 'U') IS NULL
+BEGIN
+    CREATE TABLE ride_stats_rollup (
+        granularity CHAR(1) NOT NULL CHECK (granularity IN ('H', 'D')),
+        bucket_start DATETIME NOT NULL,
+        completed_trips INT NOT NULL DEFAULT 0,
+        fare_total DECIMAL(16,2) NOT NULL DEFAULT 0,
+        distance_km DECIMAL(16,2) NOT NULL DEFAULT 0,
+        duration_minutes BIGINT NOT NULL DEFAULT 0,
+        cancelled_by_rider INT NOT NULL DEFAULT 0,
+        cancelled_by_driver INT NOT NULL DEFAULT 0,
+        rating_count INT NOT NULL DEFAULT 0,
+        rating_sum INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket_start)
+    );
+END
+GO
+
+-- Backfill scans
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_rides_driver_status')
+    CREATE INDEX ix_rides_driver_status ON rides (driver_id, ride_status)
+        INCLUDE (actual_fare, distance_km, duration_minutes, cancelled_by);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_rides_rider_status')
+    CREATE INDEX ix_rides_rider_status ON rides (rider_id, ride_status)
+        INCLUDE (actual_fare, distance_km, duration_minutes, cancelled_by);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_rides_completed_at')
+    CREATE INDEX ix_rides_completed_at ON rides (completed_at)
+        INCLUDE (ride_status, actual_fare, distance_km, duration_minutes);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_rides_cancelled_at')
+    CREATE INDEX ix_rides_cancelled_at ON rides (cancelled_at)
+        INCLUDE (ride_status, cancelled_by);
+GO
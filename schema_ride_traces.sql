@@ -0,0 +1,17 @@
+USE [uber_ride]
+GO
+
+-- Encoded driver path for each completed ride (see trip_trace.py for the format)
+IF OBJECT_ID('ride_traces', 'U') IS NULL
+BEGIN
+    CREATE TABLE ride_traces (
+        ride_id INT NOT NULL PRIMARY KEY REFERENCES rides (ride_id),
+        trace_format VARCHAR(20) NOT NULL,
+        encoded_trace VARBINARY(MAX) NOT NULL,
+        point_count INT NOT NULL,
+        distance_km DECIMAL(8,3) NOT NULL,
+        duration_seconds INT NOT NULL,
+        recorded_at DATETIME NOT NULL DEFAULT GETDATE()
+    );
+END
+GO
@@ -8,41 +8,11 @@ BEGIN
     BEGIN TRY
         BEGIN TRANSACTION;
         
-        -- Check ride status
-        DECLARE @current_status VARCHAR(20);
-        DECLARE @rider_id INT;
-        
-        SELECT 
-            @current_status = ride_status,
-            @rider_id = rider_id
-        FROM rides
-        WHERE ride_id = @ride_id;
-        
-        IF @current_status IS NULL
-        BEGIN
-            RAISERROR('Ride not found', 16, 1);
-        END
-        
-        IF @current_status != 'requested'
-        BEGIN
-            RAISERROR('Ride is not in requested state', 16, 1);
-        END
-        
-        -- Check driver availability
-        IF NOT EXISTS (
-            SELECT 1 FROM drivers 
-            WHERE driver_id = @driver_id 
-            AND current_status = 'available'
-            AND is_verified = 1
-        )
-        BEGIN
-            RAISERROR('Driver not available or not verified', 16, 1);
-        END
-        
-        -- Get driver's primary vehicle
+        -- Claim the ride with one conditional UPDATE: the row lock serializes
+        -- concurrent accepts and every loser sees ride_status <> 'requested'.
         DECLARE @vehicle_id INT;
         
-        SELECT @vehicle_id = vehicle_id
+        SELECT TOP 1 @vehicle_id = vehicle_id
         FROM vehicles
         WHERE driver_id = @driver_id;
         
@@ -51,18 +21,34 @@ BEGIN
             RAISERROR('Driver has no registered vehicle', 16, 1);
         END
         
-        -- Update ride and driver status
         UPDATE rides
         SET 
             driver_id = @driver_id,
             vehicle_id = @vehicle_id,
             ride_status = 'accepted',
             accepted_at = GETDATE()
-        WHERE ride_id = @ride_id;
+        WHERE ride_id = @ride_id
+        AND ride_status = 'requested';
+        
+        IF @@ROWCOUNT = 0
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM rides WHERE ride_id = @ride_id)
+                RAISERROR('Ride not found', 16, 1);
+            ELSE
+                RAISERROR('Ride is not in requested state', 16, 1);
+        END
         
+        -- Same compare-and-set on the driver; failure rolls the ride claim back
         UPDATE drivers
         SET current_status = 'on_ride'
-        WHERE driver_id = @driver_id;
+        WHERE driver_id = @driver_id
+        AND current_status = 'available'
+        AND is_verified = 1;
+        
+        IF @@ROWCOUNT = 0
+        BEGIN
+            RAISERROR('Driver not available or not verified', 16, 1);
+        END
         
         -- Return updated ride details
         SELECT 
@@ -0,0 +1,91 @@
+USE [uber_ride]
+GO
+
+IF EXISTS (SELECT * FROM sys.objects WHERE type = 'P' AND name = 'sp_add_pool_rider')
+DROP PROCEDURE sp_add_pool_rider
+GO
+
+-- Assigns a requested pool ride to a driver already on a pool route (the
+-- API's pool planner chose the insertion). The driver stays on_ride.
+CREATE PROCEDURE sp_add_pool_rider
+    @ride_id INT,
+    @driver_id INT,
+    @max_riders INT = 4
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        -- UPDLOCK on the driver row serializes insertions into the same route
+        -- and completions freeing the driver
+        IF NOT EXISTS (
+            SELECT 1 FROM drivers WITH (UPDLOCK, ROWLOCK)
+            WHERE driver_id = @driver_id
+            AND current_status = 'on_ride'
+        )
+        BEGIN
+            RAISERROR('Driver is not on a pool route', 16, 1);
+        END
+
+        DECLARE @vehicle_id INT;
+        DECLARE @active_rides INT;
+        DECLARE @other_rides INT;
+
+        SELECT
+            @vehicle_id = MAX(vehicle_id),
+            @active_rides = COUNT(*),
+            @other_rides = SUM(CASE WHEN ride_type <> 'pool' THEN 1 ELSE 0 END)
+        FROM rides
+        WHERE driver_id = @driver_id
+        AND ride_status IN ('accepted', 'arrived', 'in_progress');
+
+        IF @active_rides = 0 OR @other_rides > 0
+        BEGIN
+            RAISERROR('Driver is not on a pool route', 16, 1);
+        END
+
+        IF @active_rides >= @max_riders
+        BEGIN
+            RAISERROR('Pool vehicle is full', 16, 1);
+        END
+
+        UPDATE rides
+        SET
+            driver_id = @driver_id,
+            vehicle_id = @vehicle_id,
+            ride_status = 'accepted',
+            accepted_at = GETDATE()
+        WHERE ride_id = @ride_id
+        AND ride_status = 'requested'
+        AND ride_type = 'pool';
+
+        IF @@ROWCOUNT = 0
+        BEGIN
+            RAISERROR('Ride is not a requested pool ride', 16, 1);
+        END
+
+        -- Same shape as sp_accept_ride
+        SELECT
+            r.*,
+            u.first_name + ' ' + u.last_name AS rider_name,
+            u.phone_number AS rider_phone,
+            pickup_location.Lat AS pickup_lat,
+            pickup_location.Long AS pickup_lng,
+            dropoff_location.Lat AS dropoff_lat,
+            dropoff_location.Long AS dropoff_lng
+        FROM rides r
+        JOIN users u ON r.rider_id = u.user_id
+        WHERE r.ride_id = @ride_id;
+
+        COMMIT TRANSACTION;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+
+        THROW;
+    END CATCH
+END
+GO
@@ -5,7 +5,7 @@ GO
 
 CREATE PROCEDURE sp_authenticate_user
     @email NVARCHAR(255),
-    @password_hash NVARCHAR(255)
+    @password_hash NVARCHAR(255) = NULL  -- NULL: look up by email; the API verifies the hash
 AS
 BEGIN
     SET NOCOUNT ON;
@@ -19,6 +19,7 @@ BEGIN
             u.last_name,
             u.account_status,
             u.user_type,
+            u.password_hash,
             CASE 
                 WHEN u.user_type = 'rider' THEN r.wallet_balance
                 ELSE NULL
@@ -42,7 +43,7 @@ BEGIN
             LEFT JOIN vehicles v ON d.driver_id = v.driver_id
         WHERE 
             u.email = @email 
-            AND u.password_hash = @password_hash
+            AND (@password_hash IS NULL OR u.password_hash = @password_hash)
             AND u.account_status = 'active';
             
         IF @@ROWCOUNT = 0
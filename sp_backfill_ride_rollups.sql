@@ -0,0 +1,81 @@
+USE [uber_ride]
+GO
+
+IF EXISTS (SELECT * FROM sys.objects WHERE type = 'P' AND name = 'sp_backfill_ride_rollups')
+DROP PROCEDURE sp_backfill_ride_rollups
+GO
+
+-- Rebuilds the hourly and daily ride_stats_rollup rows of one day from
+-- rides and ride_ratings, with the same bucketing as sp_record_ride_stats
+-- and sp_rate_ride. The day's rows stay locked until commit.
+CREATE PROCEDURE sp_backfill_ride_rollups
+    @day DATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @from DATETIME = CAST(@day AS DATETIME);
+    DECLARE @to DATETIME = DATEADD(DAY, 1, @from);
+    DECLARE @buckets INT;
+
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        DELETE FROM ride_stats_rollup WITH (HOLDLOCK)
+        WHERE bucket_start >= @from AND bucket_start < @to;
+
+        ;WITH events AS (
+            SELECT
+                completed_at AS at, 1 AS trips, ISNULL(actual_fare, 0) AS fare,
+                ISNULL(distance_km, 0) AS distance, ISNULL(duration_minutes, 0) AS duration,
+                0 AS by_rider, 0 AS by_driver, 0 AS rating_count, 0 AS rating_sum
+            FROM rides
+            WHERE ride_status = 'completed' AND completed_at >= @from AND completed_at < @to
+
+            UNION ALL
+
+            SELECT
+                cancelled_at, 0, 0, 0, 0,
+                CASE WHEN cancelled_by = 'rider' THEN 1 ELSE 0 END,
+                CASE WHEN cancelled_by = 'driver' THEN 1 ELSE 0 END,
+                0, 0
+            FROM rides
+            WHERE ride_status = 'cancelled' AND cancelled_at >= @from AND cancelled_at < @to
+
+            UNION ALL
+
+            SELECT r.completed_at, 0, 0, 0, 0, 0, 0, 1, rr.rating
+            FROM ride_ratings rr
+            JOIN rides r ON r.ride_id = rr.ride_id
+            WHERE rr.rated_by = 'rider'
+            AND r.ride_status = 'completed' AND r.completed_at >= @from AND r.completed_at < @to
+        )
+        INSERT INTO ride_stats_rollup (
+            granularity, bucket_start, completed_trips, fare_total, distance_km, duration_minutes,
+            cancelled_by_rider, cancelled_by_driver, rating_count, rating_sum
+        )
+        SELECT
+            b.granularity, b.bucket_start,
+            SUM(e.trips), SUM(e.fare), SUM(e.distance), SUM(CAST(e.duration AS BIGINT)),
+            SUM(e.by_rider), SUM(e.by_driver), SUM(e.rating_count), SUM(CAST(e.rating_sum AS INT))
+        FROM events e
+        CROSS APPLY (
+            VALUES ('H', DATEADD(HOUR, DATEDIFF(HOUR, 0, e.at), 0)),
+                   ('D', @from)
+        ) AS b (granularity, bucket_start)
+        GROUP BY b.granularity, b.bucket_start;
+
+        SET @buckets = @@ROWCOUNT;
+
+        COMMIT TRANSACTION;
+
+        SELECT @day AS day, @buckets AS buckets;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+
+        THROW;
+    END CATCH
+END
+GO
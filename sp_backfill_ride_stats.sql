@@ -0,0 +1,135 @@
+USE [uber_ride]
+GO
+
+IF EXISTS (SELECT * FROM sys.objects WHERE type = 'P' AND name = 'sp_backfill_ride_stats')
+DROP PROCEDURE sp_backfill_ride_stats
+GO
+
+-- Rebuilds driver_stats / rider_stats (and drivers.total_trips and
+-- average_rating) from rides and ride_ratings for the next @batch_size
+-- users after @after_user_id. Returns the last user id of the batch, NULL
+-- once past the end. The rebuilt key range stays locked until commit, so
+-- live sp_record_ride_stats calls for these users wait for it instead of
+-- being lost or counted twice.
+CREATE PROCEDURE sp_backfill_ride_stats
+    @after_user_id INT = 0,
+    @batch_size INT = 1000
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @last_user_id INT;
+    DECLARE @users INT;
+
+    SELECT @last_user_id = MAX(user_id), @users = COUNT(*)
+    FROM (
+        SELECT TOP (@batch_size) user_id
+        FROM users
+        WHERE user_id > @after_user_id
+        ORDER BY user_id
+    ) batch;
+
+    IF @last_user_id IS NULL
+    BEGIN
+        SELECT CAST(NULL AS INT) AS last_user_id, 0 AS users;
+        RETURN;
+    END
+
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        DELETE FROM driver_stats WITH (HOLDLOCK)
+        WHERE driver_id > @after_user_id AND driver_id <= @last_user_id;
+
+        ;WITH trips AS (
+            SELECT
+                driver_id,
+                SUM(CASE WHEN ride_status = 'completed' THEN 1 ELSE 0 END) AS completed_trips,
+                SUM(CASE WHEN ride_status = 'completed' THEN ISNULL(actual_fare, 0) ELSE 0 END) AS fare_total,
+                SUM(CASE WHEN ride_status = 'completed' THEN ISNULL(distance_km, 0) ELSE 0 END) AS distance_km,
+                SUM(CASE WHEN ride_status = 'completed' THEN ISNULL(duration_minutes, 0) ELSE 0 END) AS duration_minutes,
+                SUM(CASE WHEN ride_status = 'cancelled' AND cancelled_by = 'rider' THEN 1 ELSE 0 END) AS cancelled_by_rider,
+                SUM(CASE WHEN ride_status = 'cancelled' AND cancelled_by = 'driver' THEN 1 ELSE 0 END) AS cancelled_by_driver
+            FROM rides
+            WHERE driver_id > @after_user_id AND driver_id <= @last_user_id
+            AND ride_status IN ('completed', 'cancelled')
+            GROUP BY driver_id
+        ), ratings AS (
+            SELECT r.driver_id, COUNT(*) AS rating_count, SUM(rr.rating) AS rating_sum
+            FROM ride_ratings rr
+            JOIN rides r ON r.ride_id = rr.ride_id
+            WHERE rr.rated_by = 'rider'
+            AND r.driver_id > @after_user_id AND r.driver_id <= @last_user_id
+            GROUP BY r.driver_id
+        )
+        INSERT INTO driver_stats (
+            driver_id, completed_trips, fare_total, distance_km, duration_minutes,
+            cancelled_by_rider, cancelled_by_driver, rating_count, rating_sum
+        )
+        SELECT
+            COALESCE(t.driver_id, g.driver_id),
+            ISNULL(t.completed_trips, 0), ISNULL(t.fare_total, 0), ISNULL(t.distance_km, 0),
+            ISNULL(t.duration_minutes, 0), ISNULL(t.cancelled_by_rider, 0), ISNULL(t.cancelled_by_driver, 0),
+            ISNULL(g.rating_count, 0), ISNULL(g.rating_sum, 0)
+        FROM trips t
+        FULL JOIN ratings g ON g.driver_id = t.driver_id;
+
+        UPDATE d
+        SET
+            total_trips = ISNULL(s.completed_trips, 0),
+            average_rating = CASE
+                WHEN s.rating_count > 0 THEN CAST(s.rating_sum AS DECIMAL(10,2)) / s.rating_count
+                ELSE d.average_rating
+            END
+        FROM drivers d
+        LEFT JOIN driver_stats s ON s.driver_id = d.driver_id
+        WHERE d.driver_id > @after_user_id AND d.driver_id <= @last_user_id;
+
+        DELETE FROM rider_stats WITH (HOLDLOCK)
+        WHERE rider_id > @after_user_id AND rider_id <= @last_user_id;
+
+        ;WITH trips AS (
+            SELECT
+                rider_id,
+                SUM(CASE WHEN ride_status = 'completed' THEN 1 ELSE 0 END) AS completed_trips,
+                SUM(CASE WHEN ride_status = 'completed' THEN ISNULL(actual_fare, 0) ELSE 0 END) AS fare_total,
+                SUM(CASE WHEN ride_status = 'completed' THEN ISNULL(distance_km, 0) ELSE 0 END) AS distance_km,
+                SUM(CASE WHEN ride_status = 'completed' THEN ISNULL(duration_minutes, 0) ELSE 0 END) AS duration_minutes,
+                SUM(CASE WHEN ride_status = 'cancelled' AND cancelled_by = 'rider' THEN 1 ELSE 0 END) AS cancelled_by_rider,
+                SUM(CASE WHEN ride_status = 'cancelled' AND cancelled_by = 'driver' THEN 1 ELSE 0 END) AS cancelled_by_driver
+            FROM rides
+            WHERE rider_id > @after_user_id AND rider_id <= @last_user_id
+            AND ride_status IN ('completed', 'cancelled')
+            GROUP BY rider_id
+        ), ratings AS (
+            SELECT r.rider_id, COUNT(*) AS rating_count, SUM(rr.rating) AS rating_sum
+            FROM ride_ratings rr
+            JOIN rides r ON r.ride_id = rr.ride_id
+            WHERE rr.rated_by = 'driver'
+            AND r.rider_id > @after_user_id AND r.rider_id <= @last_user_id
+            GROUP BY r.rider_id
+        )
+        INSERT INTO rider_stats (
+            rider_id, completed_trips, fare_total, distance_km, duration_minutes,
+            cancelled_by_rider, cancelled_by_driver, rating_count, rating_sum
+        )
+        SELECT
+            COALESCE(t.rider_id, g.rider_id),
+            ISNULL(t.completed_trips, 0), ISNULL(t.fare_total, 0), ISNULL(t.distance_km, 0),
+            ISNULL(t.duration_minutes, 0), ISNULL(t.cancelled_by_rider, 0), ISNULL(t.cancelled_by_driver, 0),
+            ISNULL(g.rating_count, 0), ISNULL(g.rating_sum, 0)
+        FROM trips t
+        FULL JOIN ratings g ON g.rider_id = t.rider_id;
+
+        COMMIT TRANSACTION;
+
+        SELECT @last_user_id AS last_user_id, @users AS users;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+
+        THROW;
+    END CATCH
+END
+GO
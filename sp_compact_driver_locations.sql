@@ -0,0 +1,105 @@
+USE [uber_ride]
+GO
+
+IF EXISTS (SELECT * FROM sys.objects WHERE type = 'P' AND name = 'sp_compact_driver_locations')
+DROP PROCEDURE sp_compact_driver_locations
+GO
+
+CREATE PROCEDURE sp_compact_driver_locations
+    @compact_after_hours INT = 24,   -- history older than this is downsampled
+    @bucket_seconds INT = 30,        -- ... to one point per driver per bucket
+    @window_hours INT = 48,          -- how far back each run re-checks
+    @retention_days INT = 30,        -- whole days older than this are purged
+    @days_ahead INT = 7,             -- future daily partitions kept ready
+    @batch_size INT = 50000
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @now DATETIME = GETDATE();
+    DECLARE @compact_before DATETIME = DATEADD(HOUR, -@compact_after_hours, @now);
+    DECLARE @compact_from DATETIME = DATEADD(HOUR, -@window_hours, @compact_before);
+    -- Buckets sit on a fixed grid from a constant epoch, so repeated runs over
+    -- the same history agree on them and keep what the last run kept
+    DECLARE @epoch DATETIME = '20000101';
+    DECLARE @purge_before DATETIME = CAST(DATEADD(DAY, -@retention_days, CAST(@now AS DATE)) AS DATETIME);
+    DECLARE @deleted INT = 1;
+    DECLARE @compacted INT = 0;
+    DECLARE @purged_partitions INT = 0;
+    DECLARE @sql NVARCHAR(MAX);
+
+    -- Start the window on a bucket boundary so no bucket is only half inside it
+    SET @compact_from = DATEADD(SECOND, CAST(DATEDIFF_BIG(SECOND, @epoch, @compact_from) / @bucket_seconds * @bucket_seconds AS INT), @epoch);
+
+    BEGIN TRY
+        -- Downsample: keep the first point of every (driver, bucket), in
+        -- small batches so the log and lock footprint stay bounded
+        WHILE @deleted > 0
+        BEGIN
+            ;WITH ranked AS (
+                SELECT ROW_NUMBER() OVER (
+                           PARTITION BY driver_id, DATEDIFF_BIG(SECOND, @epoch, recorded_at) / @bucket_seconds
+                           ORDER BY recorded_at
+                       ) AS rn
+                FROM driver_locations
+                WHERE recorded_at >= @compact_from AND recorded_at < @compact_before
+            )
+            DELETE TOP (@batch_size) FROM ranked WHERE rn > 1;
+
+            SET @deleted = @@ROWCOUNT;
+            SET @compacted = @compacted + @deleted;
+        END
+
+        -- Retention: whole daily partitions are truncated, not deleted row by row
+        DECLARE @last_expired INT = $PARTITION.pf_driver_locations_day(@purge_before) - 1;
+        IF @last_expired >= 1
+        BEGIN
+            SET @sql = N'TRUNCATE TABLE driver_locations WITH (PARTITIONS (1 TO '
+                + CAST(@last_expired AS NVARCHAR(10)) + N'))';
+            EXEC sp_executesql @sql;
+            SET @purged_partitions = @last_expired;
+
+            -- Drop the now-empty boundaries
+            DECLARE @boundary DATETIME;
+            WHILE 1 = 1
+            BEGIN
+                SELECT @boundary = MIN(CAST(prv.value AS DATETIME))
+                FROM sys.partition_range_values prv
+                JOIN sys.partition_functions pf ON prv.function_id = pf.function_id
+                WHERE pf.name = 'pf_driver_locations_day';
+
+                IF @boundary IS NULL OR @boundary >= @purge_before
+                    BREAK;
+                ALTER PARTITION FUNCTION pf_driver_locations_day() MERGE RANGE (@boundary);
+            END
+        END
+
+        -- Keep empty partitions ready ahead of the current day so a split
+        -- never has to move data
+        DECLARE @next DATETIME;
+        SELECT @next = DATEADD(DAY, 1, MAX(CAST(prv.value AS DATETIME)))
+        FROM sys.partition_range_values prv
+        JOIN sys.partition_functions pf ON prv.function_id = pf.function_id
+        WHERE pf.name = 'pf_driver_locations_day';
+
+        WHILE @next <= DATEADD(DAY, @days_ahead, CAST(CAST(@now AS DATE) AS DATETIME))
+        BEGIN
+            ALTER PARTITION SCHEME ps_driver_locations_day NEXT USED [PRIMARY];
+            ALTER PARTITION FUNCTION pf_driver_locations_day() SPLIT RANGE (@next);
+            SET @next = DATEADD(DAY, 1, @next);
+        END
+
+        SELECT
+            @compacted AS rows_compacted,
+            @purged_partitions AS partitions_purged,
+            @purge_before AS purged_before;
+    END TRY
+    BEGIN CATCH
+        DECLARE @ErrorMessage NVARCHAR(4000) = ERROR_MESSAGE();
+        DECLARE @ErrorSeverity INT = ERROR_SEVERITY();
+        DECLARE @ErrorState INT = ERROR_STATE();
+
+        RAISERROR(@ErrorMessage, @ErrorSeverity, @ErrorState);
+    END CATCH
+END
+GO
@@ -0,0 +1,100 @@
+USE [uber_ride]
+GO
+
+IF EXISTS (SELECT * FROM sys.objects WHERE type = 'P' AND name = 'sp_rate_ride')
+DROP PROCEDURE sp_rate_ride
+GO
+
+-- Records one side's rating of a completed ride and folds it into the rated
+-- user's running mean (driver_stats / rider_stats). Ratings of drivers also
+-- update drivers.average_rating and the rollup of the ride's completion.
+CREATE PROCEDURE sp_rate_ride
+    @ride_id INT,
+    @rated_by VARCHAR(10),   -- 'rider' rates the driver, 'driver' rates the rider
+    @rating TINYINT
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        DECLARE @driver_id INT;
+        DECLARE @rider_id INT;
+        DECLARE @completed_at DATETIME;
+
+        SELECT @driver_id = driver_id, @rider_id = rider_id, @completed_at = completed_at
+        FROM rides
+        WHERE ride_id = @ride_id AND ride_status = 'completed';
+
+        IF @completed_at IS NULL
+        BEGIN
+            RAISERROR('Ride is not completed', 16, 1);
+        END
+
+        IF EXISTS (
+            SELECT 1 FROM ride_ratings WITH (UPDLOCK, HOLDLOCK)
+            WHERE ride_id = @ride_id AND rated_by = @rated_by
+        )
+        BEGIN
+            RAISERROR('Ride already rated', 16, 1);
+        END
+
+        INSERT INTO ride_ratings (ride_id, rated_by, rating)
+        VALUES (@ride_id, @rated_by, @rating);
+
+        IF @rated_by = 'rider'
+        BEGIN
+            MERGE driver_stats WITH (HOLDLOCK) AS t
+            USING (SELECT @driver_id AS driver_id) AS s
+            ON t.driver_id = s.driver_id
+            WHEN MATCHED THEN UPDATE SET
+                rating_count = t.rating_count + 1,
+                rating_sum = t.rating_sum + @rating,
+                updated_at = GETDATE()
+            WHEN NOT MATCHED THEN INSERT (driver_id, rating_count, rating_sum)
+                VALUES (@driver_id, 1, @rating);
+
+            UPDATE d
+            SET average_rating = CAST(s.rating_sum AS DECIMAL(10,2)) / s.rating_count
+            FROM drivers d
+            JOIN driver_stats s ON s.driver_id = d.driver_id
+            WHERE d.driver_id = @driver_id;
+
+            MERGE ride_stats_rollup WITH (HOLDLOCK) AS t
+            USING (
+                VALUES ('H', DATEADD(HOUR, DATEDIFF(HOUR, 0, @completed_at), 0)),
+                       ('D', CAST(CAST(@completed_at AS DATE) AS DATETIME))
+            ) AS s (granularity, bucket_start)
+            ON t.granularity = s.granularity AND t.bucket_start = s.bucket_start
+            WHEN MATCHED THEN UPDATE SET
+                rating_count = t.rating_count + 1,
+                rating_sum = t.rating_sum + @rating
+            WHEN NOT MATCHED THEN INSERT (granularity, bucket_start, rating_count, rating_sum)
+                VALUES (s.granularity, s.bucket_start, 1, @rating);
+        END
+        ELSE
+        BEGIN
+            MERGE rider_stats WITH (HOLDLOCK) AS t
+            USING (SELECT @rider_id AS rider_id) AS s
+            ON t.rider_id = s.rider_id
+            WHEN MATCHED THEN UPDATE SET
+                rating_count = t.rating_count + 1,
+                rating_sum = t.rating_sum + @rating,
+                updated_at = GETDATE()
+            WHEN NOT MATCHED THEN INSERT (rider_id, rating_count, rating_sum)
+                VALUES (@rider_id, 1, @rating);
+        END
+
+        COMMIT TRANSACTION;
+
+        SELECT @ride_id AS ride_id, @driver_id AS driver_id, @rider_id AS rider_id;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+
+        THROW;
+    END CATCH
+END
+GO
@@ -0,0 +1,113 @@
+USE [uber_ride]
+GO
+
+IF EXISTS (SELECT * FROM sys.objects WHERE type = 'P' AND name = 'sp_record_ride_stats')
+DROP PROCEDURE sp_record_ride_stats
+GO
+
+-- Adds a ride that has just been completed or cancelled to driver_stats,
+-- rider_stats and the hourly/daily rollups. Runs inside the caller's
+-- transaction, right after the status change that guarantees it is applied
+-- once per ride; it opens none of its own.
+CREATE PROCEDURE sp_record_ride_stats
+    @ride_id INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @driver_id INT;
+    DECLARE @rider_id INT;
+    DECLARE @status VARCHAR(20);
+    DECLARE @at DATETIME;
+    DECLARE @trips INT = 0;
+    DECLARE @fare DECIMAL(10,2) = 0;
+    DECLARE @distance DECIMAL(10,2) = 0;
+    DECLARE @duration INT = 0;
+    DECLARE @by_rider INT = 0;
+    DECLARE @by_driver INT = 0;
+
+    SELECT
+        @driver_id = driver_id,
+        @rider_id = rider_id,
+        @status = ride_status,
+        @at = CASE ride_status WHEN 'completed' THEN completed_at ELSE cancelled_at END,
+        @fare = ISNULL(actual_fare, 0),
+        @distance = ISNULL(distance_km, 0),
+        @duration = ISNULL(duration_minutes, 0),
+        @by_rider = CASE WHEN cancelled_by = 'rider' THEN 1 ELSE 0 END,
+        @by_driver = CASE WHEN cancelled_by = 'driver' THEN 1 ELSE 0 END
+    FROM rides
+    WHERE ride_id = @ride_id;
+
+    IF @status = 'completed'
+    BEGIN
+        SELECT @trips = 1, @by_rider = 0, @by_driver = 0;
+    END
+    ELSE IF @status = 'cancelled'
+    BEGIN
+        SELECT @fare = 0, @distance = 0, @duration = 0;
+    END
+    ELSE
+    BEGIN
+        RAISERROR('Ride is not completed or cancelled', 16, 1);
+        RETURN;
+    END
+
+    IF @driver_id IS NOT NULL
+    BEGIN
+        MERGE driver_stats WITH (HOLDLOCK) AS t
+        USING (SELECT @driver_id AS driver_id) AS s
+        ON t.driver_id = s.driver_id
+        WHEN MATCHED THEN UPDATE SET
+            completed_trips = t.completed_trips + @trips,
+            fare_total = t.fare_total + @fare,
+            distance_km = t.distance_km + @distance,
+            duration_minutes = t.duration_minutes + @duration,
+            cancelled_by_rider = t.cancelled_by_rider + @by_rider,
+            cancelled_by_driver = t.cancelled_by_driver + @by_driver,
+            updated_at = GETDATE()
+        WHEN NOT MATCHED THEN INSERT
+            (driver_id, completed_trips, fare_total, distance_km, duration_minutes, cancelled_by_rider, cancelled_by_driver)
+            VALUES (@driver_id, @trips, @fare, @distance, @duration, @by_rider, @by_driver);
+
+        -- drivers.total_trips is what sp_request_ride and the driver lookups report
+        IF @trips > 0
+            UPDATE drivers SET total_trips = total_trips + 1 WHERE driver_id = @driver_id;
+    END
+
+    MERGE rider_stats WITH (HOLDLOCK) AS t
+    USING (SELECT @rider_id AS rider_id) AS s
+    ON t.rider_id = s.rider_id
+    WHEN MATCHED THEN UPDATE SET
+        completed_trips = t.completed_trips + @trips,
+        fare_total = t.fare_total + @fare,
+        distance_km = t.distance_km + @distance,
+        duration_minutes = t.duration_minutes + @duration,
+        cancelled_by_rider = t.cancelled_by_rider + @by_rider,
+        cancelled_by_driver = t.cancelled_by_driver + @by_driver,
+        updated_at = GETDATE()
+    WHEN NOT MATCHED THEN INSERT
+        (rider_id, completed_trips, fare_total, distance_km, duration_minutes, cancelled_by_rider, cancelled_by_driver)
+        VALUES (@rider_id, @trips, @fare, @distance, @duration, @by_rider, @by_driver);
+
+    -- Kept last: the current hour's row is shared by every ride closing in
+    -- it, so its lock should be held for as little of the transaction as possible
+    MERGE ride_stats_rollup WITH (HOLDLOCK) AS t
+    USING (
+        VALUES ('H', DATEADD(HOUR, DATEDIFF(HOUR, 0, @at), 0)),
+               ('D', CAST(CAST(@at AS DATE) AS DATETIME))
+    ) AS s (granularity, bucket_start)
+    ON t.granularity = s.granularity AND t.bucket_start = s.bucket_start
+    WHEN MATCHED THEN UPDATE SET
+        completed_trips = t.completed_trips + @trips,
+        fare_total = t.fare_total + @fare,
+        distance_km = t.distance_km + @distance,
+        duration_minutes = t.duration_minutes + @duration,
+        cancelled_by_rider = t.cancelled_by_rider + @by_rider,
+        cancelled_by_driver = t.cancelled_by_driver + @by_driver
+    WHEN NOT MATCHED THEN INSERT
+        (granularity, bucket_start, completed_trips, fare_total, distance_km, duration_minutes,
+         cancelled_by_rider, cancelled_by_driver)
+        VALUES (s.granularity, s.bucket_start, @trips, @fare, @distance, @duration, @by_rider, @by_driver);
+END
+GO
@@ -13,7 +13,11 @@ CREATE PROCEDURE sp_request_ride
     @dropoff_lng FLOAT,
     @pickup_address NVARCHAR(MAX),
     @dropoff_address NVARCHAR(MAX),
-    @ride_type VARCHAR(20) = 'standard'
+    @ride_type VARCHAR(20) = 'standard',
+    @match_drivers BIT = 1,  -- 0 when the API matches drivers from its in-memory index
+    @surge_multiplier_override DECIMAL(3,2) = NULL,  -- set by the API's surge engine
+    @route_distance_km DECIMAL(5,2) = NULL,  -- road distance from the API's routing engine
+    @route_duration_minutes INT = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
@@ -48,7 +52,7 @@ BEGIN
         );
         
         DECLARE @ride_id INT = SCOPE_IDENTITY();
-        DECLARE @distance_km DECIMAL(5,2) = @pickup_geo.STDistance(@dropoff_geo) / 1000;
+        DECLARE @distance_km DECIMAL(5,2) = COALESCE(@route_distance_km, @pickup_geo.STDistance(@dropoff_geo) / 1000);
         DECLARE @base_fare DECIMAL(10,2);
         DECLARE @per_km_rate DECIMAL(10,2);
         DECLARE @estimated_fare DECIMAL(10,2);
@@ -74,17 +78,22 @@ BEGIN
         SET @estimated_fare = @base_fare + (@distance_km * @per_km_rate);
         
         -- Apply surge pricing if needed
-        DECLARE @active_rides_in_area INT;
-        
-        SELECT @active_rides_in_area = COUNT(*) 
-        FROM rides 
-        WHERE ride_status IN ('requested', 'accepted', 'arrived', 'in_progress')
-        AND pickup_location.STDistance(@pickup_geo) < 5000; -- 5km radius
-        
-        IF @active_rides_in_area > 50
-            SET @surge_multiplier = 1.50;
-        ELSE IF @active_rides_in_area > 30
-            SET @surge_multiplier = 1.25;
+        IF @surge_multiplier_override IS NOT NULL
+            SET @surge_multiplier = @surge_multiplier_override;
+        ELSE
+        BEGIN
+            DECLARE @active_rides_in_area INT;
+            
+            SELECT @active_rides_in_area = COUNT(*) 
+            FROM rides 
+            WHERE ride_status IN ('requested', 'accepted', 'arrived', 'in_progress')
+            AND pickup_location.STDistance(@pickup_geo) < 5000; -- 5km radius
+            
+            IF @active_rides_in_area > 50
+                SET @surge_multiplier = 1.50;
+            ELSE IF @active_rides_in_area > 30
+                SET @surge_multiplier = 1.25;
+        END
             
         SET @estimated_fare = @estimated_fare * @surge_multiplier;
         
@@ -93,6 +102,7 @@ BEGIN
         SET 
             estimated_fare = @estimated_fare,
             distance_km = @distance_km,
+            duration_minutes = @route_duration_minutes,
             surge_multiplier = @surge_multiplier
         WHERE ride_id = @ride_id;
         
@@ -124,6 +134,7 @@ BEGIN
         WHERE ride_id = @ride_id;
         
         -- Find nearby available drivers (within 5km)
+        IF @match_drivers = 1
         SELECT 
             d.driver_id,
             u.first_name + ' ' + u.last_name AS driver_name,
@@ -136,15 +147,7 @@ BEGIN
         FROM drivers d
         JOIN users u ON d.driver_id = u.user_id
         JOIN vehicles v ON d.driver_id = v.driver_id
-        JOIN (
-            SELECT driver_id, location
-            FROM driver_locations dl1
-            WHERE recorded_at = (
-                SELECT MAX(recorded_at) 
-                FROM driver_locations dl2
-                WHERE dl2.driver_id = dl1.driver_id
-            )
-        ) dl ON d.driver_id = dl.driver_id
+        JOIN driver_current_location dl ON d.driver_id = dl.driver_id
         WHERE d.current_status = 'available' 
         AND d.is_verified = 1
         AND dl.location.STDistance(@pickup_geo) < 5000
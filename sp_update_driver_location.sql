@@ -14,8 +14,20 @@ BEGIN
     WHERE driver_id = @driver_id AND current_status = 'offline';
     
     -- Insert location history
-    INSERT INTO driver_locations (driver_id, location)
-    VALUES (@driver_id, geography::Point(@latitude, @longitude, 4326));
+    DECLARE @location GEOGRAPHY = geography::Point(@latitude, @longitude, 4326);
+    DECLARE @recorded_at DATETIME = GETDATE();
+
+    INSERT INTO driver_locations (driver_id, location, recorded_at)
+    VALUES (@driver_id, @location, @recorded_at);
+
+    -- Upsert latest position
+    UPDATE driver_current_location
+    SET location = @location, latitude = @latitude, longitude = @longitude, recorded_at = @recorded_at
+    WHERE driver_id = @driver_id;
+
+    IF @@ROWCOUNT = 0
+        INSERT INTO driver_current_location (driver_id, location, latitude, longitude, recorded_at)
+        VALUES (@driver_id, @location, @latitude, @longitude, @recorded_at);
     
     -- Return driver's updated status
     SELECT current_status FROM drivers WHERE driver_id = @driver_id;
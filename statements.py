@@ -0,0 +1,194 @@
+import threading
+
+import pyodbc
+
+# Parameter types for Cursor.setinputsizes: (sql_type, column_size, decimal_digits).
+# Fixed declarations keep one cached plan per statement; with inferred types
+# every distinct string length declares a different nvarchar(n).
+INT = (pyodbc.SQL_INTEGER, 0, 0)
+BIGINT = (pyodbc.SQL_BIGINT, 0, 0)
+BIT = (pyodbc.SQL_BIT, 0, 0)
+FLOAT = (pyodbc.SQL_FLOAT, 53, 0)
+DATE = (pyodbc.SQL_TYPE_DATE, 10, 0)
+DATETIME = (pyodbc.SQL_TYPE_TIMESTAMP, 23, 3)
+
+
+def nvarchar(size: int = None):
+    # size None = NVARCHAR(MAX)
+    return (pyodbc.SQL_WVARCHAR, size or 0, 0)
+
+
+def varchar(size: int = None):
+    return (pyodbc.SQL_VARCHAR, size or 0, 0)
+
+
+def decimal(precision: int, scale: int):
+    return (pyodbc.SQL_DECIMAL, precision, scale)
+
+
+class Statement:
+    __slots__ = ("name", "sql", "sizes")
+
+    def __init__(self, name: str, sql: str, sizes):
+        self.name = name
+        self.sql = sql
+        self.sizes = list(sizes)
+
+
+class StatementRegistry:
+    # Every prepared statement the API runs, with client-side counts: a
+    # "prepare" is the first execution on a connection's cached cursor (ODBC
+    # SQLPrepare), every later one reuses that handle and its server plan.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}   # name -> Statement
+        self._counts = {}       # name -> [executions, prepares, errors]
+
+    def procedure(self, name: str, *params) -> Statement:
+        # ODBC {CALL} escape: sent as an RPC, not a text batch to parse.
+        # params: types of the procedure's parameters in declaration order;
+        # trailing parameters left out take their defaults.
+        placeholders = ", ".join("?" for _ in params)
+        return self._register(Statement(name, f"{{CALL {name} ({placeholders})}}", params))
+
+    def query(self, name: str, sql: str, *params) -> Statement:
+        return self._register(Statement(name, sql, params))
+
+    def _register(self, statement: Statement) -> Statement:
+        with self._lock:
+            if statement.name in self._statements:
+                raise ValueError(f"Statement {statement.name} is already registered")
+            self._statements[statement.name] = statement
+            self._counts[statement.name] = [0, 0, 0]
+        return statement
+
+    def record(self, statement: Statement, prepared: bool, failed: bool):
+        with self._lock:
+            counts = self._counts[statement.name]
+            counts[0] += 1
+            counts[1] += prepared
+            counts[2] += failed
+
+    def names(self):
+        return list(self._statements)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {name: list(c) for name, c in self._counts.items()}
+        executions = sum(c[0] for c in counts.values())
+        prepares = sum(c[1] for c in counts.values())
+        return {
+            "executions": executions,
+            "prepares": prepares,
+            "reuse_ratio": round(1 - prepares / executions, 4) if executions else 0.0,
+            "statements": {
+                name: {
+                    "executions": c[0],
+                    "prepares": c[1],
+                    "errors": c[2],
+                    "reuse_ratio": round(1 - c[1] / c[0], 4) if c[0] else 0.0,
+                }
+                for name, c in counts.items()
+            },
+        }
+
+
+registry = StatementRegistry()
+procedure = registry.procedure
+query = registry.query
+
+
+class PreparedConnection:
+    # Pooled connection proxy keeping one cursor per statement. pyodbc only
+    # re-prepares when a cursor's SQL text changes, so a cursor that always
+    # runs the same statement stays prepared for the connection's lifetime.
+    # Without MARS only one statement may have pending results, so the cursor
+    # used last is drained before any other cursor runs.
+    __slots__ = ("_conn", "_registry", "_cursors", "_active")
+
+    def __init__(self, conn, registry: StatementRegistry = registry):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_cursors", {})    # statement name -> PreparedCursor
+        object.__setattr__(self, "_active", None)
+
+    def prepare(self, statement: Statement) -> "PreparedCursor":
+        cursor = self._cursors.get(statement.name)
+        if cursor is None:
+            cursor = self._cursors[statement.name] = PreparedCursor(self, statement)
+        return cursor
+
+    def cursor(self):
+        self._settle()
+        return self._conn.cursor()
+
+    def close(self):
+        for cursor in self._cursors.values():
+            cursor._discard()
+        self._cursors.clear()
+        self._conn.close()
+
+    def _settle(self, next_cursor=None):
+        active = self._active
+        if active is not None and active is not next_cursor:
+            active._drain()
+        object.__setattr__(self, "_active", next_cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+class PreparedCursor:
+    # One statement's cursor on one connection. execute() takes only the
+    # parameters; close() ends the result sets but keeps the prepared handle.
+    __slots__ = ("statement", "_owner", "_cursor")
+
+    def __init__(self, owner: PreparedConnection, statement: Statement):
+        self.statement = statement
+        self._owner = owner
+        self._cursor = None
+
+    def execute(self, *params):
+        owner = self._owner
+        owner._settle(self)
+        prepared = self._cursor is None
+        if prepared:
+            self._cursor = owner._conn.cursor()
+        failed = True
+        try:
+            if self.statement.sizes:
+                self._cursor.setinputsizes(self.statement.sizes)
+            self._cursor.execute(self.statement.sql, *params)
+            failed = False
+        finally:
+            owner._registry.record(self.statement, prepared, failed)
+        return self
+
+    def close(self):
+        if self._owner._active is self:
+            self._owner._settle()
+
+    def _drain(self):
+        # Skip unread rows and result sets; pyodbc closes the ODBC cursor
+        # (SQL_CLOSE) once there are none left, keeping the statement prepared
+        if self._cursor is None:
+            return
+        try:
+            while self._cursor.nextset():
+                pass
+        except pyodbc.Error:
+            self._discard()
+
+    def _discard(self):
+        cursor, self._cursor = self._cursor, None
+        if cursor is not None:
+            try:
+                cursor.close()
+            except pyodbc.Error:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
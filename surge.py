@@ -0,0 +1,106 @@
+import math
+import threading
+
+from geo_index import KM_PER_DEGREE
+
+# (active rides in radius greater than, multiplier), highest first; same tiers
+# sp_request_ride used when it counted rides with STDistance
+DEFAULT_TIERS = ((50, 1.50), (30, 1.25))
+
+
+class SurgeEngine:
+    # Active-ride counts per grid cell, updated as rides open and close, so the
+    # multiplier for a point is a sum over the cells in its radius, not a scan.
+    def __init__(self, cell_km: float = 1.0, radius_km: float = 5.0, tiers=DEFAULT_TIERS, supply_fn=None):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self.cell_km = cell_km
+        self.radius_km = radius_km
+        self.tiers = tuple(sorted(tiers, reverse=True))
+        self.supply_fn = supply_fn     # (lat, lng, radius_km) -> available drivers
+        self._lock = threading.Lock()
+        self._demand = {}              # cell -> active rides
+        self._rides = {}               # ride_id -> cell
+        self._offsets = {}             # cell_lat -> [(dlat, dlng)] within radius
+
+    def cell_of(self, lat: float, lng: float):
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def ride_opened(self, ride_id: int, lat: float, lng: float):
+        cell = self.cell_of(lat, lng)
+        with self._lock:
+            if ride_id in self._rides:
+                return
+            self._rides[ride_id] = cell
+            self._demand[cell] = self._demand.get(cell, 0) + 1
+
+    def ride_closed(self, ride_id: int):
+        with self._lock:
+            cell = self._rides.pop(ride_id, None)
+            if cell is None:
+                return
+            remaining = self._demand[cell] - 1
+            if remaining:
+                self._demand[cell] = remaining
+            else:
+                del self._demand[cell]
+
+    def demand(self, lat: float, lng: float) -> int:
+        cell_lat, cell_lng = self.cell_of(lat, lng)
+        offsets = self._offsets_for(cell_lat)
+        with self._lock:
+            demand = self._demand
+            return sum(demand.get((cell_lat + dlat, cell_lng + dlng), 0) for dlat, dlng in offsets)
+
+    def multiplier_for(self, active_rides: int) -> float:
+        for threshold, multiplier in self.tiers:
+            if active_rides > threshold:
+                return multiplier
+        return 1.0
+
+    def multiplier(self, lat: float, lng: float, pending: int = 0) -> float:
+        # pending: rides about to be opened here (sp_request_ride counted the new ride too)
+        return self.multiplier_for(self.demand(lat, lng) + pending)
+
+    def zone(self, lat: float, lng: float) -> dict:
+        demand = self.demand(lat, lng)
+        supply = self.supply_fn(lat, lng, self.radius_km) if self.supply_fn else None
+        return {
+            "cell": list(self.cell_of(lat, lng)),
+            "radius_km": self.radius_km,
+            "active_rides": demand,
+            "available_drivers": supply,
+            "surge_multiplier": self.multiplier_for(demand),
+        }
+
+    def hot_zones(self, limit: int = 50) -> list:
+        # Cells with any demand, ranked by the demand in their surge radius
+        with self._lock:
+            cells = list(self._demand)
+        zones = []
+        for cell_lat, cell_lng in cells:
+            lat = (cell_lat + 0.5) * self.cell_deg
+            lng = (cell_lng + 0.5) * self.cell_deg
+            zones.append({"latitude": round(lat, 5), "longitude": round(lng, 5), **self.zone(lat, lng)})
+        zones.sort(key=lambda z: z["active_rides"], reverse=True)
+        return zones[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"active_rides": len(self._rides), "cells": len(self._demand)}
+
+    def _offsets_for(self, cell_lat: int):
+        offsets = self._offsets.get(cell_lat)
+        if offsets is not None:
+            return offsets
+        lat = (cell_lat + 0.5) * self.cell_deg
+        lng_km = self.cell_km * max(math.cos(math.radians(lat)), 0.01)
+        reach_lat = int(math.ceil(self.radius_km / self.cell_km))
+        reach_lng = int(math.ceil(self.radius_km / lng_km))
+        offsets = [
+            (dlat, dlng)
+            for dlat in range(-reach_lat, reach_lat + 1)
+            for dlng in range(-reach_lng, reach_lng + 1)
+            if math.hypot(dlat * self.cell_km, dlng * lng_km) <= self.radius_km
+        ]
+        self._offsets[cell_lat] = offsets
+        return offsets
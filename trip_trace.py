@@ -0,0 +1,144 @@
+import threading
+import time
+
+from geo_index import haversine_km
+
+# Binary trace format, version 1:
+#   byte 0        format version
+#   per point     zigzag varint  delta latitude  (1e-5 degrees, ~1.1 m)
+#                 zigzag varint  delta longitude (1e-5 degrees)
+#                 varint         delta time      (seconds; the first point is unix time)
+# Points are appended as pings arrive, so the stored bytes are served as-is.
+TRACE_FORMAT = "delta-varint-v1"
+TRACE_VERSION = 1
+PRECISION = 100000
+
+
+def _put_varint(buf: bytearray, n: int):
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+def decode_trace(data: bytes) -> list:
+    # -> [(lat, lng, unix_seconds)]
+    if not data:
+        return []
+    if data[0] != TRACE_VERSION:
+        raise ValueError(f"Unsupported trace version {data[0]}")
+    values = []
+    n = shift = 0
+    for byte in data[1:]:
+        n |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(n)
+        n = shift = 0
+
+    points = []
+    lat = lng = t = 0
+    for i in range(0, len(values) - 2, 3):
+        lat += _unzigzag(values[i])
+        lng += _unzigzag(values[i + 1])
+        t += values[i + 2]
+        points.append((lat / PRECISION, lng / PRECISION, t))
+    return points
+
+
+def encode_trace(points) -> bytes:
+    trace = _Trace(max_points=None)
+    for lat, lng, t in points:
+        trace.append(lat, lng, t)
+    return bytes(trace.buf)
+
+
+class _Trace:
+    __slots__ = ("buf", "points", "lat", "lng", "t", "first_t", "distance_km", "max_points")
+
+    def __init__(self, max_points):
+        self.buf = bytearray([TRACE_VERSION])
+        self.points = 0
+        self.lat = self.lng = self.t = 0
+        self.first_t = None
+        self.distance_km = 0.0
+        self.max_points = max_points
+
+    def append(self, lat: float, lng: float, t: int) -> bool:
+        lat_q, lng_q = round(lat * PRECISION), round(lng * PRECISION)
+        if self.points:
+            if lat_q == self.lat and lng_q == self.lng:
+                return False        # stationary ping
+            if t < self.t or (self.max_points and self.points >= self.max_points):
+                return False
+            # Distance from the quantized points, so a replay of the stored
+            # trace reproduces it exactly
+            self.distance_km += haversine_km(self.lat / PRECISION, self.lng / PRECISION,
+                                             lat_q / PRECISION, lng_q / PRECISION)
+        else:
+            self.first_t = t
+        _put_varint(self.buf, _zigzag(lat_q - self.lat))
+        _put_varint(self.buf, _zigzag(lng_q - self.lng))
+        _put_varint(self.buf, t - self.t)
+        self.lat, self.lng, self.t = lat_q, lng_q, t
+        self.points += 1
+        return True
+
+    @property
+    def duration_seconds(self) -> int:
+        return self.t - self.first_t if self.points else 0
+
+
+class TraceRecorder:
+    # Per-ride traces of the assigned driver's pings between accept and
+    # complete, kept encoded in memory until the ride is completed.
+    def __init__(self, max_points: int = 20000):
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self._traces = {}       # ride_id -> _Trace
+        self.recorded = 0
+        self.skipped = 0
+
+    def start(self, ride_id: int):
+        with self._lock:
+            self._traces.setdefault(ride_id, _Trace(self.max_points))
+
+    def record(self, ride_id: int, lat: float, lng: float, t: int = None):
+        with self._lock:
+            trace = self._traces.get(ride_id)
+            if trace is None:
+                return
+            if trace.append(lat, lng, int(t if t is not None else time.time())):
+                self.recorded += 1
+            else:
+                self.skipped += 1
+
+    def snapshot(self, ride_id: int):
+        # -> (encoded bytes, points, distance_km, duration_seconds) or None
+        with self._lock:
+            trace = self._traces.get(ride_id)
+            if trace is None:
+                return None
+            return bytes(trace.buf), trace.points, trace.distance_km, trace.duration_seconds
+
+    def discard(self, ride_id: int):
+        with self._lock:
+            self._traces.pop(ride_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active_traces": len(self._traces),
+                "buffered_bytes": sum(len(t.buf) for t in self._traces.values()),
+                "points_recorded": self.recorded,
+                "points_skipped": self.skipped,
+            }